@@ -0,0 +1,424 @@
+"""
+benchmark suite for the per-tweet processing hot path.
+
+usage: python benchmarks/bench_hotpath.py [--full] [--only NAME ...]
+                                          [--repeat 5] [--no-memory]
+                                          [--update-baseline]
+                                          [--tolerance 0.3]
+
+measures tweets (or picks) per second and peak traced memory of
+strip_status, process_content, trans_time_obj_str, write_tweet_to_csv,
+response decoding,
+search (with a fake http session), selectKey/selectClient and the
+ResultBuffer accumulation of run(), and compares them with
+benchmarks/baseline_hotpath.json. exits with 1 if something regressed
+by more than the tolerance.
+
+the baseline stores throughput relative to a fixed pure-python
+calibration loop measured right before each run (the median of
+--repeat runs, not absolute per second numbers), so it does not depend
+on the speed of the machine. a benchmark regresses when its best ratio
+falls below the baseline by more than the tolerance.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd  # noqa: E402
+
+import bench_selectkey  # noqa: E402
+import jsondecoder  # noqa: E402
+import keyscheduler  # noqa: E402
+import mockserver  # noqa: E402
+import sinks  # noqa: E402
+import twitterapi  # noqa: E402
+import twittercrawler  # noqa: E402
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__),
+                             "baseline_hotpath.json")
+TWEET_SIZES = [100, 10000, 100000]
+FULL_TWEET_SIZES = [100, 10000, 100000, 1000000]
+KEY_SIZES = [10, 1000, 100000]
+# 1ページあたりのツイート数（キーワード検索の上限）
+PAGE_SIZE = 100
+# 合成ツイートはこの数だけ作り，使い回す（100万件をそのまま作るとメモリが足りない）
+POOL_SIZE = 20000
+NUM_ACCOUNTS = 16
+# 速度の基準にするループの反復数
+CALIBRATION_LOOPS = 200000
+
+
+def make_pool(pool_size=POOL_SIZE, num_keys=20, seed_time=1500000000):
+    """mockserverの合成ツイート列から，PAGE_SIZE件ずつのページのlistを作る."""
+    per_key = pool_size // num_keys
+    statuses = []
+    for k in range(num_keys):
+        stream = mockserver.TweetStream("key%s" % k, 0.5, seed_time)
+        statuses += [stream.status(i) for i in range(per_key - 1, -1, -1)]
+    return [statuses[i:i + PAGE_SIZE]
+            for i in range(0, len(statuses), PAGE_SIZE)]
+
+
+def iter_pages(pages, num_tweets):
+    """ページを使い回しつつ，合計num_tweets件になるまで返す."""
+    done = 0
+    while done < num_tweets:
+        for page in pages:
+            if done >= num_tweets:
+                return
+            page = page[:num_tweets - done]
+            done += len(page)
+            yield page
+
+
+class FakeResponse:
+    """requestsのレスポンスの代わり."""
+
+    def __init__(self, content, remaining):
+        """クラスコンストラクタ."""
+        self.status_code = 200
+        self.content = content
+        self.text = content.decode("utf-8")
+        self.headers = {"x-rate-limit-remaining": str(remaining),
+                        "x-rate-limit-reset": str(int(time.time()) + 900)}
+
+
+class FakeSession:
+    """OAuth1Sessionの代わり．エンコード済みのページを順に返す."""
+
+    def __init__(self, bodies):
+        """クラスコンストラクタ."""
+        self.bodies = bodies
+        self.calls = 0
+
+    def get(self, url, params=None, **kwargs):
+        """次のページを返す．残機は減らない."""
+        body = self.bodies[self.calls % len(self.bodies)]
+        self.calls += 1
+        return FakeResponse(body, 180)
+
+
+def make_api(saving_dir, session=None, sink=None):
+    """APIを叩かずに作ったTwitterAPI."""
+    t_api = twitterapi.TwitterAPI("bench", session, word="key0",
+                                  saving_dir=saving_dir, sink=sink,
+                                  bootstrap=False)
+    t_api.clientStatus["word"]["remaining_count"] = 180
+    t_api.clientStatus["word"]["reset_time"] = int(time.time()) + 900
+    return t_api
+
+
+def bench_strip_status(pages, num_tweets, workdir):
+    """strip_statusだけ."""
+    t_api = make_api(workdir)
+    twitterapi.parse_tw_time.cache_clear()
+    start = time.perf_counter()
+    for page in iter_pages(pages, num_tweets):
+        for status in page:
+            t_api.strip_status(status)
+    return num_tweets, time.perf_counter() - start
+
+
+def bench_process_content(pages, num_tweets, workdir):
+    """process_content(ページ単位)."""
+    t_api = make_api(workdir)
+    twitterapi.parse_tw_time.cache_clear()
+    start = time.perf_counter()
+    for page in iter_pages(pages, num_tweets):
+        t_api.process_content({"statuses": page}, "key0")
+    return num_tweets, time.perf_counter() - start
+
+
+def bench_trans_time(pages, num_tweets, workdir):
+    """created_atとidそれぞれからの時刻変換."""
+    t_api = make_api(workdir)
+    twitterapi.parse_tw_time.cache_clear()
+    start = time.perf_counter()
+    for page in iter_pages(pages, num_tweets):
+        for status in page:
+            t_api.trans_time_obj_str(status["created_at"], "tw_time", "mysql")
+            t_api.trans_time_obj_str(status["id"], "tw_id", "mysql")
+    return num_tweets, time.perf_counter() - start
+
+
+def bench_write_csv(pages, num_tweets, workdir):
+    """write_tweet_to_csvとsinkの書き込み（加工は計らない）."""
+    saving_dir = tempfile.mkdtemp(dir=workdir) + "/"
+    sink = sinks.CsvSink()
+    t_api = make_api(saving_dir, sink=sink)
+    elapsed = 0.0
+    for page in iter_pages(pages, num_tweets):
+        all_tweets = t_api.process_content({"statuses": page}, "key0")[1]
+        start = time.perf_counter()
+        t_api.write_tweet_to_csv(all_tweets, "key0")
+        elapsed += time.perf_counter() - start
+    start = time.perf_counter()
+    sink.close()
+    elapsed += time.perf_counter() - start
+    shutil.rmtree(saving_dir)
+    return num_tweets, elapsed
+
+
+def bench_decode(pages, num_tweets, workdir):
+    """レスポンスのbytesのデコード(使える中で一番速いバックエンド)."""
+    bodies = [json.dumps({"statuses": page}).encode("utf-8")
+              for page in pages]
+    decoder = jsondecoder.JsonDecoder()
+    num_requests = (num_tweets + PAGE_SIZE - 1) // PAGE_SIZE
+    start = time.perf_counter()
+    for i in range(num_requests):
+        decoder.loads(bodies[i % len(bodies)])
+    return num_requests * PAGE_SIZE, time.perf_counter() - start
+
+
+def bench_search(pages, num_tweets, workdir):
+    """偽のセッションを使ったsearch("paging")全体．デコードから出力まで."""
+    bodies = [json.dumps({"statuses": page}).encode("utf-8")
+              for page in pages]
+    saving_dir = tempfile.mkdtemp(dir=workdir) + "/"
+    sink = sinks.CsvSink()
+    t_api = make_api(saving_dir, FakeSession(bodies), sink)
+    t_api.recent_min = 10 ** 19
+    t_api.since_tw_id = None
+    num_requests = (num_tweets + PAGE_SIZE - 1) // PAGE_SIZE
+    done = 0
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        start = time.perf_counter()
+        for _ in range(num_requests):
+            done += len(t_api.search("paging", verbose=False))
+        sink.close()
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    shutil.rmtree(saving_dir)
+    return done, elapsed
+
+
+def bench_accumulate(pages, num_tweets, workdir):
+    """run()と同じく，1回ごとのデータフレームをResultBufferに貯めて最後に結合する."""
+    t_api = make_api(workdir)
+    chunks = [t_api.process_content({"statuses": page}, "key0")[1]
+              for page in pages]
+    result_buffer = sinks.ResultBuffer()
+    start = time.perf_counter()
+    done = 0
+    while done < num_tweets:
+        for all_tweets in chunks:
+            if done >= num_tweets:
+                break
+            if len(all_tweets) > num_tweets - done:
+                all_tweets = all_tweets.take(range(num_tweets - done))
+            done += len(all_tweets)
+            result_buffer.append(pd.DataFrame(all_tweets.columns))
+    result_buffer.drain()
+    return num_tweets, time.perf_counter() - start
+
+
+def make_crawler(num_keys, workdir):
+    """APIを叩かずに，selectKey/selectClientに必要な属性だけ持つTwitterCrawlerを作る."""
+    crawler = twittercrawler.TwitterCrawler.__new__(
+        twittercrawler.TwitterCrawler)
+    crawler.search_type = "word"
+    crawler.account_lock = threading.Lock()
+    crawler.keystatus_lock = threading.RLock()
+    crawler.keys, crawler.keystatuses = \
+        bench_selectkey.make_keystatuses(num_keys)
+    crawler.keyscheduler = keyscheduler.KeyScheduler(crawler.keys,
+                                                     crawler.keystatuses)
+    crawler.accounts = []
+    crawler.twitterapis = {}
+    for i in range(NUM_ACCOUNTS):
+        account = "acc%s" % i
+        t_api = make_api(workdir)
+        t_api.clientStatus["word"]["remaining_count"] = 1 + i
+        crawler.accounts.append(account)
+        crawler.twitterapis[account] = t_api
+    return crawler
+
+
+def bench_select_key(num_keys, workdir, num_picks=2000):
+    """selectKeyで選び，検索したことにしてkeyを戻す."""
+    crawler = make_crawler(num_keys, workdir)
+    start = time.perf_counter()
+    for t in range(num_picks):
+        key, mode = crawler.selectKey()
+        bench_selectkey.finish(crawler.keystatuses, key, t)
+        crawler.keyscheduler.push(key)
+    return num_picks, time.perf_counter() - start
+
+
+def bench_select_client(num_keys, workdir, num_picks=20000):
+    """selectClient(NUM_ACCOUNTS個のアカウントから選ぶ)."""
+    crawler = make_crawler(num_keys, workdir)
+    start = time.perf_counter()
+    for _ in range(num_picks):
+        crawler.selectClient()
+    return num_picks, time.perf_counter() - start
+
+
+def calibrate(loops=CALIBRATION_LOOPS):
+    """
+    速度の基準になる，dictとlistと文字列の操作だけのループ.
+
+    (反復数, 所要時間)を返す．各ベンチマークの速度はこれとの比で記録する.
+    """
+    table = {}
+    items = []
+    start = time.perf_counter()
+    for i in range(loops):
+        table[i & 1023] = str(i)
+        items.append(table[i & 1023] + "x")
+        if len(items) > 1000:
+            items = []
+    return loops, time.perf_counter() - start
+
+
+TWEET_BENCHES = [("strip_status", bench_strip_status),
+                 ("process_content", bench_process_content),
+                 ("trans_time_obj_str", bench_trans_time),
+                 ("write_tweet_to_csv", bench_write_csv),
+                 ("decode", bench_decode),
+                 ("search", bench_search),
+                 ("run_accumulate", bench_accumulate)]
+KEY_BENCHES = [("selectKey", bench_select_key),
+               ("selectClient", bench_select_client)]
+
+
+def per_sec(func, args):
+    """funcを1回実行し，1秒あたりの処理数を返す."""
+    gc.collect()
+    num, elapsed = func(*args)
+    return num / max(elapsed, 1e-9)
+
+
+def measure(func, args, repeat, memory):
+    """
+    funcを実行し，(1秒あたりの処理数, 基準のループとの速度比, 最大メモリ(KiB))を返す.
+
+    毎回その直前に基準のループを測って比をとり，マシンや負荷による速度の違いを打ち消す．
+    処理数はrepeat回の中央値，速度比は(最も良い値, 中央値)の組.
+    メモリはtracemallocを有効にした別の1回で測る.
+    """
+    speeds = []
+    ratios = []
+    for _ in range(repeat):
+        calib_per_sec = per_sec(calibrate, ())
+        speeds.append(per_sec(func, args))
+        ratios.append(speeds[-1] / calib_per_sec)
+    peak_kb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        func(*args)
+        peak_kb = tracemalloc.get_traced_memory()[1] / 1024.0
+        tracemalloc.stop()
+    return (statistics.median(speeds),
+            (max(ratios), statistics.median(ratios)), peak_kb)
+
+
+def compare(results, baseline, tolerance):
+    """ベースラインと比べ，許容範囲を超えて悪化した項目名のlistを返す."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        # 今回の最も良い速度比が，ベースライン（中央値）を許容範囲を超えて下回ったら悪化
+        if (base.get("relative") is not None) and \
+           (result["relative"][0] < base["relative"] * (1 - tolerance)):
+            regressions.append("%s: %.4g x calibration (baseline %.4g x)"
+                               % (name, result["relative"][0],
+                                  base["relative"]))
+        if (result["peak_kb"] is not None) and \
+           (base.get("peak_kb") is not None) and \
+           (result["peak_kb"] > base["peak_kb"] * (1 + tolerance) + 64):
+            regressions.append("%s: %.0f KiB (baseline %.0f KiB)"
+                               % (name, result["peak_kb"], base["peak_kb"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--full", action="store_true",
+                        help="also run with 1M tweets")
+    parser.add_argument("--only", nargs="*", default=None,
+                        help="names of benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the tracemalloc pass")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    args = parser.parse_args()
+
+    tweet_sizes = FULL_TWEET_SIZES if args.full else TWEET_SIZES
+    print("json backend: %s" % jsondecoder.available_backends()[0])
+    workdir = tempfile.mkdtemp(prefix="bench_hotpath_")
+    pages = make_pool()
+    results = {}
+    try:
+        runs = ([(name, func, size, (pages, size, workdir))
+                 for name, func in TWEET_BENCHES for size in tweet_sizes] +
+                [(name, func, size, (size, workdir))
+                 for name, func in KEY_BENCHES for size in KEY_SIZES])
+        for name, func, size, func_args in runs:
+            if (args.only is not None) and (name not in args.only):
+                continue
+            speed, relative, peak_kb = measure(func, func_args,
+                                               args.repeat,
+                                               not args.no_memory)
+            label = "%s[%s]" % (name, size)
+            results[label] = {"relative": relative, "peak_kb": peak_kb}
+            print("%-32s %12.0f /s %10.4g x %12s KiB"
+                  % (label, speed, relative[1],
+                     "-" if peak_kb is None else "%.0f" % peak_kb))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        for label, result in results.items():
+            result["relative"] = round(result["relative"][1], 4)
+            if result["peak_kb"] is None:
+                result["peak_kb"] = baseline.get(label, {}).get("peak_kb")
+        baseline.update(results)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print("baseline updated: %s" % BASELINE_FILE)
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nregressions (tolerance %.0f%%):" % (args.tolerance * 100))
+        for line in regressions:
+            print("  " + line)
+        return 1
+    print("\nno regressions against %s" % BASELINE_FILE)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
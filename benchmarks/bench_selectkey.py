@@ -0,0 +1,124 @@
+"""
+micro-benchmark: linear scan selectKey vs. KeyScheduler.
+
+usage: python benchmarks/bench_selectkey.py [num_keys] [num_picks]
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import keyscheduler  # noqa: E402
+
+
+def make_keystatuses(num_keys, seed=0):
+    """paging中・update待ち・未検索のkeyが混ざったkeystatusesを作る."""
+    rng = random.Random(seed)
+    keys = ["key%s" % i for i in range(num_keys)]
+    keystatuses = {}
+    for k in keys:
+        since = rng.randint(10 ** 17, 10 ** 18)
+        r = rng.random()
+        if r < 0.001:
+            recent_min = None
+            since = None
+            last = None
+        elif r < 0.1:
+            recent_min = since + rng.randint(1, 10 ** 12)
+            last = rng.randint(0, 10 ** 6)
+        else:
+            recent_min = since
+            last = rng.randint(0, 10 ** 6)
+        keystatuses[k] = {"max_tw_id": since, "max_tw_time": None,
+                          "min_tw_id": None, "min_tw_time": None,
+                          "recent_min": recent_min, "since_tw_id": since,
+                          "last_updated_time": last, "total_crawled_num": 0}
+    return keys, keystatuses
+
+
+def scan_select(keys, keystatuses):
+    """以前のselectKeyと同じ，全keyを走査する選び方."""
+    recent_mins = []
+    since_tw_ids = []
+    diff_tw_ids = []
+    last_updated_times = []
+    none_idx = None
+    for i, k in enumerate(keys):
+        recent_min = keystatuses[k]["recent_min"]
+        since_tw_id = keystatuses[k]["since_tw_id"]
+        last_update_time = keystatuses[k]["last_updated_time"]
+        recent_mins.append(recent_min)
+        since_tw_ids.append(since_tw_id)
+        last_updated_times.append(last_update_time)
+        if (recent_min is None) or (since_tw_id is None) or \
+                                   (last_update_time is None):
+            if none_idx is None:
+                none_idx = i
+            diff_tw_id = None
+        else:
+            diff_tw_id = recent_min - since_tw_id
+        diff_tw_ids.append(diff_tw_id)
+
+    if (None in recent_mins) or (None in since_tw_ids) or \
+                                (None in last_updated_times):
+        if recent_mins[none_idx] is None:
+            return keys[none_idx], "new"
+        return keys[none_idx], "paging"
+    max_diff = max(diff_tw_ids)
+    if max_diff > 0:
+        return keys[diff_tw_ids.index(max_diff)], "paging"
+    idx = last_updated_times.index(min(last_updated_times))
+    return keys[idx], "update"
+
+
+def finish(keystatuses, key, t):
+    """検索したことにして，pagingを終わらせ更新時刻を進める."""
+    status = keystatuses[key]
+    if status["since_tw_id"] is None:
+        status["since_tw_id"] = 10 ** 17
+    status["recent_min"] = status["since_tw_id"]
+    status["last_updated_time"] = 10 ** 6 + t
+
+
+def bench(num_keys, num_picks):
+    """両方の選び方で同じkeyの列が選ばれることを確かめつつ時間を測る."""
+    keys, keystatuses = make_keystatuses(num_keys)
+    picked_scan = []
+    start = time.perf_counter()
+    for t in range(num_picks):
+        key, mode = scan_select(keys, keystatuses)
+        picked_scan.append((key, mode))
+        finish(keystatuses, key, t)
+    scan_sec = time.perf_counter() - start
+
+    keys, keystatuses = make_keystatuses(num_keys)
+    picked_heap = []
+    start = time.perf_counter()
+    scheduler = keyscheduler.KeyScheduler(keys, keystatuses)
+    build_sec = time.perf_counter() - start
+    for t in range(num_picks):
+        key, mode = scheduler.pop()
+        picked_heap.append((key, mode))
+        finish(keystatuses, key, t)
+        scheduler.push(key)
+    heap_sec = time.perf_counter() - start - build_sec
+
+    assert picked_scan == picked_heap, "selection order differs"
+    print("keys: %s, picks: %s" % (num_keys, num_picks))
+    print("  linear scan  : %8.1f us/pick" % (scan_sec / num_picks * 1e6))
+    print("  KeyScheduler : %8.1f us/pick (build %.2f s)"
+          % (heap_sec / num_picks * 1e6, build_sec))
+
+
+if __name__ == "__main__":
+    num_keys = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    num_picks = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    bench(num_keys, num_picks)
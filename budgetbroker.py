@@ -0,0 +1,338 @@
+"""
+local daemon that owns the api budgets shared by several crawler processes.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+
+Usage:
+    python budgetbroker.py --socket /tmp/twittercrawler-budget.sock
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+
+DEFAULT_SOCKET = "/tmp/twittercrawler-budget.sock"
+# 報告のないリースを（プロセスが落ちたとみなして）捨てるまでの秒数
+LEASE_TIMEOUT = 60
+
+
+class BudgetBroker:
+    """
+    アカウント・エンドポイントごとのAPI残機とリセット時刻を持ち，1回分ずつ貸し出す.
+
+    同じアカウントを使う複数のクローラのプロセスは，APIを叩く前にlease()で1回分を借り，
+    レスポンスヘッダの残機をreport()で返す（ヘッダがなければrelease()）.
+    貸し出し中の回数も残機から引くため，同時に叩いても合計で回数制限を超えない.
+    残機がわからない間（最初や，リセット時刻の後）は，報告が来るまで1回ずつしか貸さない.
+
+    Attributes:
+        lease_timeout (float): 報告のないリースを捨てるまでの秒数
+        budgets (dict): (アカウント, エンドポイント)ごとの
+                        {"remaining": 残機(不明ならNone), "reset_time": リセット時刻,
+                         "leases": 貸し出し中のリースの期限のlist}
+        lock (threading.Lock): budgetsを守るロック
+    """
+
+    def __init__(self, lease_timeout=LEASE_TIMEOUT):
+        """クラスコンストラクタ."""
+        self.lease_timeout = lease_timeout
+        self.budgets = {}
+        self.lock = threading.Lock()
+
+    def _budget(self, account, endpoint, now):
+        """ロックを取得した状態で，期限切れのリースを捨てたbudgetを返す."""
+        budget = self.budgets.get((account, endpoint))
+        if budget is None:
+            budget = {"remaining": None, "reset_time": 0, "leases": []}
+            self.budgets[(account, endpoint)] = budget
+        budget["leases"] = [t for t in budget["leases"] if t > now]
+        # リセット時刻を過ぎたら，新しい残機は次の報告までわからない
+        if (budget["remaining"] is not None) and \
+           (now >= budget["reset_time"] + 2):
+            budget["remaining"] = None
+        return budget
+
+    def _available(self, budget):
+        """貸し出し中の分を引いた残機（不明ならNone）."""
+        if budget["remaining"] is None:
+            return None
+        return max(budget["remaining"] - len(budget["leases"]), 0)
+
+    def lease(self, account, endpoint):
+        """
+        1回分を借りる.
+
+        Args:
+            account (str): アカウント名
+            endpoint (str): "word"/"user"/"lookup"など
+
+        Return:
+            reply (dict): {"granted": 借りられたか, "remaining": 残機, "reset": リセット時刻,
+                           "retry_at": 借りられなかった場合に次に試す時刻}
+        """
+        now = time.time()
+        with self.lock:
+            budget = self._budget(account, endpoint, now)
+            available = self._available(budget)
+            if available is None:
+                granted = len(budget["leases"]) == 0
+                retry_at = now + 1
+            else:
+                granted = available > 0
+                retry_at = budget["reset_time"] + 2
+            if granted:
+                budget["leases"].append(now + self.lease_timeout)
+            return {"granted": granted,
+                    "remaining": self._available(budget),
+                    "reset": budget["reset_time"],
+                    "retry_at": None if granted else retry_at}
+
+    def report(self, account, endpoint, remaining, reset, leased=True):
+        """
+        レスポンスヘッダ(またはrate_limit API)の残機を報告する.
+
+        報告は前後して届くことがあるため，同じリセット時刻なら小さい方の残機を採る.
+
+        Args:
+            account (str): アカウント名
+            endpoint (str): "word"/"user"/"lookup"など
+            remaining (int): x-rate-limit-remaining
+            reset (int): x-rate-limit-reset
+            leased (bool): lease()で借りた分の報告か否か
+
+        Return:
+            reply (dict): {"remaining": 残機, "reset": リセット時刻}
+        """
+        now = time.time()
+        with self.lock:
+            budget = self._budget(account, endpoint, now)
+            if leased and budget["leases"]:
+                budget["leases"].pop(0)
+            if (reset > budget["reset_time"]) or \
+               (budget["remaining"] is None):
+                budget["remaining"] = remaining
+                budget["reset_time"] = reset
+            elif reset == budget["reset_time"]:
+                budget["remaining"] = min(budget["remaining"], remaining)
+            budget = self._budget(account, endpoint, now)
+            return {"remaining": self._available(budget),
+                    "reset": budget["reset_time"]}
+
+    def release(self, account, endpoint):
+        """
+        残機がわからないまま借りた分を返す（通信エラーなど）.
+
+        Args:
+            account (str): アカウント名
+            endpoint (str): "word"/"user"/"lookup"など
+        """
+        with self.lock:
+            budget = self._budget(account, endpoint, time.time())
+            if budget["leases"]:
+                budget["leases"].pop(0)
+            return {}
+
+    def status(self):
+        """全てのbudgetの"アカウント/エンドポイント"ごとの残機・リセット時刻・貸し出し数."""
+        now = time.time()
+        reply = {}
+        with self.lock:
+            for account, endpoint in list(self.budgets.keys()):
+                budget = self._budget(account, endpoint, now)
+                reply["%s/%s" % (account, endpoint)] = {
+                    "remaining": self._available(budget),
+                    "reset": budget["reset_time"],
+                    "leased": len(budget["leases"])}
+        return reply
+
+    def handle(self, request):
+        """
+        1行のリクエストを処理する.
+
+        Args:
+            request (dict): {"op": "lease"/"report"/"release"/"status", ...}
+
+        Return:
+            reply (dict): 返答
+        """
+        op = request.get("op")
+        if op == "lease":
+            return self.lease(request["account"], request["endpoint"])
+        if op == "report":
+            return self.report(request["account"], request["endpoint"],
+                               int(request["remaining"]),
+                               int(request["reset"]),
+                               request.get("leased", True))
+        if op == "release":
+            return self.release(request["account"], request["endpoint"])
+        if op == "status":
+            return self.status()
+        return {"error": "unknown op: %s" % op}
+
+
+class BrokerHandler(socketserver.StreamRequestHandler):
+    """1接続ごとに，JSONの行を読んでJSONの行を返し続ける."""
+
+    def handle(self):
+        """接続が閉じられるまでリクエストを処理する."""
+        for line in self.rfile:
+            try:
+                reply = self.server.broker.handle(json.loads(line))
+            except (ValueError, KeyError) as e:
+                reply = {"error": str(e)}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+
+def start_broker(socket_path=DEFAULT_SOCKET, lease_timeout=LEASE_TIMEOUT):
+    """
+    ブローカーをバックグラウンドのスレッドで立ち上げる.
+
+    Args:
+        socket_path (str): Unixソケットのパス．残っている古いファイルは消す
+        lease_timeout (float): 報告のないリースを捨てるまでの秒数
+
+    Return:
+        server (socketserver.ThreadingUnixStreamServer): server.brokerがBudgetBroker
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path,
+                                                    BrokerHandler)
+    server.daemon_threads = True
+    server.broker = BudgetBroker(lease_timeout)
+    thread = threading.Thread(target=server.serve_forever,
+                              name="budget-broker", daemon=True)
+    thread.start()
+    return server
+
+
+class BudgetClient:
+    """
+    BudgetBrokerに問い合わせるクライアント．1つの接続を複数スレッドで共有する.
+
+    ブローカーに繋がらない場合は常に貸し出されたものとして扱う
+    （レスポンスヘッダだけで残機を管理する，ブローカーなしの動作になる）.
+
+    Attributes:
+        socket_path (str): Unixソケットのパス
+        timeout (float): 1回の問い合わせのタイムアウト(秒)
+        sock (socket.socket): 接続．繋がっていなければNone
+        reader (io.BufferedReader): 返答を1行ずつ読むためのsockのファイル
+        available (bool): 最後の問い合わせでブローカーに繋がったか否か
+        lock (threading.Lock): 接続を守るロック
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=5):
+        """クラスコンストラクタ."""
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.available = True
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        """ロックを取得した状態で接続する．繋がらなければsockはNoneのまま."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+
+    def _close(self):
+        """ロックを取得した状態で接続を閉じる."""
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+        self.sock = None
+        self.reader = None
+
+    def request(self, **request):
+        """
+        1行のリクエストを送って返答を受け取る．失敗したら1回だけ繋ぎ直す.
+
+        Return:
+            reply (dict): 返答．ブローカーに繋がらない場合はNone
+        """
+        line = json.dumps(request).encode("utf-8") + b"\n"
+        with self.lock:
+            for _ in range(2):
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    self.sock.sendall(line)
+                    reply = self.reader.readline()
+                    if not reply:
+                        raise ConnectionError("broker closed the connection")
+                    if not self.available:
+                        print("budget broker: reconnected")
+                    self.available = True
+                    return json.loads(reply)
+                except (OSError, ValueError):
+                    self._close()
+            if self.available:
+                print("budget broker: unavailable at %s, using response "
+                      "headers only" % self.socket_path)
+            self.available = False
+            return None
+
+    def lease(self, account, endpoint):
+        """
+        1回分を借りる.
+
+        Return:
+            reply (dict): BudgetBroker.lease()の返答．繋がらない場合は{"granted": True}
+        """
+        reply = self.request(op="lease", account=account, endpoint=endpoint)
+        if reply is None:
+            return {"granted": True}
+        return reply
+
+    def report(self, account, endpoint, remaining, reset, leased=True):
+        """
+        残機を報告する.
+
+        Return:
+            reply (dict): BudgetBroker.report()の返答．繋がらない場合はNone
+        """
+        return self.request(op="report", account=account, endpoint=endpoint,
+                            remaining=remaining, reset=reset, leased=leased)
+
+    def release(self, account, endpoint):
+        """借りた分を返す."""
+        self.request(op="release", account=account, endpoint=endpoint)
+
+    def close(self):
+        """接続を閉じる."""
+        with self.lock:
+            self._close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--socket", default=DEFAULT_SOCKET,
+                        help="path of the unix socket")
+    parser.add_argument("--lease-timeout", type=float, default=LEASE_TIMEOUT,
+                        help="seconds before an unreported lease is dropped")
+    args = parser.parse_args()
+
+    server = start_broker(args.socket, args.lease_timeout)
+    print("budget broker on %s" % args.socket)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        os.remove(args.socket)
@@ -0,0 +1,196 @@
+"""
+shares the key space among crawler processes through leases in sqlite.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import contextlib
+import json
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+
+def encode_key(key):
+    """keyをDBに入れる文字列にする（ユーザidのintと文字列を区別するためJSONにする）."""
+    return json.dumps(key, ensure_ascii=False)
+
+
+def decode_key(text):
+    """encode_keyの逆."""
+    return json.loads(text)
+
+
+class LeaseStore:
+    """
+    複数のクローラのプロセスで検索keyを分け合うための，SQLiteのリース置き場.
+
+    各プロセスはkeyをlease_sec秒のリースで借り，借りている間だけ検索する.
+    heartbeat()でリースを延長し，止まったプロセスのリースは期限切れ後に他のプロセスが借り直す.
+    keyごとの検索状況もここに書き戻すため，借り直したプロセスは続きから検索できる.
+
+    複数のマシンで使う場合はdb_fileを共有のファイルシステムに置く
+    （ネットワーク越しではWALが使えないため，既定のジャーナルでロックする）.
+
+    Attributes:
+        db_file (str): SQLiteのファイル
+        lease_sec (float): リースの長さ(秒)
+        owner (str): このプロセスの名前("ホスト名:pid")
+        con (sqlite3.Connection): 接続
+        lock (threading.Lock): 接続を守るロック
+    """
+
+    def __init__(self, db_file, lease_sec=120, owner=None):
+        """クラスコンストラクタ．テーブルがなければ作る."""
+        self.db_file = db_file
+        self.lease_sec = lease_sec
+        if owner is None:
+            owner = "%s:%s" % (socket.gethostname(), os.getpid())
+        self.owner = owner
+        dirname = os.path.dirname(db_file)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.con = sqlite3.connect(db_file, timeout=60, isolation_level=None,
+                                   check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.con.execute("CREATE TABLE IF NOT EXISTS keys ("
+                             "key TEXT PRIMARY KEY, status TEXT, "
+                             "owner TEXT, expires REAL)")
+            self.con.execute("CREATE INDEX IF NOT EXISTS keys_owner "
+                             "ON keys (owner)")
+            self.con.execute("CREATE TABLE IF NOT EXISTS owners ("
+                             "owner TEXT PRIMARY KEY, heartbeat REAL)")
+        self.heartbeat()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        ロックを取得し，BEGIN IMMEDIATEからCOMMITまでを1つの書き込みトランザクションにする.
+
+        途中で例外が起きた場合（"database is locked"など）はROLLBACKしてから投げ直すため，
+        接続がトランザクションの中に取り残されることはない.
+        """
+        with self.lock:
+            self.con.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.con
+                self.con.execute("COMMIT")
+            except BaseException:
+                if self.con.in_transaction:
+                    self.con.execute("ROLLBACK")
+                raise
+
+    def register(self, keys):
+        """
+        検索keyを登録する．既にあるkeyはそのまま.
+
+        Args:
+            keys (list): 検索するキーワード/ユーザのlist
+        """
+        with self.transaction() as con:
+            con.executemany("INSERT OR IGNORE INTO keys (key) VALUES (?)",
+                            [(encode_key(k),) for k in keys])
+
+    def heartbeat(self):
+        """
+        生存を知らせ，借りているリースを延長する.
+
+        Return:
+            owned (set): 今借りているkey（期限切れで他のプロセスに取られたものは含まない）
+        """
+        now = time.time()
+        with self.transaction() as con:
+            con.execute("INSERT OR REPLACE INTO owners "
+                        "(owner, heartbeat) VALUES (?, ?)",
+                        (self.owner, now))
+            con.execute("UPDATE keys SET expires = ? WHERE owner = ?",
+                        (now + self.lease_sec, self.owner))
+            rows = con.execute("SELECT key FROM keys WHERE owner = ?",
+                               (self.owner,)).fetchall()
+        return set(decode_key(row[0]) for row in rows)
+
+    def fair_share(self):
+        """
+        生きているプロセスで等分した場合の，1プロセスあたりのkey数.
+
+        Return:
+            share (int): 借りるべきkeyの数
+        """
+        now = time.time()
+        with self.lock:
+            num_keys = self.con.execute("SELECT COUNT(*) FROM keys") \
+                           .fetchone()[0]
+            num_owners = self.con.execute("SELECT COUNT(*) FROM owners "
+                                          "WHERE heartbeat > ?",
+                                          (now - self.lease_sec,)) \
+                             .fetchone()[0]
+        return int(math.ceil(num_keys / float(max(num_owners, 1))))
+
+    def claim(self, max_keys):
+        """
+        誰も借りていないか，リースが切れたkeyを最大max_keys個借りる.
+
+        Args:
+            max_keys (int): 借りるkeyの数の上限
+
+        Return:
+            claimed (list): (key, 検索状況のdictまたはNone)のlist
+        """
+        if max_keys <= 0:
+            return []
+        now = time.time()
+        with self.transaction() as con:
+            rows = con.execute("SELECT key, status FROM keys "
+                               "WHERE owner IS NULL OR expires < ? "
+                               "ORDER BY rowid LIMIT ?",
+                               (now, max_keys)).fetchall()
+            con.executemany("UPDATE keys SET owner = ?, expires = ? "
+                            "WHERE key = ?",
+                            [(self.owner, now + self.lease_sec, row[0])
+                             for row in rows])
+        return [(decode_key(key), None if status is None
+                 else json.loads(status)) for key, status in rows]
+
+    def release(self, keys):
+        """
+        keyのリースを返す.
+
+        Args:
+            keys (list): 返すkeyのlist
+        """
+        with self.transaction() as con:
+            con.executemany("UPDATE keys SET owner = NULL, expires = NULL "
+                            "WHERE key = ? AND owner = ?",
+                            [(encode_key(k), self.owner) for k in keys])
+
+    def sync(self, statuses):
+        """
+        借りているkeyの検索状況を書き戻す（他のプロセスに取られたkeyは書かない）.
+
+        Args:
+            statuses (list): (key, 検索状況のdict)のlist
+        """
+        if not statuses:
+            return
+        with self.transaction() as con:
+            con.executemany("UPDATE keys SET status = ? "
+                            "WHERE key = ? AND owner = ?",
+                            [(json.dumps(status, ensure_ascii=False),
+                              encode_key(k), self.owner)
+                             for k, status in statuses])
+
+    def close(self):
+        """全てのリースを返し，プロセスの登録を消して接続を閉じる."""
+        with self.transaction() as con:
+            con.execute("UPDATE keys SET owner = NULL, expires = NULL "
+                        "WHERE owner = ?", (self.owner,))
+            con.execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+        with self.lock:
+            self.con.close()
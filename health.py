@@ -0,0 +1,184 @@
+"""
+per-account circuit breaker for failing credentials.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import threading
+import time
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# 連続で何回失敗したら遮断するか．認証エラーはすぐには直らないので少なめ
+# network: 通信エラー・タイムアウト（アカウントのホストに届かない場合など）
+TRIP_THRESHOLDS = {"auth": 2, "rate_limit": 5, "server": 5, "network": 5}
+# 遮断してから試しに1回叩くまでの秒数．失敗するたびに次の値にする
+RETRY_SCHEDULE = (60, 300, 900, 3600)
+
+
+def failure_class(status_code):
+    """
+    遮断の対象となるステータスコードの種類.
+
+    Args:
+        status_code (int or str): HTTPステータス
+
+    Return:
+        failure_class (str): "auth"/"rate_limit"/"server"．対象外ならNone
+    """
+    try:
+        status_code = int(status_code)
+    except ValueError:
+        return None
+    if status_code in (401, 403):
+        return "auth"
+    if status_code == 429:
+        return "rate_limit"
+    if status_code >= 500:
+        return "server"
+    return None
+
+
+class AccountHealth:
+    """
+    アカウントごとのサーキットブレーカー.
+
+    401/403/429/5xxや通信エラーが続いたら遮断(open)し，RETRY_SCHEDULEの秒数が過ぎたら
+    試しに1回だけ叩かせる(half-open)．成功すれば元に戻し(closed)，失敗すれば次の秒数だけ遮断する.
+    遮断中はretry_atまでTwitterAPI.get_wake_time()が起床しないため，selectClientや
+    並行クロールのスレッドからは休んでいるアカウントとして扱われる.
+
+    Attributes:
+        name (str): アカウント名（ログ用）
+        state (str): "closed"/"open"/"half-open"
+        failures (dict): 種類ごとの連続失敗数
+        trips (int): 連続で遮断した回数（RETRY_SCHEDULEの位置）
+        retry_at (float): 遮断中の場合，試しに叩いてよくなる時刻(unix time)．closedなら0
+        last_error (str): 最後に遮断の原因となったステータス
+        lock (threading.Lock): 状態を守るロック
+    """
+
+    def __init__(self, name, thresholds=None, schedule=RETRY_SCHEDULE):
+        """クラスコンストラクタ."""
+        self.name = name
+        if thresholds is None:
+            thresholds = TRIP_THRESHOLDS
+        self.thresholds = thresholds
+        self.schedule = schedule
+        self.state = CLOSED
+        self.failures = {failure: 0 for failure in thresholds}
+        self.trips = 0
+        self.retry_at = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def get_state(self, now=None):
+        """
+        現在の状態．遮断中でもretry_atを過ぎていればhalf-openにする.
+
+        Return:
+            state (str): "closed"/"open"/"half-open"
+        """
+        with self.lock:
+            self._refresh(now)
+            return self.state
+
+    def _refresh(self, now=None):
+        """ロックを取得した状態で，retry_atを過ぎた遮断をhalf-openにする."""
+        if now is None:
+            now = time.time()
+        if (self.state == OPEN) and (now >= self.retry_at):
+            self.state = HALF_OPEN
+            print("Account Name %s: circuit half-open, probing" % self.name)
+
+    def blocked_until(self):
+        """
+        遮断中ならretry_at，そうでなければ0.
+
+        Return:
+            until (float): 叩いてよくなる時刻(unix time)
+        """
+        with self.lock:
+            self._refresh()
+            if self.state == OPEN:
+                return self.retry_at
+            return 0
+
+    def record(self, status_code):
+        """
+        レスポンスのステータスを記録し，必要なら状態を変える.
+
+        Args:
+            status_code (int or str): HTTPステータス（通信エラーは記録しない）
+        """
+        if str(status_code) == "200":
+            self.record_success()
+            return
+        failure = failure_class(status_code)
+        if failure is not None:
+            self.record_failure(failure, status_code)
+
+    def record_error(self, error):
+        """
+        通信エラー(タイムアウトなど，レスポンスのないもの)を記録する.
+
+        Args:
+            error (str): エラーの名前（ログ用）
+        """
+        self.record_failure("network", error)
+
+    def record_success(self):
+        """成功したので失敗数を戻し，遮断を解く."""
+        with self.lock:
+            for failure in self.failures:
+                self.failures[failure] = 0
+            if self.state != CLOSED:
+                print("Account Name %s: circuit closed" % self.name)
+            self.state = CLOSED
+            self.trips = 0
+            self.retry_at = 0
+
+    def record_failure(self, failure, status_code):
+        """
+        失敗を記録する．しきい値を超えるか，half-openでの試しが失敗したら遮断する.
+
+        Args:
+            failure (str): failure_class()の返り値か"network"．thresholdsにないものは無視する
+            status_code (int or str): HTTPステータス（通信エラーの場合はエラーの名前）
+        """
+        if failure not in self.thresholds:
+            return
+        with self.lock:
+            self._refresh()
+            self.failures[failure] += 1
+            if (self.state == HALF_OPEN) or \
+               (self.failures[failure] >= self.thresholds[failure]):
+                self._trip(status_code)
+
+    def _trip(self, status_code):
+        """ロックを取得した状態で遮断する."""
+        delay = self.schedule[min(self.trips, len(self.schedule) - 1)]
+        self.trips += 1
+        self.state = OPEN
+        self.retry_at = time.time() + delay
+        self.last_error = str(status_code)
+        for failure in self.failures:
+            self.failures[failure] = 0
+        print("Account Name %s: circuit open after %s, retry in %s sec"
+              % (self.name, status_code, delay))
+
+    def describe(self):
+        """ログ用の状態の文字列（closedなら空文字列）."""
+        state = self.get_state()
+        if state == CLOSED:
+            return ""
+        if state == OPEN:
+            return "%s (%s, retry in %d sec)" % (state, self.last_error,
+                                                 self.retry_at - time.time())
+        return "%s (%s)" % (state, self.last_error)
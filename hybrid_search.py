@@ -0,0 +1,14 @@
+"""
+search tweets based on both keywords and users at once.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import hybridcrawler
+
+if __name__ == '__main__':
+    obj = hybridcrawler.HybridCrawler()
+    obj.run()
@@ -0,0 +1,302 @@
+"""
+crawls keywords and users at once, using both budgets of every account.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import os
+import threading
+import time
+
+import sinks
+import twittercrawler
+
+
+SEARCH_TYPES = ("word", "user")
+
+
+class HybridCrawler:
+    """
+    キーワード検索とユーザ検索を1つのプロセスで同時に行う.
+
+    search/tweetsとstatuses/user_timelineの回数制限は別々のため，片方だけを検索すると
+    もう片方の残機が使われずに余る．検索タイプごとにTwitterCrawlerを作り，2つ目は
+    1つ目のアカウント（セッション・残機・サーキットブレーカー）を共有する.
+    keystatuses・検索状況のファイル・出力先は検索タイプごとに別にする.
+
+    逐次クロールでは，アカウントと残機のある検索タイプを交互に選ぶ．
+    並行クロールでは，アカウントと検索タイプの組ごとにスレッドを立てる.
+
+    Attributes:
+        crawlers (dict): 検索タイプごとのTwitterCrawler
+        source (twittercrawler.TwitterCrawler): アカウント・計測値・プロファイルを持つ（最初に作った）クローラ
+        last_used (dict): 検索タイプごとの，最後に選んだ時刻
+    """
+
+    def __init__(self, word_keys=None, user_keys=None,
+                 account_file="./accounts.cfg", search_lang="ja",
+                 word_metadata_file="./crawl_metadata_word.pkl",
+                 user_metadata_file="./crawl_metadata_user.pkl",
+                 word_results_dir="./results/word/",
+                 user_results_dir="./results/user/", **kwargs):
+        """
+        コンストラクタ. twitterアカウントを起動する.
+
+        Args:
+            word_keys (list): 検索するキーワードのlist．Noneならkeywords.csvから読み，
+                              空のlistならキーワード検索はしない
+            user_keys (list): 検索するユーザのlist．Noneならkeyusers.csvから読み，
+                              空のlistならユーザ検索はしない
+            account_file (str): 検索アカウントのAPIキーを書いたファイルのパス
+            search_lang (str): 検索する言語（キーワード検索のみ）
+            word_metadata_file (str): キーワード検索の検索状況を記録するファイルのパス
+            user_metadata_file (str): ユーザ検索の検索状況を記録するファイルのパス
+            word_results_dir (str): キーワード検索の結果の出力先
+            user_results_dir (str): ユーザ検索の結果の出力先
+            kwargs: 両方のTwitterCrawlerに渡す引数．storage_fileとcoordinator_fileは
+                    検索タイプごとに"_word"/"_user"を付けたファイル名にする
+        """
+        self.crawlers = {}
+        metadata_files = {"word": word_metadata_file,
+                          "user": user_metadata_file}
+        results_dirs = {"word": word_results_dir, "user": user_results_dir}
+        keys = {"word": word_keys, "user": user_keys}
+        account_source = None
+        for search_type in SEARCH_TYPES:
+            type_kwargs = dict(kwargs)
+            for name in ("storage_file", "coordinator_file"):
+                if type_kwargs.get(name) is not None:
+                    base, ext = os.path.splitext(type_kwargs[name])
+                    type_kwargs[name] = "%s_%s%s" % (base, search_type, ext)
+            crawler = twittercrawler.TwitterCrawler(
+                search_type, keys=keys[search_type],
+                account_file=account_file, search_lang=search_lang,
+                metadata_file=metadata_files[search_type],
+                results_dir=results_dirs[search_type],
+                account_source=account_source, **type_kwargs)
+            if account_source is None:
+                account_source = crawler
+            self.crawlers[search_type] = crawler
+        if not any(crawler.keys for crawler in self.crawlers.values()):
+            raise ValueError("HybridCrawler: no keys to search "
+                             "(both word_keys and user_keys are empty)")
+        self.source = account_source
+        self.last_used = {search_type: 0 for search_type in SEARCH_TYPES}
+
+    def selectClient(self):
+        """
+        検索に使用するアカウントと検索タイプを決定.
+
+        - 最後に選んでから時間の経った検索タイプから順に，起床していて残機のあるアカウントを探す
+        - どの組も休んでいる場合のみ，一番早く起床する組を待つ
+
+        Return:
+            selected_account (str): 使用するアカウント
+            search_type (str): "word"または"user"
+        """
+        search_types = sorted(SEARCH_TYPES, key=lambda s: self.last_used[s])
+        for search_type in search_types:
+            crawler = self.crawlers[search_type]
+            # 検索できるkeyがない（後回し中・他のプロセスが借りている）検索タイプは飛ばす
+            if len(crawler.keyscheduler) == 0:
+                continue
+            account = crawler.selectClient(wait=False)
+            if account is not None:
+                self.last_used[search_type] = time.time()
+                return account, search_type
+
+        ## 全ての組が休んでいる場合、一番早く起床する組の検索タイプで待つ
+        wake_times = {}
+        for search_type in search_types:
+            crawler = self.crawlers[search_type]
+            if not crawler.keys:
+                continue
+            wake_times[search_type] = min(
+                crawler.twitterapis[account].get_wake_time(search_type)
+                for account in crawler.accounts)
+        search_type = min(wake_times, key=wake_times.get)
+        account = self.crawlers[search_type].selectClient()
+        self.last_used[search_type] = time.time()
+        return account, search_type
+
+    def crawl_once(self):
+        """
+        アカウントと検索タイプを選んで一回クロールする.
+
+        Return:
+            search_type (str): 検索した検索タイプ
+            crawled_df : 取得したツイートのデータフレーム
+        """
+        account, search_type = self.selectClient()
+        crawler = self.crawlers[search_type]
+        crawler.maybeSyncShard()
+        return search_type, crawler.crawl_once(account)
+
+    def export_results(self, result_buffers, file_num, runtime=0,
+                       full_runtime=0):
+        """
+        検索タイプごとにクロール結果をpickleに出力し，lapの後処理をする.
+
+        Args:
+            result_buffers (dict): 検索タイプごとのsinks.ResultBuffer
+            file_num (int): 出力ファイルの通し番号
+            runtime (int): これまでの実行時間（秒）
+            full_runtime (int): 実行時間（秒）
+        """
+        for search_type, crawler in self.crawlers.items():
+            crawler.export_result(result_buffers[search_type].drain(),
+                                  file_num)
+        self.source.report_profile(file_num)
+        user_crawler = self.crawlers["user"]
+        if user_crawler.lookup_users and (runtime <= full_runtime):
+            user_crawler.prefilterUpdates()
+
+    def run(self, ask_runtime=True, export_lap=900, full_runtime=10800,
+            concurrent=False):
+        """
+        アカウントと検索タイプを切り替えつつクロールし続ける.
+
+        Args:
+            ask_runtime (bool): 実行時間を標準入力から受け取るか否か
+            export_lap (int): 結果をpickleに出力する間隔（秒）
+            full_runtime (int): 実行時間（秒）
+            concurrent (bool): Trueの場合，全アカウント・全検索タイプで同時にクロールする
+        """
+        if ask_runtime:
+            full_runtime = int(input("Enter Runtime (minutes): ")) * 60
+
+        if len(self.source.accounts) == 0:
+            print("No available accounts.")
+            return
+
+        if self.source.metrics is not None:
+            self.source.metrics.start()
+        if self.source.lap_profiler is not None:
+            self.source.lap_profiler.start()
+
+        if concurrent:
+            self.run_concurrent(export_lap, full_runtime)
+            return
+
+        i = 0
+        start_time = int(time.time())
+        lap_start = int(time.time())
+        file_num = 0
+        result_buffers = {search_type: sinks.ResultBuffer()
+                          for search_type in SEARCH_TYPES}
+        if self.crawlers["user"].lookup_users:
+            self.crawlers["user"].prefilterUpdates()
+
+        while(True):
+
+            i += 1
+            print("####CRAWL NO: %s ####" % i)
+
+            search_type, crawled_df = self.crawl_once()
+            result_buffers[search_type].append(crawled_df)
+
+            laptime = int(time.time()) - lap_start
+            runtime = int(time.time()) - start_time
+
+            if (laptime > export_lap) or (runtime > full_runtime):
+                file_num += 1
+                self.export_results(result_buffers, file_num, runtime,
+                                    full_runtime)
+                lap_start = int(time.time())
+
+            if runtime > full_runtime:
+                print("Finish Process.")
+                break
+
+        self.close()
+
+    def run_concurrent(self, export_lap=900, full_runtime=10800):
+        """
+        アカウントと検索タイプの組ごとにスレッドを立て，同時にクロールし続ける.
+
+        同じアカウントのキーワード検索とユーザ検索は別々の回数制限のため，同時に叩いてよい.
+
+        Args:
+            export_lap (int): 結果をpickleに出力する間隔（秒）
+            full_runtime (int): 実行時間（秒）
+        """
+        start_time = int(time.time())
+        lap_start = int(time.time())
+        file_num = 0
+        result_buffers = {search_type: sinks.ResultBuffer()
+                          for search_type in SEARCH_TYPES}
+        stop_event = threading.Event()
+        if self.crawlers["user"].lookup_users:
+            self.crawlers["user"].prefilterUpdates()
+
+        workers = {}
+
+        while(True):
+
+            # 後から起動したアカウントと，止まってしまったスレッドの組にもスレッドを立てる
+            with self.source.account_lock:
+                accounts = list(self.source.accounts)
+            for search_type, crawler in self.crawlers.items():
+                if not crawler.keys:
+                    continue
+                for account in accounts:
+                    worker = workers.get((search_type, account))
+                    if worker is not None:
+                        if worker.is_alive():
+                            continue
+                        print("Account Name %s: %s worker stopped, restarted"
+                              % (account, search_type))
+                    worker = threading.Thread(
+                        target=crawler.crawl_worker,
+                        args=(account, stop_event,
+                              result_buffers[search_type]),
+                        name="crawler-%s-%s" % (search_type, account),
+                        daemon=True)
+                    worker.start()
+                    workers[(search_type, account)] = worker
+
+            stop_event.wait(1)
+            for crawler in self.crawlers.values():
+                crawler.maybeSyncShard()
+
+            laptime = int(time.time()) - lap_start
+            runtime = int(time.time()) - start_time
+
+            if runtime > full_runtime:
+                stop_event.set()
+                for worker in workers.values():
+                    worker.join(timeout=30)
+
+            if (laptime > export_lap) or (runtime > full_runtime):
+                file_num += 1
+                self.export_results(result_buffers, file_num, runtime,
+                                    full_runtime)
+                lap_start = int(time.time())
+
+            if runtime > full_runtime:
+                print("Finish Process.")
+                break
+
+        self.close()
+
+    def close(self):
+        """出力を閉じ，検索タイプごとの検索状況を保存する."""
+        for crawler in self.crawlers.values():
+            crawler.sink.close()
+            if crawler.storage is not None:
+                crawler.storage.close()
+        source = self.source
+        if source.metrics is not None:
+            source.metrics.close()
+        if source.lap_profiler is not None:
+            source.lap_profiler.stop()
+        if source.broker is not None:
+            source.broker.close()
+        for crawler in self.crawlers.values():
+            crawler.closeShard()
+            with crawler.keystatus_lock:
+                print(crawler.keystatuses)
+                crawler.save_keystatus()
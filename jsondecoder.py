@@ -0,0 +1,72 @@
+"""
+decodes api responses from bytes, optionally with a faster backend.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def available_backends():
+    """使えるバックエンドの名前のlist（速い順）."""
+    backends = []
+    if orjson is not None:
+        backends.append("orjson")
+    backends.append("json")
+    return backends
+
+
+class JsonDecoder:
+    """
+    APIのレスポンス(bytes)をデコードする.
+
+    ret.textを経由せずret.contentを直接デコードするため，文字コードの推定と
+    str への変換を省ける．orjsonがあればそれを使い，なければ標準のjsonを使う.
+
+    必要なフィールドだけを取り出すのはTwitterAPI.process_contentが列にする際に行う
+    （デコードした後でdictを削り直しても，デコードの手間は減らずコピーが増えるだけのため）.
+
+    Attributes:
+        backend (str): "orjson"または"json"
+    """
+
+    def __init__(self, backend=None):
+        """
+        クラスコンストラクタ.
+
+        Args:
+            backend (str): "orjson"または"json"．Noneなら使える中で一番速いもの
+        """
+        if backend is None:
+            backend = available_backends()[0]
+        if backend == "orjson":
+            if orjson is None:
+                raise ImportError("json backend 'orjson' requires orjson. "
+                                  "Install it with `pip install orjson` "
+                                  "or use backend 'json'.")
+            self._loads = orjson.loads
+        elif backend == "json":
+            self._loads = json.loads
+        else:
+            raise ValueError("unknown json backend: %s" % backend)
+        self.backend = backend
+
+    def loads(self, content):
+        """
+        bytes(またはstr)をそのままデコードする.
+
+        Args:
+            content (bytes or str): レスポンスの本文
+
+        Return:
+            obj: デコードしたオブジェクト
+        """
+        return self._loads(content)
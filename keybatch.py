@@ -0,0 +1,132 @@
+"""
+packs several low-volume keywords into one OR query.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import datetime
+
+
+# /search/tweetsのクエリの長さの上限
+MAX_QUERY_LEN = 500
+
+
+def quote_keyword(keyword):
+    """
+    ORでつなぐ際に，空白を含む(AND検索の)キーワードを括弧で囲む.
+
+    Args:
+        keyword (str): キーワード
+
+    Return:
+        term (str): ORでつなげるキーワード
+    """
+    keyword = keyword.strip()
+    if (" " in keyword or "　" in keyword) and \
+       not (keyword.startswith("(") and keyword.endswith(")")):
+        return "(" + keyword + ")"
+    return keyword
+
+
+def build_query(members):
+    """
+    キーワードのlistをORでつないだクエリにする.
+
+    Args:
+        members (list): キーワードのlist
+
+    Return:
+        query (str): ORでつないだクエリ
+    """
+    return " OR ".join(quote_keyword(k) for k in members)
+
+
+def make_batches(keywords, max_query_len=MAX_QUERY_LEN):
+    """
+    キーワードを順に詰めて，max_query_len以内のORクエリに分ける.
+
+    Args:
+        keywords (list): キーワードのlist
+        max_query_len (int): クエリの長さの上限
+
+    Return:
+        batches (list): キーワードのlistのlist．1つしか入らないものは含めない
+    """
+    batches = []
+    current = []
+    for k in keywords:
+        candidate = current + [k]
+        if current and len(build_query(candidate)) > max_query_len:
+            batches.append(current)
+            current = [k]
+        else:
+            current = candidate
+    if current:
+        batches.append(current)
+    return [b for b in batches if len(b) > 1]
+
+
+def key_terms(keyword):
+    """
+    ローカルで照合するための，キーワードの語（小文字）のlist.
+
+    除外語(-から始まる語)や検索演算子(xxx:yyy)は照合に使わない.
+
+    Args:
+        keyword (str): キーワード
+
+    Return:
+        terms (list): キーワードに含まれる語のlist
+    """
+    terms = []
+    for term in keyword.replace("　", " ").strip("()").split():
+        term = term.strip('"()').lower()
+        if (not term) or term.startswith("-") or (":" in term) or \
+           (term == "or"):
+            continue
+        terms.append(term)
+    return terms
+
+
+def match_keys(text, member_terms):
+    """
+    ツイート本文に全ての語が含まれるキーワードを返す.
+
+    Args:
+        text (str): ツイート本文
+        member_terms (list): (キーワード, key_termsの結果)のlist
+
+    Return:
+        matched (list): 本文に一致したキーワードのlist
+    """
+    text = text.lower()
+    matched = []
+    for keyword, terms in member_terms:
+        if terms and all(term in text for term in terms):
+            matched.append(keyword)
+    return matched
+
+
+def _to_dt(value):
+    """"YYYY-mm-dd HH:MM:SS"の文字列をdatetimeにする."""
+    return datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+
+def tweets_per_day(status):
+    """
+    keystatusesの1keyの状況から，1日あたりのツイート数を見積もる.
+
+    Args:
+        status (dict): keyの検索状況
+
+    Return:
+        rate (float): 1日あたりのツイート数．一度も取得していない場合はNone
+    """
+    if status["max_tw_time"] is None or status["min_tw_time"] is None:
+        return None
+    span = (_to_dt(status["max_tw_time"]) -
+            _to_dt(status["min_tw_time"])).total_seconds()
+    return status["total_crawled_num"] / max(span / 86400.0, 1.0)
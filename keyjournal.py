@@ -0,0 +1,152 @@
+"""
+append-only journal of key status changes.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import json
+import os
+import pickle as pkl
+
+import keytable
+
+
+class KeyStatusJournal:
+    """
+    keystatusesの変更をkeyごとに追記していくジャーナル.
+
+    keystatuses全体はスナップショット(pickle，KeyStatusTableの場合はnpz)に保存し，それ以降の変更は
+    keyごとに1行のJSONとしてジャーナルファイルに追記する.
+    読み込む時はスナップショットにジャーナルを順に適用する.
+    ジャーナルが長くなったらcompact()でスナップショットに書き戻し，ジャーナルを空にする.
+
+    Attributes:
+        snapshot_file (str): スナップショットのパス
+        journal_file (str): ジャーナルのパス
+        compact_every (int): この行数を超えたらcompactが必要とみなす
+        fsync (bool): 追記のたびにディスクまで書き込むか否か
+        num_records (int): 前回のcompact以降に追記した行数
+    """
+
+    def __init__(self, snapshot_file="./crawl_metadata.pkl",
+                 journal_file=None, compact_every=10000, fsync=False):
+        """
+        クラスコンストラクタ.
+
+        Args:
+            snapshot_file (str): スナップショットのパス
+            journal_file (str): ジャーナルのパス．Noneならsnapshot_file + ".journal"
+            compact_every (int): この行数を超えたらcompactが必要とみなす
+            fsync (bool): 追記のたびにディスクまで書き込むか否か
+        """
+        self.snapshot_file = snapshot_file
+        if journal_file is None:
+            journal_file = snapshot_file + ".journal"
+        self.journal_file = journal_file
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.num_records = 0
+        self._f = None
+
+    def exists(self):
+        """スナップショットかジャーナルのどちらかがあればTrue."""
+        return os.path.exists(self.snapshot_file) or \
+            os.path.exists(self.journal_file)
+
+    def load(self, table=False):
+        """
+        スナップショットを読み込み，ジャーナルを適用したkeystatusesを返す.
+
+        クラッシュで途中までしか書かれていない最後の行は読み飛ばす.
+        スナップショットの形式(pickle/npz)は中身から判断し，tableの指定に合わせて変換する.
+
+        Args:
+            table (bool): Trueならkeytable.KeyStatusTableで返す
+
+        Return:
+            keystatuses (dict or keytable.KeyStatusTable): 検索keyごとの検索状況
+        """
+        keystatuses = {}
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, mode='rb') as f:
+                # npz(zip)は"PK"で始まる
+                if f.read(2) == b"PK":
+                    f.seek(0)
+                    keystatuses = keytable.KeyStatusTable.load(f)
+                else:
+                    f.seek(0)
+                    keystatuses = pkl.load(f)
+
+        if table and not isinstance(keystatuses, keytable.KeyStatusTable):
+            keystatuses = keytable.KeyStatusTable.from_dict(keystatuses)
+        elif not table and isinstance(keystatuses, keytable.KeyStatusTable):
+            keystatuses = keystatuses.to_dict()
+
+        num_records = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, mode='r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        key, status = json.loads(line)
+                    except ValueError:
+                        continue
+                    keystatuses[key] = status
+                    num_records += 1
+        self.num_records = num_records
+
+        return keystatuses
+
+    def append(self, key, status):
+        """
+        keyの検索状況を1行追記する.
+
+        Args:
+            key (str or int): 検索key
+            status (dict): keyの検索状況
+        """
+        if self._f is None:
+            self._f = open(self.journal_file, mode='a', encoding='utf-8')
+        self._f.write(json.dumps([key, dict(status)], ensure_ascii=False))
+        self._f.write("\n")
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+        self.num_records += 1
+
+    def needs_compaction(self):
+        """ジャーナルがcompact_everyより長くなっていればTrue."""
+        return self.num_records > self.compact_every
+
+    def compact(self, keystatuses):
+        """
+        keystatuses全体をスナップショットに書き出し，ジャーナルを空にする.
+
+        スナップショットは一時ファイルに書いてから置き換えるため，途中で落ちても壊れない.
+        置き換えた後ジャーナルを空にする前に落ちても，ジャーナルの適用は何度やっても同じ結果になる.
+
+        Args:
+            keystatuses (dict or keytable.KeyStatusTable): 検索keyごとの検索状況
+        """
+        tmp_file = self.snapshot_file + ".tmp"
+        with open(tmp_file, mode='wb') as f:
+            if isinstance(keystatuses, keytable.KeyStatusTable):
+                keystatuses.save(f)
+            else:
+                pkl.dump(keystatuses, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+
+        self.close()
+        with open(self.journal_file, mode='w', encoding='utf-8'):
+            pass
+        self.num_records = 0
+
+    def close(self):
+        """ジャーナルファイルを閉じる."""
+        if self._f is not None:
+            self._f.close()
+            self._f = None
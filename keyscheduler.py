@@ -0,0 +1,237 @@
+"""
+selects the next key to crawl with priority queues.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import heapq
+
+
+# snowflake形式のツイートidのうち時刻(ms)を表す部分は22bit目より上
+_TIMESTAMP_SHIFT = 22
+# これより小さいidはsnowflake導入以前の連番で，時刻を含まない
+_SNOWFLAKE_MIN_ID = 30000000000
+
+
+def estimate_rate(status):
+    """
+    keyの1秒あたりのツイート数を，取得済みのツイート数と最古・最新のツイートidから見積もる.
+
+    Args:
+        status (dict): keyの検索状況
+
+    Return:
+        rate (float): 1秒あたりのツイート数．見積もれない場合はNone
+    """
+    max_tw_id = status["max_tw_id"]
+    min_tw_id = status["min_tw_id"]
+    if (max_tw_id is None) or (min_tw_id is None) or \
+       (min_tw_id < _SNOWFLAKE_MIN_ID):
+        return None
+    span_ms = (max_tw_id >> _TIMESTAMP_SHIFT) - (min_tw_id >> _TIMESTAMP_SHIFT)
+    # 1ページに収まる程度のkeyは短い期間しか見えていないので，最低1分とみなす
+    return status["total_crawled_num"] / max(span_ms / 1000.0, 60.0)
+
+
+class KeyScheduler:
+    """
+    keystatusesをもとに，次に検索するkeyとmodeをO(log K)で選ぶ.
+
+    選び方はTwitterCrawler.selectKeyの全件走査と同じで，
+    1. "update"モード移行前(recent_min, since_tw_id, last_updated_timeのいずれかがNone)のkeyを
+       keysの順に("new"または"paging")
+    2. なければ，pagingが済んでいない(recent_min - since_tw_id > 0)keyを差の大きい順に("paging")
+    3. なければ，last_updated_timeが最も古いkeyを("update")
+    選ぶ．同順位の場合はkeysの順で先のものを選ぶ.
+
+    target_yieldを指定した場合，3.は「次のupdateでtarget_yield件の新しいツイートが
+    溜まっていると見込まれる時刻」が最も早いkeyを選ぶ．
+    見込みはestimate_rateによる過去のツイートの頻度から立て，どのkeyも最後の検索から
+    max_staleness秒後には順番が来るようにする．ツイートの多いkeyは頻繁に，少ないkeyは
+    まれにupdateされるため，1回の検索で得られるツイート数が増える.
+
+    pop()で選んだkeyはキューから外れ，push()で戻すまで他から選ばれない.
+    defer()で後回しにしたkeyも，release_deferred()かpush()で戻すまで選ばれない.
+    keystatusesを更新したら必ずpush()で戻すこと（TwitterCrawler.updateKeyStatusが行う）.
+    スレッドセーフではないので，keystatusesと同じロックの中で使う.
+
+    Attributes:
+        keystatuses (dict): 検索keyごとの検索状況が入ったdict
+        order (dict): keyをkeysでの順番に対応させるdict
+        versions (dict): keyごとの最新のエントリの番号．古いエントリは読み飛ばす
+        queued (set): キューに入っているkey
+        deferred (set): defer()でキューから外しているkey
+        pending (list): "update"モード移行前のkeyのヒープ
+        paging (list): paging中のkeyのヒープ
+        updating (list): paging済みのkeyのヒープ
+        target_yield (float): 1回のupdateで狙うツイート数．Noneなら最も古いkeyから選ぶ
+        max_staleness (int): updateの間隔の上限(秒)
+    """
+
+    def __init__(self, keys, keystatuses, target_yield=None,
+                 max_staleness=3600):
+        """
+        クラスコンストラクタ. 全てのkeyをキューに入れる.
+
+        Args:
+            keys (list): 検索するキーワード/ユーザのlist
+            keystatuses (dict): 検索keyごとの検索状況が入ったdict
+            target_yield (float): 1回のupdateで狙うツイート数（1ページの半分程度がよい）
+            max_staleness (int): updateの間隔の上限(秒)
+        """
+        self.keystatuses = keystatuses
+        self.target_yield = target_yield
+        self.max_staleness = max_staleness
+        self.order = {}
+        self.versions = {}
+        self.queued = set()
+        self.deferred = set()
+        self.pending = []
+        self.paging = []
+        self.updating = []
+        for k in keys:
+            self.add(k)
+
+    def __len__(self):
+        """キューに入っているkeyの数."""
+        return len(self.queued)
+
+    def __contains__(self, key):
+        """keyがキューに入っていればTrue（検索中のkeyはFalse）."""
+        return key in self.queued
+
+    def add(self, key):
+        """
+        新しいkeyを末尾の順番で追加する．すでにあるkeyは入れ直すだけ.
+
+        Args:
+            key (str or int): 検索key
+        """
+        if key not in self.order:
+            self.order[key] = len(self.order)
+            self.versions[key] = 0
+        self.push(key)
+
+    def remove(self, key):
+        """
+        keyをキューから外す（ヒープのエントリは後で読み飛ばす）.
+
+        Args:
+            key (str or int): 検索key
+        """
+        self.versions[key] += 1
+        self.queued.discard(key)
+        self.deferred.discard(key)
+
+    def defer(self, key):
+        """
+        keyをrelease_deferred()まで選ばれないようにキューから外す.
+
+        Args:
+            key (str or int): 検索key
+        """
+        self.remove(key)
+        self.deferred.add(key)
+
+    def release_deferred(self):
+        """
+        defer()で外したkeyを全てキューに戻す.
+
+        Return:
+            num_released (int): 戻したkeyの数
+        """
+        deferred = self.deferred
+        self.deferred = set()
+        for key in deferred:
+            self.push(key)
+        return len(deferred)
+
+    def push(self, key):
+        """
+        keystatusesの現在の値でkeyをキューに入れ直す.
+
+        Args:
+            key (str or int): 検索key
+        """
+        self.versions[key] += 1
+        self.deferred.discard(key)
+        version = self.versions[key]
+        idx = self.order[key]
+        status = self.keystatuses[key]
+        recent_min = status["recent_min"]
+        since_tw_id = status["since_tw_id"]
+        last_updated_time = status["last_updated_time"]
+
+        if (recent_min is None) or (since_tw_id is None) or \
+                                   (last_updated_time is None):
+            heapq.heappush(self.pending, (idx, version, key))
+        elif recent_min - since_tw_id > 0:
+            heapq.heappush(self.paging,
+                           (since_tw_id - recent_min, idx, version, key))
+        else:
+            heapq.heappush(self.updating,
+                           (self.due_time(status), idx, version, key))
+        self.queued.add(key)
+
+    def due_time(self, status):
+        """
+        updateの順番を決める時刻を返す．小さいほど先に選ばれる.
+
+        Args:
+            status (dict): keyの検索状況
+
+        Return:
+            due (float): target_yieldがNoneならlast_updated_time，
+                         そうでなければtarget_yield件溜まると見込まれる時刻
+        """
+        last_updated_time = status["last_updated_time"]
+        if self.target_yield is None:
+            return last_updated_time
+
+        rate = estimate_rate(status)
+        if not rate:
+            return last_updated_time + self.max_staleness
+        return last_updated_time + min(self.target_yield / rate,
+                                       self.max_staleness)
+
+    def _pop_valid(self, heap):
+        """ヒープの先頭から古いエントリを捨て，有効なエントリのkeyを取り出す."""
+        while heap:
+            entry = heap[0]
+            key = entry[-1]
+            if entry[-2] == self.versions[key] and key in self.queued:
+                heapq.heappop(heap)
+                self.remove(key)
+                return key
+            heapq.heappop(heap)
+        return None
+
+    def pop(self):
+        """
+        次に検索するkeyとmodeを選び，キューから外す.
+
+        Return:
+            selected_key: 選択した検索key. キューが空の場合はNone
+            mode (str): 検索モード"new"/"paging"/"update"のいずれか
+        """
+        key = self._pop_valid(self.pending)
+        if key is not None:
+            # Case1. 初回のクロール / Case2. 2回目以降のクロール
+            if self.keystatuses[key]["recent_min"] is None:
+                return key, "new"
+            return key, "paging"
+
+        # Case3. paging中のkeyがある場合
+        key = self._pop_valid(self.paging)
+        if key is not None:
+            return key, "paging"
+
+        # Case4. paging中のkeyがない場合
+        key = self._pop_valid(self.updating)
+        if key is not None:
+            return key, "update"
+
+        return None, None
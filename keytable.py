@@ -0,0 +1,257 @@
+"""
+compact column-oriented storage for key statuses.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import datetime
+import json
+
+import numpy as np
+
+
+# 値がNoneであることを表す番兵
+NULL = np.iinfo(np.int64).min
+_UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+
+# 列名と，その列の種類("id": ツイートid, "time": "YYYY-mm-dd HH:MM:SS"の時刻,
+# "unix": unix time, "count": 個数)
+COLUMNS = [("max_tw_id", "id"), ("max_tw_time", "time"),
+           ("min_tw_id", "id"), ("min_tw_time", "time"),
+           ("recent_min", "id"), ("since_tw_id", "id"),
+           ("last_updated_time", "unix"), ("total_crawled_num", "count")]
+_KINDS = dict(COLUMNS)
+FIELDS = [name for name, _ in COLUMNS]
+
+
+def _encode(kind, value):
+    """Pythonの値を列に入れるint64にする."""
+    if value is None:
+        return 0 if kind == "count" else NULL
+    if kind == "time":
+        dt = datetime.datetime(int(value[0:4]), int(value[5:7]),
+                               int(value[8:10]), int(value[11:13]),
+                               int(value[14:16]), int(value[17:19]))
+        return int((dt - _UNIX_EPOCH).total_seconds())
+    return int(value)
+
+
+def _decode(kind, value):
+    """列のint64をPythonの値に戻す."""
+    value = int(value)
+    if value == NULL:
+        return None
+    if kind == "time":
+        dt = _UNIX_EPOCH + datetime.timedelta(seconds=value)
+        return dt.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+class KeyStatusRow:
+    """
+    KeyStatusTableの1行を，keystatuses[key]のdictと同じように読み書きするビュー.
+
+    Attributes:
+        table (KeyStatusTable): 元の表
+        idx (int): 行番号
+    """
+
+    __slots__ = ("table", "idx")
+
+    def __init__(self, table, idx):
+        """クラスコンストラクタ."""
+        self.table = table
+        self.idx = idx
+
+    def __getitem__(self, field):
+        """列の値を返す."""
+        return _decode(_KINDS[field], self.table.columns[field][self.idx])
+
+    def __setitem__(self, field, value):
+        """列に値を入れる."""
+        self.table.columns[field][self.idx] = _encode(_KINDS[field], value)
+
+    def __iter__(self):
+        """列名を返す."""
+        return iter(FIELDS)
+
+    def __len__(self):
+        """列の数."""
+        return len(FIELDS)
+
+    def __eq__(self, other):
+        """同じ値を持つdictやビューと等しい."""
+        try:
+            return dict(self) == dict(other)
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        """dictと同じ表示."""
+        return repr(dict(self))
+
+    def keys(self):
+        """列名のlist."""
+        return list(FIELDS)
+
+    def items(self):
+        """(列名, 値)のlist."""
+        return [(field, self[field]) for field in FIELDS]
+
+    def get(self, field, default=None):
+        """列があればその値，なければdefault."""
+        if field in _KINDS:
+            return self[field]
+        return default
+
+    def update(self, status):
+        """dictの値をまとめて入れる."""
+        for field, value in status.items():
+            self[field] = value
+
+
+class KeyStatusTable:
+    """
+    keystatusesを，列ごとのint64配列で持つ表.
+
+    keyごとに8つの値を持つdictを作る代わりに，列ごとに1つの配列を持つため
+    数十万keyでもメモリをほとんど使わず，保存・読み込みも速い.
+    ツイートidと時刻はNoneの代わりに番兵NULLを入れ，時刻は秒に直して持つ.
+    keystatuses[key][field]の読み書き，in，keys()，items()などはdictと同じように使える.
+
+    Attributes:
+        columns (dict): 列名をkeyとした，int64のnumpy配列
+        key_list (list): 行番号順のkey
+        index (dict): keyを行番号に対応させるdict
+    """
+
+    def __init__(self, keys=(), capacity=1024):
+        """
+        クラスコンストラクタ.
+
+        Args:
+            keys (list): 最初に追加するkey
+            capacity (int): 最初に確保する行数
+        """
+        capacity = max(capacity, len(keys), 1)
+        self.columns = {}
+        for field, kind in COLUMNS:
+            fill = 0 if kind == "count" else NULL
+            self.columns[field] = np.full(capacity, fill, dtype=np.int64)
+        self.key_list = []
+        self.index = {}
+        for k in keys:
+            self.add(k)
+
+    def __len__(self):
+        """keyの数."""
+        return len(self.key_list)
+
+    def __contains__(self, key):
+        """keyがあればTrue."""
+        return key in self.index
+
+    def __iter__(self):
+        """keyを行番号順に返す."""
+        return iter(self.key_list)
+
+    def __getitem__(self, key):
+        """keyの行のビューを返す."""
+        return KeyStatusRow(self, self.index[key])
+
+    def __setitem__(self, key, status):
+        """keyの行を（なければ追加して）statusの値で置き換える."""
+        idx = self.add(key)
+        for field, kind in COLUMNS:
+            self.columns[field][idx] = _encode(kind, status.get(field))
+
+    def __repr__(self):
+        """keyの数と各keyの状況."""
+        return "KeyStatusTable(%s)" % repr(dict(self.items()))
+
+    def keys(self):
+        """keyのlist."""
+        return list(self.key_list)
+
+    def values(self):
+        """行のビューのlist."""
+        return [KeyStatusRow(self, i) for i in range(len(self.key_list))]
+
+    def items(self):
+        """(key, 行のビュー)のlist."""
+        return [(k, KeyStatusRow(self, i))
+                for i, k in enumerate(self.key_list)]
+
+    def add(self, key):
+        """
+        keyの行を追加する．すでにあれば何もしない.
+
+        Args:
+            key (str or int): 検索key
+
+        Return:
+            idx (int): keyの行番号
+        """
+        if key in self.index:
+            return self.index[key]
+        idx = len(self.key_list)
+        capacity = len(self.columns["max_tw_id"])
+        if idx >= capacity:
+            for field, kind in COLUMNS:
+                fill = 0 if kind == "count" else NULL
+                grown = np.full(capacity * 2, fill, dtype=np.int64)
+                grown[:capacity] = self.columns[field]
+                self.columns[field] = grown
+        self.key_list.append(key)
+        self.index[key] = idx
+        return idx
+
+    def to_dict(self):
+        """keystatusesと同じdictにする."""
+        return {k: dict(row) for k, row in self.items()}
+
+    @classmethod
+    def from_dict(cls, keystatuses):
+        """keystatusesのdictから作る."""
+        table = cls(capacity=len(keystatuses))
+        for k, status in keystatuses.items():
+            table[k] = status
+        return table
+
+    def save(self, f):
+        """
+        numpyのnpz形式で保存する.
+
+        Args:
+            f: 保存先のファイルパスまたはバイナリモードで開いたファイル
+        """
+        n = len(self.key_list)
+        arrays = {field: self.columns[field][:n] for field in FIELDS}
+        # keyはstrとintが混ざりうるのでJSONで保存する
+        keys_json = json.dumps(self.key_list, ensure_ascii=False)
+        arrays["__keys__"] = np.frombuffer(keys_json.encode("utf-8"),
+                                           dtype=np.uint8)
+        np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, f):
+        """
+        saveで保存した表を読み込む.
+
+        Args:
+            f: ファイルパスまたはバイナリモードで開いたファイル
+
+        Return:
+            table (KeyStatusTable): 読み込んだ表
+        """
+        with np.load(f) as data:
+            keys = json.loads(data["__keys__"].tobytes().decode("utf-8"))
+            table = cls(capacity=len(keys))
+            for field in FIELDS:
+                table.columns[field][:len(keys)] = data[field]
+        table.key_list = keys
+        table.index = {k: i for i, k in enumerate(keys)}
+        return table
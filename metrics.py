@@ -0,0 +1,312 @@
+"""
+counters and histograms about the crawl.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import bisect
+import collections
+import http.server
+import json
+import os
+import socketserver
+import threading
+import time
+
+
+# HTTPのレイテンシのヒストグラムの区切り(秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    """Prometheusのラベル値のエスケープ."""
+    return (str(value).replace("\\", "\\\\").replace("\"", "\\\"")
+            .replace("\n", "\\n"))
+
+
+def _labels(**labels):
+    """{name="value",...}の形にする."""
+    return "{%s}" % ",".join('%s="%s"' % (name, _escape(value))
+                             for name, value in labels.items())
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                          http.server.HTTPServer):
+    """リクエストごとにスレッドを立てるHTTPサーバ（Python 3.6にはhttp.serverのものがない）."""
+
+    daemon_threads = True
+
+
+class Metrics:
+    """
+    クロールの計測値を貯め，JSONとPrometheusのテキスト形式で出力する.
+
+    TwitterAPI/TwitterCrawlerがobserve_*を呼ぶ．複数スレッドから呼んでよい.
+    start()すると，interval秒ごとにファイルへ書き出し，portを指定した場合は
+    http://127.0.0.1:<port>/metrics (Prometheus形式) と /metrics.json で返す.
+
+    Attributes:
+        json_file (str): JSONの出力先．Noneなら出力しない
+        prom_file (str): Prometheus形式の出力先．Noneなら出力しない
+        interval (float): ファイルに書き出す間隔(秒)
+        port (int): HTTPで返すポート．Noneなら立てない
+        rate_window (int): keyごとの1分あたりのツイート数を平均する時間(分)
+        requests (collections.Counter): (アカウント, エンドポイント)ごとのリクエスト数
+        errors (collections.Counter): (アカウント, ステータスコード)ごとのエラー数
+        latency (dict): アカウントごとの[区切りごとの件数のlist, 合計秒, 件数]
+        sleep_sec (collections.Counter): アカウントごとの，回数制限などで待った秒数
+        key_tweets (collections.Counter): keyごとの取得ツイート数
+        key_minutes (dict): keyごとの{分: ツイート数}（直近rate_window分のみ）
+        remaining (dict): (アカウント, 検索タイプ)ごとのAPI残機
+        lock (threading.Lock): 計測値を守るロック
+    """
+
+    def __init__(self, json_file="./results/metrics.json",
+                 prom_file="./results/metrics.prom", interval=60, port=None,
+                 rate_window=10):
+        """クラスコンストラクタ."""
+        self.json_file = json_file
+        self.prom_file = prom_file
+        self.interval = interval
+        self.port = port
+        self.rate_window = rate_window
+        self.started_time = time.time()
+        self.requests = collections.Counter()
+        self.errors = collections.Counter()
+        self.latency = {}
+        self.sleep_sec = collections.Counter()
+        self.key_tweets = collections.Counter()
+        self.key_minutes = {}
+        self.remaining = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.writer = None
+        self.server = None
+
+    def observe_request(self, account, endpoint, latency, status_code):
+        """
+        APIを1回叩いた結果を記録する.
+
+        Args:
+            account (str): アカウント名
+            endpoint (str): "search"/"user_timeline"/"lookup"/"rate_limit"など
+            latency (float): レスポンスまでの秒数
+            status_code (int or str): HTTPステータス．通信エラーは"error"
+        """
+        with self.lock:
+            self.requests[(account, endpoint)] += 1
+            if str(status_code) != "200":
+                self.errors[(account, str(status_code))] += 1
+            hist = self.latency.get(account)
+            if hist is None:
+                hist = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+                self.latency[account] = hist
+            hist[0][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            hist[1] += latency
+            hist[2] += 1
+
+    def observe_sleep(self, account, seconds):
+        """アカウントが回数制限やエラーで待った秒数を記録する."""
+        if seconds <= 0:
+            return
+        with self.lock:
+            self.sleep_sec[account] += seconds
+
+    def observe_tweets(self, key, num):
+        """keyについて取得したツイート数を記録する."""
+        minute = int(time.time() // 60)
+        with self.lock:
+            self.key_tweets[key] += num
+            minutes = self.key_minutes.setdefault(key, {})
+            minutes[minute] = minutes.get(minute, 0) + num
+            if len(minutes) > self.rate_window:
+                for old in [m for m in minutes
+                            if m <= minute - self.rate_window]:
+                    del minutes[old]
+
+    def set_remaining(self, account, search_type, remaining):
+        """アカウントのAPI残機を記録する."""
+        with self.lock:
+            self.remaining[(account, search_type)] = remaining
+
+    def tweets_per_minute(self, key, now=None):
+        """keyの直近rate_window分の，1分あたりのツイート数."""
+        if now is None:
+            now = time.time()
+        minute = int(now // 60)
+        minutes = self.key_minutes.get(key, {})
+        total = sum(num for m, num in minutes.items()
+                    if m > minute - self.rate_window)
+        return total / float(self.rate_window)
+
+    def snapshot(self):
+        """
+        現在の計測値.
+
+        Return:
+            snapshot (dict): アカウントごと・keyごとの計測値
+        """
+        now = time.time()
+        with self.lock:
+            accounts = {}
+            for (account, endpoint), num in self.requests.items():
+                acc = accounts.setdefault(account, {"requests": {},
+                                                    "errors": {}})
+                acc["requests"][endpoint] = num
+            for (account, code), num in self.errors.items():
+                accounts.setdefault(account, {"requests": {}, "errors": {}})
+                accounts[account]["errors"][code] = num
+            for account, (buckets, total, count) in self.latency.items():
+                accounts[account]["latency"] = {
+                    "count": count,
+                    "mean_sec": total / count,
+                    "buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] +
+                                        ["+Inf"], buckets))}
+            for account, sec in self.sleep_sec.items():
+                accounts.setdefault(account, {"requests": {}, "errors": {}})
+                accounts[account]["sleep_sec"] = sec
+            for (account, search_type), rem in self.remaining.items():
+                acc = accounts.setdefault(account, {"requests": {},
+                                                    "errors": {}})
+                acc.setdefault("remaining", {})[search_type] = rem
+            keys = {key: {"tweets": num,
+                          "tweets_per_minute": self.tweets_per_minute(key,
+                                                                      now)}
+                    for key, num in self.key_tweets.items()}
+        return {"time": int(now), "uptime_sec": int(now - self.started_time),
+                "accounts": accounts, "keys": keys}
+
+    def to_prometheus(self):
+        """
+        現在の計測値をPrometheusのテキスト形式にする.
+
+        Return:
+            text (str): /metricsで返す内容
+        """
+        now = time.time()
+        lines = []
+        with self.lock:
+            lines.append("# TYPE twittercrawler_requests_total counter")
+            for (account, endpoint), num in sorted(self.requests.items()):
+                lines.append("twittercrawler_requests_total%s %s"
+                             % (_labels(account=account, endpoint=endpoint),
+                                num))
+            lines.append("# TYPE twittercrawler_errors_total counter")
+            for (account, code), num in sorted(self.errors.items()):
+                lines.append("twittercrawler_errors_total%s %s"
+                             % (_labels(account=account, code=code), num))
+            lines.append("# TYPE twittercrawler_request_latency_seconds "
+                         "histogram")
+            for account, (buckets, total, count) in \
+                    sorted(self.latency.items()):
+                cumulative = 0
+                for le, num in zip([str(b) for b in LATENCY_BUCKETS] +
+                                   ["+Inf"], buckets):
+                    cumulative += num
+                    lines.append(
+                        "twittercrawler_request_latency_seconds_bucket%s %s"
+                        % (_labels(account=account, le=le), cumulative))
+                lines.append("twittercrawler_request_latency_seconds_sum%s %s"
+                             % (_labels(account=account), total))
+                lines.append(
+                    "twittercrawler_request_latency_seconds_count%s %s"
+                    % (_labels(account=account), count))
+            lines.append("# TYPE twittercrawler_sleep_seconds_total counter")
+            for account, sec in sorted(self.sleep_sec.items()):
+                lines.append("twittercrawler_sleep_seconds_total%s %s"
+                             % (_labels(account=account), sec))
+            lines.append("# TYPE twittercrawler_remaining gauge")
+            for (account, search_type), rem in sorted(self.remaining.items()):
+                lines.append("twittercrawler_remaining%s %s"
+                             % (_labels(account=account,
+                                        search_type=search_type), rem))
+            lines.append("# TYPE twittercrawler_key_tweets_total counter")
+            for key, num in self.key_tweets.items():
+                lines.append("twittercrawler_key_tweets_total%s %s"
+                             % (_labels(key=key), num))
+            lines.append("# TYPE twittercrawler_key_tweets_per_minute gauge")
+            for key in self.key_tweets:
+                lines.append("twittercrawler_key_tweets_per_minute%s %s"
+                             % (_labels(key=key),
+                                self.tweets_per_minute(key, now)))
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """json_fileとprom_fileに書き出す（一時ファイルから置き換える）."""
+        outputs = []
+        if self.json_file is not None:
+            outputs.append((self.json_file,
+                            json.dumps(self.snapshot(), ensure_ascii=False,
+                                       indent=1)))
+        if self.prom_file is not None:
+            outputs.append((self.prom_file, self.to_prometheus()))
+        for path, text in outputs:
+            dirname = os.path.dirname(path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+
+    def start(self):
+        """定期的な書き出しのスレッドと，portを指定した場合はHTTPサーバを起動する."""
+        if (self.writer is None) and \
+           ((self.json_file is not None) or (self.prom_file is not None)):
+            self.stop_event.clear()
+            self.writer = threading.Thread(target=self._write_loop,
+                                           name="metrics-writer",
+                                           daemon=True)
+            self.writer.start()
+        if (self.server is None) and (self.port is not None):
+            metrics = self
+
+            class MetricsHandler(http.server.BaseHTTPRequestHandler):
+                def log_message(self, format, *args):
+                    return
+
+                def do_GET(self):
+                    if self.path == "/metrics.json":
+                        body = json.dumps(metrics.snapshot(),
+                                          ensure_ascii=False)
+                        content_type = "application/json; charset=utf-8"
+                    elif self.path == "/metrics":
+                        body = metrics.to_prometheus()
+                        content_type = "text/plain; version=0.0.4"
+                    else:
+                        self.send_error(404)
+                        return
+                    body = body.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            self.server = ThreadingHTTPServer(("127.0.0.1", self.port),
+                                              MetricsHandler)
+            threading.Thread(target=self.server.serve_forever,
+                             name="metrics-http", daemon=True).start()
+            print("metrics on http://127.0.0.1:%s/metrics"
+                  % self.server.server_address[1])
+
+    def _write_loop(self):
+        """stop_eventがセットされるまでinterval秒ごとに書き出す."""
+        while not self.stop_event.wait(self.interval):
+            self.write()
+
+    def close(self):
+        """書き出しを止め，最後の値を書き出す．HTTPサーバも止める."""
+        self.stop_event.set()
+        if self.writer is not None:
+            self.writer.join()
+            self.writer = None
+        if (self.json_file is not None) or (self.prom_file is not None):
+            self.write()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,471 @@
+"""
+offline stand-in for the Twitter REST API v1.1.
+
+serves search/tweets, statuses/user_timeline, users/lookup and
+application/rate_limit_status with x-rate-limit-* headers, either from
+synthetic tweet streams or from recorded JSON.
+
+usage: python mockserver.py [--port 8080] [--window 900] [--rate 0.05]
+                            [--latency 0] [--error-rate 0] [--replay DIR]
+                            [--revoked TOKEN ...]
+
+then point the crawler at it:
+    TwitterCrawler("word", api_base="http://127.0.0.1:8080/1.1/")
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import argparse
+import email.utils
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import socketserver
+import threading
+import time
+import urllib.parse
+
+
+# snowflake形式のツイートidに含まれる時刻の起点(ms)
+TWEPOCH_MS = 1288834974657
+
+# エンドポイントごとの15分あたりの回数制限（ユーザ認証）
+RATE_LIMITS = {"/search/tweets": 180,
+               "/statuses/user_timeline": 900,
+               "/users/lookup": 900,
+               "/application/rate_limit_status": 180}
+# rate_limit_statusのresourcesでのグループ名
+RESOURCE_FAMILIES = {"/search/tweets": "search",
+                     "/statuses/user_timeline": "statuses",
+                     "/users/lookup": "users",
+                     "/application/rate_limit_status": "application"}
+
+
+def tw_time(sec):
+    """unix timeをTwitter APIの時刻文字列にする."""
+    return time.strftime("%a %b %d %H:%M:%S +0000 %Y", time.gmtime(sec))
+
+
+def key_hash(key):
+    """keyから決まる，実行ごとに変わらない整数."""
+    return int(hashlib.md5(str(key).encode("utf-8")).hexdigest()[:8], 16)
+
+
+class TweetStream:
+    """
+    1つのkeyについて，一定の頻度で投稿され続ける合成ツイートの列.
+
+    i番目のツイートは start + i / rate 秒に投稿され，idは投稿時刻から作るsnowflake形式.
+    idはiについて単調増加なので，max_id/since_idに対応する範囲を二分探索で求められる.
+
+    Attributes:
+        key (str or int): キーワードまたはユーザ
+        rate (float): 1秒あたりのツイート数
+        start (float): 0番目のツイートの投稿時刻(unix time)
+        worker (int): idのworker部分（keyごとに変える）
+    """
+
+    def __init__(self, key, rate, start):
+        """クラスコンストラクタ."""
+        self.key = key
+        self.rate = rate
+        self.start = start
+        self.worker = key_hash(key) & 0x3FF
+
+    def time_of(self, i):
+        """i番目のツイートの投稿時刻(ms)."""
+        return int((self.start + i / self.rate) * 1000)
+
+    def id_of(self, i):
+        """i番目のツイートのid."""
+        return (((self.time_of(i) - TWEPOCH_MS) << 22) |
+                (self.worker << 12) | (i & 0xFFF))
+
+    def latest_index(self, now):
+        """nowまでに投稿された最新のツイートの番号．まだなければ-1."""
+        return int((now - self.start) * self.rate)
+
+    def index_at_most(self, max_id, hi):
+        """idがmax_id以下である最大の番号．なければ-1."""
+        lo = -1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.id_of(mid) <= max_id:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def status(self, i, user=None):
+        """i番目のツイートのstatus."""
+        rng = random.Random(self.id_of(i))
+        if user is None:
+            uid = rng.randint(1, 5000)
+            user = make_user(uid, "user%s" % uid)
+        tw_id = self.id_of(i)
+        reply = rng.random() < 0.2
+        return {"created_at": tw_time(self.time_of(i) // 1000),
+                "id": tw_id,
+                "id_str": str(tw_id),
+                "text": "%s についてのツイート %s\nhttps://t.co/%08x"
+                        % (self.key, i, rng.getrandbits(32)),
+                "truncated": False,
+                "entities": {"hashtags": [], "symbols": [],
+                             "user_mentions": [], "urls": []},
+                "metadata": {"iso_language_code": "ja",
+                             "result_type": "recent"},
+                "source": '<a href="https://mobile.twitter.com" '
+                          'rel="nofollow">Twitter Web App</a>',
+                "in_reply_to_status_id": tw_id - 1 if reply else None,
+                "in_reply_to_status_id_str":
+                    str(tw_id - 1) if reply else None,
+                "in_reply_to_user_id": 1 if reply else None,
+                "in_reply_to_user_id_str": "1" if reply else None,
+                "in_reply_to_screen_name": "user1" if reply else None,
+                "user": user,
+                "geo": None, "coordinates": None, "place": None,
+                "contributors": None, "is_quote_status": False,
+                "retweet_count": rng.randint(0, 50),
+                "favorite_count": rng.randint(0, 200),
+                "favorited": False, "retweeted": False, "lang": "ja"}
+
+    def page(self, now, count, max_id=None, since_id=None, user=None):
+        """max_id/since_id/countに従い，新しい順にstatusのlistを返す."""
+        hi = self.latest_index(now)
+        if max_id is not None:
+            hi = self.index_at_most(max_id, hi)
+        statuses = []
+        i = hi
+        while (i >= 0) and (len(statuses) < count):
+            if (since_id is not None) and (self.id_of(i) <= since_id):
+                break
+            statuses.append(self.status(i, user))
+            i -= 1
+        return statuses
+
+
+def make_user(uid, screen_name, statuses_count=1000):
+    """合成ユーザのuserオブジェクト."""
+    rng = random.Random(uid)
+    return {"id": uid, "id_str": str(uid),
+            "name": "ユーザ%s" % uid, "screen_name": screen_name,
+            "location": "", "description": "自己紹介です\n%s" % uid,
+            "url": None, "entities": {"description": {"urls": []}},
+            "protected": False,
+            "followers_count": rng.randint(0, 10000),
+            "friends_count": rng.randint(0, 2000),
+            "listed_count": 0,
+            "created_at": tw_time(1262304000 + rng.randint(0, 10 ** 8)),
+            "favourites_count": rng.randint(0, 5000),
+            "verified": False, "statuses_count": statuses_count,
+            "lang": None,
+            "profile_image_url": "http://pbs.twimg.com/profile_images/"
+                                 "%s/normal.jpg" % uid,
+            "profile_banner_url": "https://pbs.twimg.com/profile_banners/"
+                                  "%s/1" % uid}
+
+
+class MockTwitter:
+    """
+    モックサーバの状態．合成ツイートの列，記録したレスポンス，回数制限を持つ.
+
+    Attributes:
+        window (int): 回数制限の窓の長さ(秒)
+        rate (float): 合成ツイートの1秒あたりの平均ツイート数
+        history (int): 合成ツイートを何秒前から投稿されていたことにするか
+        latency (float): 1リクエストごとに待つ秒数
+        error_rate (float): 503を返す確率
+        replay_dir (str): 記録したレスポンスのディレクトリ
+        revoked (set): 401を返すアカウント(アクセストークン)
+        streams (dict): keyごとのTweetStream
+        budgets (dict): (アカウント, エンドポイント)ごとの[残機, リセット時刻]
+        lock (threading.Lock): streamsとbudgetsを守るロック
+    """
+
+    def __init__(self, window=900, rate=0.05, history=7 * 86400,
+                 latency=0.0, error_rate=0.0, replay_dir=None, seed=0,
+                 revoked=()):
+        """クラスコンストラクタ."""
+        self.window = window
+        self.rate = rate
+        self.history = history
+        self.latency = latency
+        self.error_rate = error_rate
+        self.replay_dir = replay_dir
+        self.revoked = set(revoked)
+        self.start = time.time() - history
+        self.streams = {}
+        self.replays = {}
+        self.budgets = {}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def stream(self, key):
+        """keyのTweetStream．ツイートの頻度はkeyごとに0.1倍〜10倍でばらつかせる."""
+        with self.lock:
+            if key not in self.streams:
+                scale = 10 ** ((key_hash(key) % 2001) / 1000.0 - 1.0)
+                self.streams[key] = TweetStream(key, self.rate * scale,
+                                                self.start)
+            return self.streams[key]
+
+    def replay(self, endpoint, key):
+        """
+        記録したstatusのlist(新しい順)．なければNone.
+
+        replay_dir/<search|user_timeline>/<URLエンコードしたkey>.json に，
+        statusのlistかsearch/tweetsのレスポンスを置く.
+        """
+        if self.replay_dir is None:
+            return None
+        name = "search" if endpoint == "/search/tweets" else "user_timeline"
+        path = os.path.join(self.replay_dir, name,
+                            urllib.parse.quote(str(key), safe="") + ".json")
+        with self.lock:
+            if path not in self.replays:
+                statuses = None
+                if os.path.exists(path):
+                    with open(path, encoding="utf-8") as f:
+                        content = json.load(f)
+                    if isinstance(content, dict):
+                        content = content["statuses"]
+                    statuses = sorted(content, key=lambda st: -int(st["id"]))
+                self.replays[path] = statuses
+            return self.replays[path]
+
+    def take_budget(self, account, endpoint):
+        """
+        回数制限の残機を1つ使う.
+
+        Return:
+            ok (bool): 使えたか否か
+            limit (int): 窓あたりの回数
+            remaining (int): 残機
+            reset (int): リセット時刻
+        """
+        limit = RATE_LIMITS[endpoint]
+        now = time.time()
+        with self.lock:
+            budget = self.budgets.get((account, endpoint))
+            if (budget is None) or (budget[1] <= now):
+                budget = [limit, int(now) + self.window]
+                self.budgets[(account, endpoint)] = budget
+            if budget[0] <= 0:
+                return False, limit, 0, budget[1]
+            budget[0] -= 1
+            return True, limit, budget[0], budget[1]
+
+    def peek_budget(self, account, endpoint):
+        """残機を使わずに(残機, リセット時刻)を返す."""
+        now = time.time()
+        with self.lock:
+            budget = self.budgets.get((account, endpoint))
+            if (budget is None) or (budget[1] <= now):
+                return RATE_LIMITS[endpoint], int(now) + self.window
+            return budget[0], budget[1]
+
+    def handle(self, endpoint, params, account):
+        """
+        1リクエストを処理する.
+
+        Return:
+            status_code (int): HTTPステータス
+            body: レスポンスのJSONにするオブジェクト
+            headers (dict): 追加するヘッダ
+        """
+        if endpoint not in RATE_LIMITS:
+            return 404, {"errors": [{"code": 34,
+                                     "message": "Sorry, that page does "
+                                                "not exist."}]}, {}
+
+        if self.latency:
+            time.sleep(self.latency)
+        if account in self.revoked:
+            return 401, {"errors": [{"code": 89, "message":
+                                     "Invalid or expired token."}]}, {}
+
+        ok, limit, remaining, reset = self.take_budget(account, endpoint)
+        headers = {"x-rate-limit-limit": str(limit),
+                   "x-rate-limit-remaining": str(remaining),
+                   "x-rate-limit-reset": str(reset)}
+        if not ok:
+            return 429, {"errors": [{"code": 88, "message":
+                                     "Rate limit exceeded"}]}, headers
+        if self.error_rate and (self.rng.random() < self.error_rate):
+            return 503, {"errors": [{"code": 130, "message":
+                                     "Over capacity"}]}, headers
+
+        if endpoint == "/application/rate_limit_status":
+            return 200, self.rate_limit_status(account), headers
+        if endpoint == "/users/lookup":
+            return 200, self.users_lookup(params), headers
+
+        if endpoint == "/search/tweets":
+            key = params.get("q")
+            max_count = 100
+        else:
+            key = params.get("screen_name") or int(params.get("user_id", 0))
+            max_count = 200
+        count = min(int(params.get("count", 15 if max_count == 100
+                                   else 20)), max_count)
+        max_id = int(params["max_id"]) if "max_id" in params else None
+        since_id = int(params["since_id"]) if "since_id" in params else None
+
+        statuses = self.replay(endpoint, key)
+        if statuses is not None:
+            page = [st for st in statuses
+                    if ((max_id is None) or (int(st["id"]) <= max_id)) and
+                       ((since_id is None) or (int(st["id"]) > since_id))]
+            page = page[:count]
+        elif endpoint == "/search/tweets":
+            page = self.stream(key).page(time.time(), count,
+                                         max_id, since_id)
+        else:
+            uid = key if isinstance(key, int) else key_hash(key)
+            user = make_user(uid, str(key))
+            page = self.stream(key).page(time.time(), count,
+                                         max_id, since_id, user)
+
+        if endpoint == "/search/tweets":
+            body = {"statuses": page,
+                    "search_metadata": {"count": count, "query": key}}
+            return 200, body, headers
+        return 200, page, headers
+
+    def rate_limit_status(self, account):
+        """application/rate_limit_statusのレスポンス."""
+        resources = {}
+        for endpoint, family in RESOURCE_FAMILIES.items():
+            remaining, reset = self.peek_budget(account, endpoint)
+            resources.setdefault(family, {})[endpoint] = {
+                "limit": RATE_LIMITS[endpoint],
+                "remaining": remaining,
+                "reset": reset}
+        return {"rate_limit_context": {"access_token": account},
+                "resources": resources}
+
+    def users_lookup(self, params):
+        """users/lookupのレスポンス．各ユーザの最新ツイートをstatusに入れる."""
+        keys = []
+        if params.get("screen_name"):
+            keys += params["screen_name"].split(",")
+        if params.get("user_id"):
+            keys += [int(uid) for uid in params["user_id"].split(",")]
+        users = []
+        now = time.time()
+        for key in keys[:100]:
+            uid = key if isinstance(key, int) else key_hash(key)
+            stream = self.stream(key)
+            latest = stream.latest_index(now)
+            user = make_user(uid, str(key), statuses_count=latest + 1)
+            if latest >= 0:
+                user["status"] = {"id": stream.id_of(latest),
+                                  "id_str": str(stream.id_of(latest)),
+                                  "created_at":
+                                      tw_time(stream.time_of(latest) // 1000)}
+            users.append(user)
+        return users
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                          http.server.HTTPServer):
+    """リクエストごとにスレッドを立てるHTTPサーバ（Python 3.6にはhttp.serverのものがない）."""
+
+    daemon_threads = True
+
+
+class MockHandler(http.server.BaseHTTPRequestHandler):
+    """MockTwitterにリクエストを渡すハンドラ."""
+
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def log_message(self, format, *args):
+        """アクセスログは出さない."""
+        return
+
+    def do_GET(self):
+        """GETリクエストを処理する."""
+        parsed = urllib.parse.urlsplit(self.path)
+        endpoint = re.sub(r"^/1\.1", "", parsed.path)
+        endpoint = re.sub(r"\.json$", "", endpoint)
+        params = dict(urllib.parse.parse_qsl(parsed.query))
+        # OAuthのアクセストークンでアカウントを見分ける
+        auth = self.headers.get("Authorization", "")
+        match = re.search(r'oauth_token="([^"]*)"', auth)
+        account = match.group(1) if match else self.client_address[0]
+
+        status_code, body, headers = self.mock.handle(endpoint, params,
+                                                      account)
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Date", email.utils.formatdate(usegmt=True))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_POST = do_GET
+
+
+def start_server(port=0, host="127.0.0.1", **kwargs):
+    """
+    モックサーバを別スレッドで起動する.
+
+    Args:
+        port (int): ポート番号．0なら空いているポート
+        host (str): 待ち受けるアドレス
+        kwargs: MockTwitterに渡す引数
+
+    Return:
+        server (ThreadingHTTPServer): 起動したサーバ（shutdown()で止める）
+        api_base (str): TwitterAPI/TwitterCrawlerのapi_baseに渡すURL
+    """
+    handler = type("BoundMockHandler", (MockHandler,),
+                   {"mock": MockTwitter(**kwargs)})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True,
+                              name="mockserver")
+    thread.start()
+    api_base = "http://%s:%s/1.1/" % (host, server.server_address[1])
+    return server, api_base
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--window", type=int, default=900,
+                        help="rate limit window in seconds")
+    parser.add_argument("--rate", type=float, default=0.05,
+                        help="mean synthetic tweets per second per key")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds to wait before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="probability of answering 503")
+    parser.add_argument("--replay", default=None,
+                        help="directory with recorded statuses")
+    parser.add_argument("--revoked", nargs="*", default=(),
+                        help="access tokens answered with 401")
+    args = parser.parse_args()
+
+    handler = type("BoundMockHandler", (MockHandler,),
+                   {"mock": MockTwitter(window=args.window, rate=args.rate,
+                                        latency=args.latency,
+                                        error_rate=args.error_rate,
+                                        replay_dir=args.replay,
+                                        revoked=args.revoked)})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print("mock twitter api on http://%s:%s/1.1/" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
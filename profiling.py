@@ -0,0 +1,262 @@
+"""
+stage timers for TwitterAPI.search and per-lap profile dumps.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import collections
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+
+
+# TwitterAPI.searchの段階．http: APIを叩く, decode: JSONの解析,
+# process: process_contentと振り分け, sink: csv・データベースへの書き込み,
+# status: レスポンスヘッダからの残機の更新
+STAGES = ("http", "decode", "process", "sink", "status")
+# 一番時間のかかった段階から，何がボトルネックかを言う
+BOUND_BY = {"http": "network-bound", "decode": "parse-bound",
+            "process": "parse-bound", "sink": "disk-bound",
+            "status": "parse-bound"}
+# 待っているだけのスレッドの一番内側のフレーム(ファイル名, 関数名)．サンプリングで数えない
+# （Event.wait・Thread.join・Queue.get・select()での待ち，タスク待ちのスレッドプール）
+IDLE_FRAMES = frozenset([("threading.py", "wait"),
+                         ("threading.py", "_wait_for_tstate_lock"),
+                         ("queue.py", "get"),
+                         ("selectors.py", "select"),
+                         ("socketserver.py", "serve_forever"),
+                         ("thread.py", "_worker")])
+
+
+class StageProfiler:
+    """
+    段階ごとの所要時間を集計するフック.
+
+    TwitterAPI.add_profiler()で登録すると，searchの各段階が終わるたびにrecord()が呼ばれる.
+    record(account, stage, seconds)を持つオブジェクトなら何でもフックにできる.
+
+    Attributes:
+        stages (dict): 段階ごとの[回数, 合計秒, 最大秒]
+        accounts (dict): (アカウント, 段階)ごとの合計秒
+        lock (threading.Lock): 集計値を守るロック
+    """
+
+    def __init__(self):
+        """クラスコンストラクタ."""
+        self.stages = {}
+        self.accounts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def record(self, account, stage, seconds):
+        """
+        1つの段階の所要時間を記録する.
+
+        Args:
+            account (str): アカウント名
+            stage (str): 段階の名前（STAGESのいずれか）
+            seconds (float): 所要時間(秒)
+        """
+        with self.lock:
+            stat = self.stages.get(stage)
+            if stat is None:
+                stat = [0, 0.0, 0.0]
+                self.stages[stage] = stat
+            stat[0] += 1
+            stat[1] += seconds
+            if seconds > stat[2]:
+                stat[2] = seconds
+            self.accounts[(account, stage)] += seconds
+
+    def reset(self):
+        """
+        集計値を返して空にする.
+
+        Return:
+            stages (dict): 段階ごとの[回数, 合計秒, 最大秒]
+        """
+        with self.lock:
+            stages = self.stages
+            self.stages = {}
+            self.accounts = collections.Counter()
+        return stages
+
+    def report(self, stages=None):
+        """
+        段階ごとの所要時間の表と，どこがボトルネックかを文字列にする.
+
+        Args:
+            stages (dict): reset()の返り値．Noneなら現在の集計値
+
+        Return:
+            text (str): 表示する内容
+        """
+        if stages is None:
+            with self.lock:
+                stages = {stage: list(stat)
+                          for stage, stat in self.stages.items()}
+        total = sum(stat[1] for stat in stages.values())
+        if total == 0:
+            return "no search calls profiled."
+        lines = ["%-8s %8s %10s %10s %10s %6s"
+                 % ("stage", "calls", "total(s)", "mean(ms)", "max(ms)",
+                    "share")]
+        order = [stage for stage in STAGES if stage in stages] + \
+                sorted(stage for stage in stages if stage not in STAGES)
+        for stage in order:
+            count, sec, max_sec = stages[stage]
+            lines.append("%-8s %8d %10.3f %10.2f %10.2f %5.1f%%"
+                         % (stage, count, sec, sec / count * 1000,
+                            max_sec * 1000, sec / total * 100))
+        slowest = max(order, key=lambda stage: stages[stage][1])
+        lines.append("mostly %s (%s)" % (BOUND_BY.get(slowest, slowest),
+                                         slowest))
+        return "\n".join(lines)
+
+
+class CProfileLap:
+    """
+    lapごとにcProfileを取り，pstatsのファイルに書き出す.
+
+    cProfileは有効にしたスレッドしか計らないため，並行クロールではSamplingProfilerを使う.
+
+    Attributes:
+        saving_dir (str): 出力先のディレクトリ
+        profile (cProfile.Profile): 計測中のプロファイル
+    """
+
+    def __init__(self, saving_dir="./results/"):
+        """クラスコンストラクタ."""
+        self.saving_dir = saving_dir
+        self.profile = None
+
+    def start(self):
+        """計測を始める."""
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def dump(self, lap_num, top=15):
+        """
+        計測を止めて profile_lap<lap_num>.prof に書き出し，次のlapの計測を始める.
+
+        Args:
+            lap_num (int): lapの番号
+            top (int): 表示する関数の数（累積時間の順）
+
+        Return:
+            path (str): 書き出したファイル
+        """
+        self.profile.disable()
+        os.makedirs(self.saving_dir, exist_ok=True)
+        path = os.path.join(self.saving_dir, "profile_lap%s.prof" % lap_num)
+        self.profile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out) \
+              .sort_stats("cumulative").print_stats(top)
+        print(out.getvalue())
+        self.start()
+        return path
+
+    def stop(self):
+        """計測を止める."""
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile = None
+
+
+class SamplingProfiler:
+    """
+    全スレッドのスタックを一定間隔で覗き，関数ごとの出現回数を数える.
+
+    lapごとに，flamegraph.pl等で読めるcollapsed stack形式("a;b;c 回数")で書き出す.
+    一番内側のフレームがidle_framesのいずれかのスレッド（待っているだけのもの）は数えない.
+
+    Attributes:
+        saving_dir (str): 出力先のディレクトリ
+        interval (float): サンプリングの間隔(秒)
+        idle_frames (frozenset): 数えない一番内側のフレームの(ファイル名, 関数名)
+        stacks (collections.Counter): スタックごとの出現回数
+        lock (threading.Lock): stacksを守るロック
+    """
+
+    def __init__(self, saving_dir="./results/", interval=0.005,
+                 idle_frames=IDLE_FRAMES):
+        """クラスコンストラクタ."""
+        self.saving_dir = saving_dir
+        self.interval = interval
+        self.idle_frames = idle_frames
+        self.stacks = collections.Counter()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """サンプリングのスレッドを起動する."""
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._sample_loop,
+                                       name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def _sample_loop(self):
+        """stop_eventがセットされるまでサンプリングする."""
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, frame in frames.items():
+                if (thread_id == own_id) or \
+                   ((os.path.basename(frame.f_code.co_filename),
+                     frame.f_code.co_name) in self.idle_frames):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("%s:%s" % (os.path.basename(code.co_filename),
+                                            code.co_name))
+                    frame = frame.f_back
+                samples.append(";".join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(samples)
+
+    def dump(self, lap_num, top=15):
+        """
+        profile_lap<lap_num>.txt に書き出し，サンプルを空にする.
+
+        Args:
+            lap_num (int): lapの番号
+            top (int): 表示する関数の数（自身が実行中だった回数の順）
+
+        Return:
+            path (str): 書き出したファイル
+        """
+        with self.lock:
+            stacks = self.stacks
+            self.stacks = collections.Counter()
+        os.makedirs(self.saving_dir, exist_ok=True)
+        path = os.path.join(self.saving_dir, "profile_lap%s.txt" % lap_num)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, num in stacks.most_common():
+                f.write("%s %s\n" % (stack, num))
+        leaves = collections.Counter()
+        for stack, num in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += num
+        total = sum(leaves.values())
+        if total == 0:
+            print("no busy threads sampled.")
+        for func, num in leaves.most_common(top):
+            print("%6.1f%% %s" % (num / total * 100, func))
+        return path
+
+    def stop(self):
+        """サンプリングを止める."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,428 @@
+"""
+writes crawled tweets to files in batches.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import collections
+import csv
+import io
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# csvに出力する列（TwitterAPI.write_tweet_to_csvの行と同じ並び）
+CSV_HEADER = ["key", "id", "time", "user_id",
+              "user_screen_name", "user_name", "user_created_at",
+              "user_followers_count", "user_friends_count",
+              "user_favourites_count", "user_statuses_count",
+              "user_description", "user_profile_banner_url",
+              "user_profile_image_url", "in_reply_to_status_id_str",
+              "in_reply_to_user_id_str", "tweet_text",
+              "retweet_count", "favorite_count", "source"]
+
+# parquetに出力する際の列の型（列名と並びはCSV_HEADERと同じ）
+PARQUET_TYPES = {"key": "string", "id": "int64", "time": "timestamp",
+                 "user_id": "int64", "user_created_at": "timestamp",
+                 "user_followers_count": "int64", "user_friends_count": "int64",
+                 "user_favourites_count": "int64",
+                 "user_statuses_count": "int64",
+                 "retweet_count": "int64", "favorite_count": "int64"}
+
+
+class CsvSink:
+    """
+    ツイートの行をファイルごとにバッファし，まとめてcsvに書き出す.
+
+    開いたファイルはLRUで保持し，ツイートごとにopen/existsを呼ばないようにする.
+    複数のTwitterAPIインスタンス（複数スレッド）で1つのインスタンスを共有してよい.
+
+    Attributes:
+        max_open_files (int): 同時に開いておくファイル数の上限
+        max_buffered_rows (int): バッファする行数の上限．超えたら書き出す
+        handles (OrderedDict): ファイルパスをkeyとした，開いているファイル（LRU順）
+        buffers (dict): ファイルパスをkeyとした，書き出し待ちの行のlist
+        buffered_rows (int): 書き出し待ちの行数
+        header_written (set): ヘッダがすでに書かれているファイルパス
+        lock (threading.Lock): バッファとファイルを守るロック
+    """
+
+    def __init__(self, max_open_files=32, max_buffered_rows=5000):
+        """
+        クラスコンストラクタ.
+
+        Args:
+            max_open_files (int): 同時に開いておくファイル数の上限
+            max_buffered_rows (int): バッファする行数の上限．0なら追加のたびに書き出す
+        """
+        self.max_open_files = max_open_files
+        self.max_buffered_rows = max_buffered_rows
+        self.handles = collections.OrderedDict()
+        self.buffers = {}
+        self.buffered_rows = 0
+        self.header_written = set()
+        self.lock = threading.Lock()
+
+    def append(self, path, rows):
+        """
+        行をバッファに追加する．上限を超えたら全ファイルを書き出す.
+
+        Args:
+            path (str): 出力先のcsvファイルのパス
+            rows (list): CSV_HEADERの並びの行のlist
+        """
+        with self.lock:
+            self.buffers.setdefault(path, []).extend(rows)
+            self.buffered_rows += len(rows)
+            if self.buffered_rows > self.max_buffered_rows:
+                self._flush()
+
+    def flush(self):
+        """バッファされた行を全て書き出す."""
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        """バッファされた行を書き出し，全てのファイルを閉じる."""
+        with self.lock:
+            self._flush()
+            for f in self.handles.values():
+                f.close()
+            self.handles.clear()
+
+    def _flush(self):
+        """ロックを取得した状態で，ファイルごとに1回のwriteで書き出す."""
+        for path, rows in self.buffers.items():
+            if not rows:
+                continue
+            buf = io.StringIO()
+            writer = csv.writer(buf,
+                                delimiter=",",
+                                quotechar='"',
+                                lineterminator="\n",
+                                quoting=csv.QUOTE_ALL)
+            f = self._get_handle(path)
+            if path not in self.header_written:
+                writer.writerow(CSV_HEADER)
+                self.header_written.add(path)
+            writer.writerows(rows)
+            f.write(buf.getvalue())
+            f.flush()
+        self.buffers.clear()
+        self.buffered_rows = 0
+
+    def _get_handle(self, path):
+        """
+        ファイルを開いて返す．上限を超えたら最も昔に使ったファイルを閉じる.
+
+        Args:
+            path (str): csvファイルのパス
+
+        Return:
+            f: 追記モードで開いたファイル
+        """
+        if path in self.handles:
+            self.handles.move_to_end(path)
+            return self.handles[path]
+
+        if path not in self.header_written:
+            dirname = os.path.dirname(path)
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+            # 以前の実行で作られたファイルにはすでにヘッダがある
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                self.header_written.add(path)
+
+        f = open(path, "a")
+        self.handles[path] = f
+        while len(self.handles) > self.max_open_files:
+            _, old_f = self.handles.popitem(last=False)
+            old_f.close()
+        return f
+
+
+class ParquetSink:
+    """
+    ツイートの行を日付で分割し，圧縮したparquetに書き出す.
+
+    出力先は saving_dir/date=YYYYMMDD/part-*.parquet のhive形式で，書き出すたびに
+    日付ごとに1ファイルとなる（keyごとに分けると小さなファイルが大量にできるため）．
+    keyは列に含め，keyと時刻で並べて書くので，pandas.read_parquet(saving_dir,
+    filters=[("key", "=", key)])などで必要な列・分割・keyだけを読み込める.
+    CsvSinkと同じappend/flush/closeを持ち，TwitterAPI.sinkとして使える.
+    pyarrowが必要.
+
+    Attributes:
+        saving_dir (str): 出力先のディレクトリ
+        compression (str): parquetの圧縮形式
+        max_buffered_rows (int): バッファする行数の上限．超えたら書き出す
+        buffers (dict): 日付をkeyとした，書き出し待ちの行のlist
+        buffered_rows (int): 書き出し待ちの行数
+        part_num (int): 書き出したファイルの通し番号
+        lock (threading.Lock): バッファを守るロック
+    """
+
+    def __init__(self, saving_dir="./results/parquet/", compression="snappy",
+                 max_buffered_rows=50000):
+        """
+        クラスコンストラクタ.
+
+        Args:
+            saving_dir (str): 出力先のディレクトリ
+            compression (str): parquetの圧縮形式('snappy'/'zstd'/'gzip'など)
+            max_buffered_rows (int): バッファする行数の上限
+        """
+        if pa is None:
+            raise ImportError("ParquetSink requires pyarrow. "
+                              "Install it with `pip install pyarrow`.")
+        self.saving_dir = saving_dir
+        self.compression = compression
+        self.max_buffered_rows = max_buffered_rows
+        self.buffers = {}
+        self.buffered_rows = 0
+        self.part_num = 0
+        self.lock = threading.Lock()
+        self.schema = pa.schema([(name, self._arrow_type(name))
+                                 for name in CSV_HEADER])
+
+    def _arrow_type(self, name):
+        """列名に対応するpyarrowの型を返す."""
+        type_name = PARQUET_TYPES.get(name, "string")
+        if type_name == "int64":
+            return pa.int64()
+        elif type_name == "timestamp":
+            return pa.timestamp("s")
+        return pa.string()
+
+    def append(self, path, rows):
+        """
+        行をバッファに追加する．上限を超えたら全ての分割を書き出す.
+
+        Args:
+            path (str): csvで出力した場合のファイルパス（parquetでは使わない）
+            rows (list): CSV_HEADERの並びの行のlist
+        """
+        with self.lock:
+            for row in rows:
+                # row[2]は"YYYY-mm-dd HH:MM:SS"形式の投稿時刻
+                date = row[2][0:4] + row[2][5:7] + row[2][8:10]
+                self.buffers.setdefault(date, []).append(row)
+            self.buffered_rows += len(rows)
+            if self.buffered_rows > self.max_buffered_rows:
+                self._flush()
+
+    def flush(self):
+        """バッファされた行を全て書き出す."""
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        """バッファされた行を全て書き出す（開いたままのファイルはない）."""
+        self.flush()
+
+    def _flush(self):
+        """ロックを取得した状態で，日付ごとに1つのファイルとして書き出す."""
+        stamp = int(time.time())
+        for date, rows in self.buffers.items():
+            if not rows:
+                continue
+            part_dir = os.path.join(self.saving_dir, "date=%s" % date)
+            if not os.path.exists(part_dir):
+                os.makedirs(part_dir)
+
+            rows.sort(key=lambda row: (str(row[0]), row[2]))
+            columns = list(zip(*rows))
+            columns[0] = [str(key) for key in columns[0]]
+            arrays = []
+            for field, values in zip(self.schema, columns):
+                if pa.types.is_timestamp(field.type):
+                    arrays.append(pa.array(values).cast(field.type))
+                else:
+                    arrays.append(pa.array(values, type=field.type))
+            table = pa.Table.from_arrays(arrays, schema=self.schema)
+
+            self.part_num += 1
+            path = os.path.join(part_dir, "part-%s-%s-%05d.parquet"
+                                % (stamp, os.getpid(), self.part_num))
+            pq.write_table(table, path, compression=self.compression)
+        self.buffers.clear()
+        self.buffered_rows = 0
+
+
+class SqliteSink:
+    """
+    ツイートを組み込みのSQLiteデータベースに保存する.
+
+    ツイートidを主キーとしてINSERT OR REPLACEするため，複数のkeyで取得したツイートや
+    updateで再取得したツイートは重複しない（keyは最後に取得したkeyになる）.
+    (key, time)とuser_idに索引を張るので，期間やユーザでの絞り込みが速い.
+    行はバッファし，1つのトランザクションでまとめて書き込む.
+    複数スレッドから使ってよい.
+
+    Attributes:
+        db_file (str): データベースファイルのパス
+        max_buffered_rows (int): バッファする行数の上限．超えたら書き込む
+        conn (sqlite3.Connection): データベースへの接続
+        buffer (list): 書き込み待ちの行のlist
+        lock (threading.Lock): バッファと接続を守るロック
+    """
+
+    def __init__(self, db_file="./results/tweets.sqlite3",
+                 max_buffered_rows=5000):
+        """
+        クラスコンストラクタ. テーブルと索引がなければ作る.
+
+        Args:
+            db_file (str): データベースファイルのパス
+            max_buffered_rows (int): バッファする行数の上限
+        """
+        self.db_file = db_file
+        self.max_buffered_rows = max_buffered_rows
+        self.buffer = []
+        self.lock = threading.Lock()
+
+        dirname = os.path.dirname(db_file)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        columns = []
+        for name in CSV_HEADER:
+            if name == "id":
+                columns.append("id INTEGER PRIMARY KEY")
+            elif PARQUET_TYPES.get(name) == "int64":
+                columns.append("%s INTEGER" % name)
+            else:
+                columns.append("%s TEXT" % name)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS tweets (%s)"
+                              % ", ".join(columns))
+            self.conn.execute("CREATE INDEX IF NOT EXISTS tweets_key_time "
+                              "ON tweets (key, time)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS tweets_user_id "
+                              "ON tweets (user_id)")
+        self.insert_sql = ("INSERT OR REPLACE INTO tweets (%s) VALUES (%s)"
+                           % (", ".join(CSV_HEADER),
+                              ", ".join(["?"] * len(CSV_HEADER))))
+
+    def _format_time(self, value):
+        """datetimeなら"YYYY-mm-dd HH:MM:SS"の文字列にする."""
+        if hasattr(value, "strftime"):
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        return value
+
+    def append_tweets(self, all_tweets, key):
+        """
+        process_contentで加工したツイートをバッファに追加する．上限を超えたら書き込む.
+
+        Args:
+            all_tweets (twitterapi.TweetColumns): process_contentにより加工されたツイート群
+            key (str or int): 検索するキーワード/ユーザ（各行のkeyはall_tweets["key"]を使う）
+        """
+        rows = list(zip([str(k) for k in all_tweets["key"]],
+                        all_tweets["id"],
+                        [self._format_time(t) for t in all_tweets["time"]],
+                        all_tweets["user_id"], all_tweets["user_screen_name"],
+                        all_tweets["user_name"],
+                        [self._format_time(t)
+                         for t in all_tweets["user_created_at"]],
+                        all_tweets["user_followers_count"],
+                        all_tweets["user_friends_count"],
+                        all_tweets["user_favourites_count"],
+                        all_tweets["user_statuses_count"],
+                        all_tweets["user_description"],
+                        all_tweets["user_profile_banner_url"],
+                        all_tweets["user_profile_image_url"],
+                        all_tweets["in_reply_to_status_id_str"],
+                        all_tweets["in_reply_to_user_id_str"],
+                        all_tweets["text"], all_tweets["retweet_count"],
+                        all_tweets["favorite_count"], all_tweets["source"]))
+
+        with self.lock:
+            self.buffer.extend(rows)
+            if len(self.buffer) > self.max_buffered_rows:
+                self._flush()
+
+    def flush(self):
+        """バッファされた行を1つのトランザクションで書き込む."""
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        """バッファされた行を書き込み，接続を閉じる."""
+        with self.lock:
+            self._flush()
+            self.conn.close()
+
+    def _flush(self):
+        """ロックを取得した状態で書き込む."""
+        if not self.buffer:
+            return
+        with self.conn:
+            self.conn.executemany(self.insert_sql, self.buffer)
+        self.buffer = []
+
+
+class ResultBuffer:
+    """
+    crawl_onceの結果をchunkのまま貯めておき，出力時に一度だけ結合する.
+
+    毎回pd.concatで全体をコピーしないため，1回のクロールにかかるコストは貯めた量によらない.
+    複数スレッドから追加してよい.
+
+    Attributes:
+        chunks (list): 貯めているデータフレームのlist
+        num_rows (int): 貯めている行数
+        lock (threading.Lock): chunksを守るロック
+    """
+
+    def __init__(self):
+        """クラスコンストラクタ."""
+        self.chunks = []
+        self.num_rows = 0
+        self.lock = threading.Lock()
+
+    def append(self, df):
+        """
+        データフレームを追加する．空のものは捨てる.
+
+        Args:
+            df : crawl_onceが返したデータフレーム
+        """
+        if len(df) == 0:
+            return
+        with self.lock:
+            self.chunks.append(df)
+            self.num_rows += len(df)
+
+    def drain(self):
+        """
+        貯めたchunkを1つのデータフレームにして返し，バッファを空にする.
+
+        Return:
+            result_df : 貯めていた全ての行のデータフレーム
+        """
+        with self.lock:
+            chunks = self.chunks
+            self.chunks = []
+            self.num_rows = 0
+
+        if len(chunks) == 0:
+            return pd.DataFrame()
+        return pd.concat(chunks)
@@ -0,0 +1,64 @@
+"""
+shared fixtures: a mock twitter api and crawlers pointed at it.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mockserver  # noqa: E402
+import twittercrawler  # noqa: E402
+
+
+ACCOUNTS_CFG = """[acc1]
+screen_name = s1
+consumer_key = ck1
+consumer_secret = cs1
+access_key = at1
+access_secret = as1
+[acc2]
+screen_name = s2
+consumer_key = ck2
+consumer_secret = cs2
+access_key = at2
+access_secret = as2
+"""
+
+
+@pytest.fixture
+def mock_api():
+    """モックサーバを起動し，(MockTwitter, api_base)を返す."""
+    server, api_base = mockserver.start_server(port=0, rate=0.05)
+    yield server.RequestHandlerClass.mock, api_base
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def account_file(tmp_path):
+    """2アカウント分のaccounts.cfg."""
+    path = tmp_path / "accounts.cfg"
+    path.write_text(ACCOUNTS_CFG)
+    return str(path)
+
+
+@pytest.fixture
+def make_crawler(tmp_path, mock_api, account_file):
+    """モックサーバに向けたTwitterCrawlerを作る関数."""
+    _, api_base = mock_api
+
+    def make(search_type="word", keys=("k1", "k2"), **kwargs):
+        kwargs.setdefault("metadata_file", str(tmp_path / "meta.pkl"))
+        kwargs.setdefault("results_dir", str(tmp_path / "results"))
+        return twittercrawler.TwitterCrawler(
+            search_type, keys=list(keys), account_file=account_file,
+            api_base=api_base, **kwargs)
+    return make
@@ -0,0 +1,71 @@
+"""
+tests for the budget broker and its use from TwitterAPI.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import time
+
+import requests
+
+import budgetbroker
+import twitterapi
+
+
+def test_lease_one_at_a_time_until_remaining_is_known():
+    broker = budgetbroker.BudgetBroker()
+    assert broker.lease("acc", "word")["granted"]
+    assert not broker.lease("acc", "word")["granted"]
+
+    reset = int(time.time()) + 900
+    broker.report("acc", "word", 2, reset)
+    assert broker.lease("acc", "word")["granted"]
+    assert broker.lease("acc", "word")["granted"]
+    reply = broker.lease("acc", "word")
+    assert not reply["granted"]
+    assert reply["retry_at"] == reset + 2
+
+
+def test_expired_leases_are_dropped():
+    broker = budgetbroker.BudgetBroker(lease_timeout=0)
+    assert broker.lease("acc", "word")["granted"]
+    assert broker.lease("acc", "word")["granted"]
+
+
+def test_client_talks_to_broker_over_socket(tmp_path):
+    socket_path = str(tmp_path / "budget.sock")
+    server = budgetbroker.start_broker(socket_path)
+    client = budgetbroker.BudgetClient(socket_path)
+    try:
+        assert client.lease("acc", "user")["granted"]
+        reply = client.report("acc", "user", 5, int(time.time()) + 900)
+        assert reply["remaining"] == 5
+        assert client.request(op="status")["acc/user"]["leased"] == 0
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_client_without_broker_grants_everything(tmp_path):
+    client = budgetbroker.BudgetClient(str(tmp_path / "missing.sock"))
+    assert client.lease("acc", "word") == {"granted": True}
+    assert not client.available
+
+
+class ErrorBroker:
+    """終了中のブローカーのように，エラーの返答を返す."""
+
+    def lease(self, account, endpoint):
+        return {"error": "shutting down"}
+
+
+def test_lease_budget_falls_back_on_error_reply():
+    t_api = twitterapi.TwitterAPI("acc", requests.Session(),
+                                  search_type="word", bootstrap=False,
+                                  broker=ErrorBroker())
+    assert t_api.lease_budget()
+    assert t_api.get_wake_time("word") <= time.time()
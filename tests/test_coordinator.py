@@ -0,0 +1,58 @@
+"""
+tests for the sqlite lease store used for key-space sharding.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import time
+
+import pytest
+
+import coordinator
+
+
+def test_keys_are_shared_fairly(tmp_path):
+    db_file = str(tmp_path / "shard.sqlite3")
+    a = coordinator.LeaseStore(db_file, owner="a")
+    b = coordinator.LeaseStore(db_file, owner="b")
+    a.register(["k1", "k2", "k3", "k4"])
+
+    claimed_a = a.claim(a.fair_share())
+    claimed_b = b.claim(b.fair_share())
+    assert len(claimed_a) == len(claimed_b) == 2
+    assert not set(k for k, _ in claimed_a) & set(k for k, _ in claimed_b)
+    assert b.claim(1) == []
+
+
+def test_expired_lease_is_taken_over_with_its_status(tmp_path):
+    db_file = str(tmp_path / "shard.sqlite3")
+    dead = coordinator.LeaseStore(db_file, lease_sec=0.1, owner="dead")
+    alive = coordinator.LeaseStore(db_file, lease_sec=60, owner="alive")
+    dead.register(["k1", 42])
+    assert len(dead.claim(2)) == 2
+    dead.sync([("k1", {"max_tw_id": 10})])
+    assert alive.claim(2) == []
+
+    time.sleep(0.2)
+    claimed = dict(alive.claim(2))
+    assert claimed == {"k1": {"max_tw_id": 10}, 42: None}
+    assert dead.heartbeat() == set()
+    assert alive.heartbeat() == {"k1", 42}
+
+
+def test_failed_transaction_is_rolled_back(tmp_path):
+    db_file = str(tmp_path / "shard.sqlite3")
+    store = coordinator.LeaseStore(db_file, owner="a")
+    store.register(["k1"])
+    store.claim(1)
+    with pytest.raises(TypeError):
+        store.sync([("k1", {"max_tw_id": object()})])
+    assert not store.con.in_transaction
+
+    store.sync([("k1", {"max_tw_id": 10})])
+    store.release(["k1"])
+    assert store.claim(1) == [("k1", {"max_tw_id": 10})]
+    store.close()
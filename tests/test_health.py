@@ -0,0 +1,71 @@
+"""
+tests for the per-account circuit breaker.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import time
+
+import requests
+
+import health as hl
+import mockserver
+import twitterapi
+
+
+def test_breaker_opens_probes_and_closes():
+    health = hl.AccountHealth("acc", schedule=(0.05, 0.2))
+    health.record(503)
+    health.record(429)
+    assert health.get_state() == hl.CLOSED
+    for _ in range(hl.TRIP_THRESHOLDS["server"] - 1):
+        health.record(503)
+    assert health.get_state() == hl.OPEN
+    assert health.last_error == "503"
+    assert health.blocked_until() > time.time()
+
+    time.sleep(0.06)
+    assert health.get_state() == hl.HALF_OPEN
+    assert health.blocked_until() == 0
+    health.record(200)
+    assert health.get_state() == hl.CLOSED
+    assert health.retry_at == 0
+
+
+def test_failed_probe_reopens_with_the_next_delay():
+    health = hl.AccountHealth("acc", schedule=(0.05, 10))
+    for _ in range(hl.TRIP_THRESHOLDS["auth"]):
+        health.record(401)
+    assert health.get_state() == hl.OPEN
+    time.sleep(0.06)
+    assert health.get_state() == hl.HALF_OPEN
+
+    # half-openでの試しは1回失敗しただけで遮断し直す
+    health.record(401)
+    assert health.get_state() == hl.OPEN
+    assert health.retry_at - time.time() > 5
+    # 対象外のステータスは数えない
+    health.record(404)
+    assert health.failures["auth"] == 0
+
+
+def test_revoked_account_is_parked_by_the_breaker():
+    # 認証ヘッダがない場合，モックサーバは接続元のアドレスでアカウントを見分ける
+    server, api_base = mockserver.start_server(port=0,
+                                               revoked=["127.0.0.1"])
+    try:
+        t_api = twitterapi.TwitterAPI("acc", requests.Session(),
+                                      search_type="word", bootstrap=False,
+                                      api_base=api_base)
+        t_api.clientStatus["word"].update(remaining_count=10, reset_time=0)
+        for _ in range(hl.TRIP_THRESHOLDS["auth"]):
+            assert t_api.search("new", key="k1", verbose=False) is None
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert t_api.health.state == hl.OPEN
+    assert t_api.health.last_error == "401"
+    assert t_api.get_wake_time("word") >= t_api.health.retry_at > time.time()
@@ -0,0 +1,56 @@
+"""
+tests for HybridCrawler against the mock api.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import pytest
+
+import hybridcrawler
+
+
+def make_hybrid(tmp_path, mock_api, account_file, word_keys, user_keys):
+    _, api_base = mock_api
+    return hybridcrawler.HybridCrawler(
+        word_keys=word_keys, user_keys=user_keys, account_file=account_file,
+        api_base=api_base,
+        word_metadata_file=str(tmp_path / "meta_word.pkl"),
+        user_metadata_file=str(tmp_path / "meta_user.pkl"),
+        word_results_dir=str(tmp_path / "word"),
+        user_results_dir=str(tmp_path / "user"))
+
+
+def test_both_search_types_share_accounts(tmp_path, mock_api, account_file):
+    hybrid = make_hybrid(tmp_path, mock_api, account_file,
+                         ["w1", "w2"], ["u1", "u2"])
+    word, user = hybrid.crawlers["word"], hybrid.crawlers["user"]
+    assert user.accounts is word.accounts
+    # 残機・バックオフ・サーキットブレーカーはアカウントごとに1つ
+    for account in word.accounts:
+        user_api, word_api = user.twitterapis[account], word.twitterapis[account]
+        assert user_api.clientStatus is word_api.clientStatus
+        assert user_api.transport is word_api.transport
+        assert user_api.health is word_api.health
+
+    search_types = [hybrid.crawl_once()[0] for _ in range(4)]
+    # 残機のある検索タイプを交互に使う
+    assert search_types == ["word", "user", "word", "user"]
+    for crawler in (word, user):
+        assert any(crawler.keystatuses[k]["max_tw_id"] is not None
+                   for k in crawler.keys)
+    t_api = word.twitterapis[word.accounts[0]]
+    assert t_api.clientStatus["word"]["remaining_count"] < 180
+    assert t_api.clientStatus["user"]["remaining_count"] < 900
+    hybrid.close()
+
+
+def test_type_without_keys_is_skipped(tmp_path, mock_api, account_file):
+    hybrid = make_hybrid(tmp_path, mock_api, account_file, ["w1"], [])
+    assert [hybrid.crawl_once()[0] for _ in range(3)] == ["word"] * 3
+    hybrid.close()
+
+    with pytest.raises(ValueError):
+        make_hybrid(tmp_path, mock_api, account_file, [], [])
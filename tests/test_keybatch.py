@@ -0,0 +1,95 @@
+"""
+tests for packing low-volume keywords into OR queries.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import json
+
+import requests
+
+import keybatch
+import mockserver
+import twitterapi
+
+
+def test_make_batches_respects_query_length():
+    keywords = ["kw%02d" % i for i in range(30)]
+    batches = keybatch.make_batches(keywords, max_query_len=40)
+    assert [k for batch in batches for k in batch] == keywords
+    for batch in batches:
+        assert len(keybatch.build_query(batch)) <= 40
+    # 1つしか入らないキーワードはまとめない
+    assert keybatch.make_batches(["a" * 30, "b" * 30], 40) == []
+
+
+def test_match_keys_needs_every_term():
+    members = [(k, keybatch.key_terms(k))
+               for k in ["Apple", "big cat -dog", "lang:ja"]]
+    assert members[1][1] == ["big", "cat"]
+    assert keybatch.build_query(["Apple", "big cat -dog"]) == \
+        "Apple OR (big cat -dog)"
+    assert keybatch.match_keys("A BIG fat cat eats an apple", members) == \
+        ["Apple", "big cat -dog"]
+    assert keybatch.match_keys("a big dog", members) == []
+
+
+class PageSession:
+    """本文を指定したツイートを1ページ返すセッション."""
+
+    def __init__(self, texts):
+        stream = mockserver.TweetStream("q", 0.5, 1500000000)
+        self.statuses = [stream.status(i) for i in range(len(texts))][::-1]
+        for status, text in zip(self.statuses, texts):
+            status["text"] = text
+
+    def get(self, url, params=None, timeout=None):
+        ret = requests.Response()
+        ret.status_code = 200
+        ret._content = json.dumps({"statuses": self.statuses}).encode()
+        ret.headers["x-rate-limit-remaining"] = "179"
+        ret.headers["x-rate-limit-reset"] = "0"
+        return ret
+
+
+def test_search_demuxes_or_query_to_members():
+    query = "apple OR (big cat)"
+    session = PageSession(["apple pie", "a big fat cat with an apple",
+                           "nothing to see"])
+    t_api = twitterapi.TwitterAPI("acc", session, search_type="word",
+                                  write_to_csv=False, bootstrap=False)
+    t_api.clientStatus["word"].update(remaining_count=10, reset_time=0)
+    t_api.batch_members = [(k, keybatch.key_terms(k))
+                           for k in ["apple", "big cat"]]
+    all_tweets = t_api.search("new", key=query, verbose=False)
+
+    keys = sorted(zip(all_tweets["text"], all_tweets["key"]))
+    # 複数に一致したツイートは複製し，どれにも一致しなければクエリのまま
+    assert keys == [("a big fat cat with an apple", "apple"),
+                    ("a big fat cat with an apple", "big cat"),
+                    ("apple pie", "apple"),
+                    ("nothing to see", query)]
+    assert t_api.crawled_num == 3
+
+
+def test_crawler_batches_low_volume_keywords(make_crawler):
+    crawler = make_crawler(keys=("apple", "big cat", "busy"))
+    for k, max_tw_id, total in [("apple", 300, 5), ("big cat", 200, 5),
+                                ("busy", 400, 100000)]:
+        crawler.keystatuses[k].update(
+            max_tw_id=max_tw_id, min_tw_id=100, recent_min=100,
+            since_tw_id=100, last_updated_time=1000 + max_tw_id,
+            max_tw_time="2026-10-11 00:00:00",
+            min_tw_time="2026-10-01 00:00:00", total_crawled_num=total)
+    crawler.batchKeys(batch_threshold=1.0)
+
+    query = "apple OR (big cat)"
+    assert crawler.keys == ["busy", query]
+    assert crawler.key_batches == {query: ["apple", "big cat"]}
+    # 最も古いメンバーの続きから検索する
+    assert crawler.keystatuses[query]["max_tw_id"] == 200
+    assert crawler.keystatuses[query]["last_updated_time"] == 1200
+    assert query not in crawler.persistentKeyStatus()
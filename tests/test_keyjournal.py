@@ -0,0 +1,48 @@
+"""
+tests for the write-ahead journal of keystatuses.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import keyjournal
+
+
+def status(n):
+    return {"max_tw_id": n, "max_tw_time": None, "min_tw_id": 1,
+            "min_tw_time": None, "recent_min": 1, "since_tw_id": None,
+            "last_updated_time": None, "total_crawled_num": n}
+
+
+def test_load_applies_journal_after_snapshot(tmp_path):
+    journal = keyjournal.KeyStatusJournal(str(tmp_path / "meta.pkl"))
+    journal.compact({"a": status(1)})
+    journal.append("a", status(2))
+    journal.append("b", status(3))
+    journal.close()
+
+    loaded = keyjournal.KeyStatusJournal(str(tmp_path / "meta.pkl")).load()
+    assert loaded == {"a": status(2), "b": status(3)}
+
+
+def test_load_skips_torn_last_line(tmp_path):
+    journal = keyjournal.KeyStatusJournal(str(tmp_path / "meta.pkl"))
+    journal.append("a", status(1))
+    journal.close()
+    with open(journal.journal_file, "a") as f:
+        f.write('["a", {"max_tw_id": 2')
+
+    loaded = keyjournal.KeyStatusJournal(str(tmp_path / "meta.pkl")).load()
+    assert loaded == {"a": status(1)}
+
+
+def test_compact_empties_journal(tmp_path):
+    journal = keyjournal.KeyStatusJournal(str(tmp_path / "meta.pkl"))
+    journal.append("a", status(1))
+    journal.compact({"a": status(5)})
+    assert journal.num_records == 0
+    assert open(journal.journal_file).read() == ""
+    assert keyjournal.KeyStatusJournal(
+        str(tmp_path / "meta.pkl")).load() == {"a": status(5)}
@@ -0,0 +1,85 @@
+"""
+tests for the priority-queue key scheduler.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import keyscheduler
+
+
+def status(recent_min=None, since_tw_id=None, last_updated_time=None):
+    return {"max_tw_id": None, "max_tw_time": None, "min_tw_id": None,
+            "min_tw_time": None, "recent_min": recent_min,
+            "since_tw_id": since_tw_id,
+            "last_updated_time": last_updated_time, "total_crawled_num": 0}
+
+
+def test_pop_order_new_then_paging_then_oldest_update():
+    keystatuses = {"upd_new": status(10, 10, 200),
+                   "upd_old": status(10, 10, 100),
+                   "page_small": status(15, 10, 100),
+                   "page_large": status(50, 10, 100),
+                   "fresh": status()}
+    keys = ["upd_new", "upd_old", "page_small", "page_large", "fresh"]
+    scheduler = keyscheduler.KeyScheduler(keys, keystatuses)
+
+    popped = [scheduler.pop() for _ in keys]
+    assert popped == [("fresh", "new"), ("page_large", "paging"),
+                      ("page_small", "paging"), ("upd_old", "update"),
+                      ("upd_new", "update")]
+    assert scheduler.pop() == (None, None)
+
+
+def test_popped_key_is_not_selected_until_pushed():
+    keystatuses = {"a": status(), "b": status()}
+    scheduler = keyscheduler.KeyScheduler(["a", "b"], keystatuses)
+    assert scheduler.pop() == ("a", "new")
+    assert "a" not in scheduler
+    assert scheduler.pop() == ("b", "new")
+    assert scheduler.pop() == (None, None)
+
+    keystatuses["a"].update(status(10, 10, 100))
+    scheduler.push("a")
+    assert scheduler.pop() == ("a", "update")
+
+
+def test_deferred_key_waits_for_release():
+    keystatuses = {"a": status(10, 10, 100), "b": status(10, 10, 200)}
+    scheduler = keyscheduler.KeyScheduler(["a", "b"], keystatuses)
+    scheduler.defer("a")
+    assert "a" not in scheduler
+    assert scheduler.pop() == ("b", "update")
+    assert scheduler.pop() == (None, None)
+
+    assert scheduler.release_deferred() == 1
+    assert scheduler.pop() == ("a", "update")
+
+
+
+def test_adaptive_update_prefers_busy_keys():
+    busy = status(10, 10, 100)
+    # 600秒で1000件
+    busy.update({"max_tw_id": (10 ** 7 + 600000) << 22,
+                 "min_tw_id": 10 ** 7 << 22, "total_crawled_num": 1000})
+    quiet = status(10, 10, 50)
+    keystatuses = {"quiet": quiet, "busy": busy}
+    scheduler = keyscheduler.KeyScheduler(["quiet", "busy"], keystatuses,
+                                          target_yield=50,
+                                          max_staleness=3600)
+    assert scheduler.pop() == ("busy", "update")
+
+
+def test_adaptive_update_waits_at_most_max_staleness():
+    slow = status(10, 10, 100)
+    # 1日で1件
+    slow.update({"max_tw_id": (10 ** 7 + 86400000) << 22,
+                 "min_tw_id": 10 ** 7 << 22, "total_crawled_num": 1})
+    scheduler = keyscheduler.KeyScheduler(["slow"], {"slow": slow},
+                                          target_yield=50,
+                                          max_staleness=3600)
+    assert scheduler.due_time(slow) == 100 + 3600
+    # 見積もれないkeyもmax_staleness秒後には順番が来る
+    assert scheduler.due_time(status(10, 10, 100)) == 100 + 3600
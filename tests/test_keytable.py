@@ -0,0 +1,53 @@
+"""
+tests for the compact column-backed key status table.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import keytable
+
+
+def status(max_tw_id=None, max_tw_time=None, total=0):
+    return {"max_tw_id": max_tw_id, "max_tw_time": max_tw_time,
+            "min_tw_id": None, "min_tw_time": None, "recent_min": None,
+            "since_tw_id": None, "last_updated_time": None,
+            "total_crawled_num": total}
+
+
+def test_rows_read_and_write_like_dicts():
+    table = keytable.KeyStatusTable(["a"], capacity=1)
+    table["a"]["max_tw_id"] = 2 ** 62
+    table["a"]["max_tw_time"] = "2026-10-17 12:34:56"
+    # 行数が足りなくなったら広げる
+    for i in range(10):
+        table[i] = status(total=i)
+    assert len(table) == 11
+    assert table["a"] == status(2 ** 62, "2026-10-17 12:34:56")
+    assert dict(table[9]) == status(total=9)
+    assert table.keys() == ["a"] + list(range(10))
+    assert table.to_dict()["a"]["min_tw_id"] is None
+
+
+def test_save_and_load_round_trip(tmp_path):
+    keystatuses = {"キーワード": status(123, "2026-01-02 03:04:05", 7),
+                   42: status()}
+    table = keytable.KeyStatusTable.from_dict(keystatuses)
+    path = str(tmp_path / "keystatus.npz")
+    table.save(path)
+    loaded = keytable.KeyStatusTable.load(path)
+    assert loaded.to_dict() == keystatuses
+    loaded.add("new")
+    assert loaded["new"]["total_crawled_num"] == 0
+
+
+def test_crawler_persists_compact_table(make_crawler):
+    crawler = make_crawler(compact_keystatus=True)
+    assert isinstance(crawler.keystatuses, keytable.KeyStatusTable)
+    crawler.keystatuses["k1"].update(status(500, "2026-10-17 00:00:00", 3))
+    crawler.save_keystatus()
+
+    resumed = make_crawler(compact_keystatus=True)
+    assert resumed.keystatuses["k1"] == status(500, "2026-10-17 00:00:00", 3)
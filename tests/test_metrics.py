@@ -0,0 +1,37 @@
+"""
+tests for the crawl metrics and their http endpoint.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import requests
+
+import metrics as mt
+
+
+def test_http_endpoint_serves_prometheus_and_json(tmp_path):
+    metrics = mt.Metrics(json_file=str(tmp_path / "metrics.json"),
+                         prom_file=None, interval=3600, port=0)
+    metrics.observe_request("acc1", "search", 0.2, 200)
+    metrics.observe_request("acc1", "search", 3.0, 503)
+    metrics.observe_tweets("k1", 7)
+    metrics.start()
+    try:
+        base = "http://127.0.0.1:%s" % metrics.server.server_address[1]
+        text = requests.get(base + "/metrics").text
+        snapshot = requests.get(base + "/metrics.json").json()
+        missing = requests.get(base + "/nothing").status_code
+    finally:
+        metrics.close()
+    assert ('twittercrawler_requests_total{account="acc1",'
+            'endpoint="search"} 2') in text
+    assert 'twittercrawler_errors_total{account="acc1",code="503"} 1' in text
+    assert ('twittercrawler_request_latency_seconds_count'
+            '{account="acc1"} 2') in text
+    assert snapshot["keys"]["k1"]["tweets"] == 7
+    assert missing == 404
+    assert metrics.server is None
+    assert (tmp_path / "metrics.json").exists()
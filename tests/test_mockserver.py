@@ -0,0 +1,53 @@
+"""
+tests for the mock twitter api server.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import threading
+import time
+
+import requests
+
+import mockserver
+
+
+def test_slow_requests_are_served_concurrently():
+    server, api_base = mockserver.start_server(port=0, latency=0.5)
+    try:
+        codes = []
+
+        def get(token):
+            ret = requests.get(
+                api_base + "search/tweets.json", params={"q": "k"},
+                headers={"Authorization": 'OAuth oauth_token="%s"' % token})
+            codes.append(ret.status_code)
+        threads = [threading.Thread(target=get, args=("at%s" % i,))
+                   for i in range(4)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert codes == [200] * 4
+    # 1つずつ処理すると2秒以上かかる
+    assert elapsed < 1.5
+
+
+def test_rate_limit_headers_count_down_per_account(mock_api):
+    mock, api_base = mock_api
+    remaining = []
+    for token in ("at1", "at1", "at2"):
+        ret = requests.get(
+            api_base + "search/tweets.json", params={"q": "k"},
+            headers={"Authorization": 'OAuth oauth_token="%s"' % token})
+        assert ret.status_code == 200
+        remaining.append(int(ret.headers["x-rate-limit-remaining"]))
+    assert remaining == [179, 178, 179]
@@ -0,0 +1,58 @@
+"""
+tests for the stage timers and per-lap profilers.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import threading
+import time
+
+import profiling
+
+
+def spin(stop_event):
+    """stop_eventがセットされるまでCPUを使い続ける."""
+    while not stop_event.is_set():
+        sum(range(1000))
+
+
+def test_sampling_profiler_skips_idle_threads(tmp_path):
+    stop_event = threading.Event()
+    threads = [threading.Thread(target=spin, args=(stop_event,)),
+               threading.Thread(target=stop_event.wait)]
+    for thread in threads:
+        thread.start()
+    profiler = profiling.SamplingProfiler(str(tmp_path), interval=0.001)
+    profiler.start()
+    time.sleep(0.3)
+    profiler.stop()
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+
+    path = profiler.dump(1)
+    with open(path, encoding="utf-8") as f:
+        leaves = [line.rsplit(" ", 1)[0].rsplit(";", 1)[-1] for line in f]
+    assert path.startswith(str(tmp_path))
+    assert "test_profiling.py:spin" in leaves
+    assert "threading.py:wait" not in leaves
+
+
+def test_lap_profilers_write_to_results_dir(make_crawler, tmp_path):
+    results_dir = str(tmp_path / "out")
+    for profile in ("cprofile", "sampling"):
+        crawler = make_crawler(profile=profile, results_dir=results_dir)
+        assert crawler.lap_profiler.saving_dir == results_dir
+
+
+def test_stage_report_names_the_bottleneck():
+    profiler = profiling.StageProfiler()
+    profiler.record("acc1", "http", 0.5)
+    profiler.record("acc1", "decode", 0.1)
+    profiler.record("acc2", "http", 0.3)
+    report = profiler.report(profiler.reset())
+    assert report.endswith("mostly network-bound (http)")
+    assert profiler.report() == "no search calls profiled."
@@ -0,0 +1,115 @@
+"""
+tests for the result sinks.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import csv
+import glob
+import os
+import sqlite3
+
+import pandas as pd
+import requests
+
+import sinks
+import twitterapi
+
+
+def make_row(key, tw_id, time_str):
+    """CSV_HEADERの並びの行."""
+    values = {"int64": 0, "timestamp": time_str}
+    row = [values.get(sinks.PARQUET_TYPES.get(name), "")
+           for name in sinks.CSV_HEADER]
+    row[0] = key
+    row[1] = tw_id
+    return row
+
+
+def test_parquet_writes_one_file_per_date_with_key_column(tmp_path):
+    saving_dir = str(tmp_path / "parquet")
+    sink = sinks.ParquetSink(saving_dir)
+    for lap in range(2):
+        for k in range(50):
+            key = "key%s" % k
+            sink.append(None, [
+                make_row(key, lap * 1000 + k, "2026-10-16 23:59:0%s" % lap),
+                make_row(key, lap * 1000 + k + 100,
+                         "2026-10-17 00:00:0%s" % lap)])
+        sink.flush()
+    sink.close()
+
+    files = sorted(os.path.relpath(path, saving_dir) for path in
+                   glob.glob(os.path.join(saving_dir, "**", "*.parquet"),
+                             recursive=True))
+    # 2日 × 2回の書き出し．keyごとのファイルは作らない
+    assert len(files) == 4
+    assert {os.path.dirname(path) for path in files} == \
+        {"date=20261016", "date=20261017"}
+
+    df = pd.read_parquet(saving_dir, filters=[("key", "=", "key7")])
+    assert sorted(df["id"]) == [7, 107, 1007, 1107]
+    assert set(df["key"]) == {"key7"}
+    assert len(pd.read_parquet(saving_dir)) == 200
+
+
+def read_csv_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_csv_sink_writes_header_once_across_reopens(tmp_path):
+    paths = [str(tmp_path / "out" / ("k%s.csv" % i)) for i in range(3)]
+    # 開いておけるのは1ファイルだけなので，書き出すたびに閉じて開き直す
+    sink = sinks.CsvSink(max_open_files=1, max_buffered_rows=0)
+    for lap in range(2):
+        for path in paths:
+            sink.append(path, [make_row("k", lap, "2026-10-17 00:00:00")])
+    sink.close()
+    # 以前の実行で作られたファイルにも追記だけする
+    sink = sinks.CsvSink()
+    sink.append(paths[0], [make_row("k", 2, "2026-10-17 00:00:00")])
+    sink.close()
+
+    rows = read_csv_rows(paths[0])
+    assert rows[0] == sinks.CSV_HEADER
+    assert [row[1] for row in rows[1:]] == ["0", "1", "2"]
+    assert len(read_csv_rows(paths[2])) == 3
+
+
+def test_result_buffer_drains_chunks_in_order():
+    result_buffer = sinks.ResultBuffer()
+    result_buffer.append(pd.DataFrame({"id": [1, 2]}))
+    result_buffer.append(pd.DataFrame({"id": []}))
+    result_buffer.append(pd.DataFrame({"id": [3]}))
+    assert result_buffer.num_rows == 3
+    assert list(result_buffer.drain()["id"]) == [1, 2, 3]
+    assert result_buffer.num_rows == 0
+    assert len(result_buffer.drain()) == 0
+
+
+def test_sqlite_storage_keeps_one_row_per_tweet(tmp_path, mock_api):
+    _, api_base = mock_api
+    db_file = str(tmp_path / "tweets.sqlite3")
+    storage = sinks.SqliteSink(db_file)
+    t_api = twitterapi.TwitterAPI("acc", requests.Session(),
+                                  search_type="word", api_base=api_base,
+                                  write_to_csv=False, storage=storage)
+    first = t_api.search("new", key="k1", verbose=False)
+    # 同じツイートを取り直しても重複しない
+    second = t_api.search("new", key="k1", verbose=False)
+    storage.close()
+
+    with sqlite3.connect(db_file) as conn:
+        count, keys = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT key) FROM tweets").fetchone()
+        latest = conn.execute(
+            "SELECT id FROM tweets WHERE key = 'k1' "
+            "ORDER BY time DESC, id DESC LIMIT 1").fetchone()[0]
+    assert count == len(set(first["id"]) | set(second["id"])) > 0
+    assert count < len(first) + len(second)
+    assert keys == 1
+    assert latest == max(second["id"])
@@ -0,0 +1,32 @@
+"""
+tests for tweet times decoded from snowflake ids.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import mockserver
+import twitterapi
+
+
+def test_snowflake_time_matches_created_at():
+    stream = mockserver.TweetStream("k", 0.37, 1500000000)
+    for i in range(0, 5000, 97):
+        status = stream.status(i)
+        assert twitterapi.snowflake_to_datetime(status["id"]) == \
+            twitterapi.parse_tw_time(status["created_at"])
+        assert twitterapi.snowflake_to_datetime(status["id_str"]) == \
+            twitterapi.parse_tw_time(status["created_at"])
+
+
+def test_pre_snowflake_ids_fall_back_to_created_at():
+    status = {"id": 20, "created_at": "Tue Mar 21 20:50:14 +0000 2006"}
+    assert twitterapi.snowflake_to_datetime(status["id"]) is None
+    t_api = twitterapi.TwitterAPI("acc", None, word="k", bootstrap=False)
+    # 日本時間にする
+    assert t_api.get_tweet_time(status).strftime("%Y-%m-%d %H:%M:%S") == \
+        "2006-03-22 05:50:14"
+    assert t_api.trans_time_obj_str(status["created_at"], "tw_time",
+                                    "YMD") == "20060322"
@@ -0,0 +1,113 @@
+"""
+tests for TwitterAPI against the mock api.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import socket
+import time
+
+import requests
+
+import health as hl
+import mockserver
+import twitterapi
+
+
+def closed_port():
+    """誰も待ち受けていないポート."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_refresh_on_unreachable_host_parks_and_opens_breaker():
+    api_base = "http://127.0.0.1:%s/1.1/" % closed_port()
+    t_api = twitterapi.TwitterAPI("acc", requests.Session(),
+                                  search_type="word", bootstrap=False,
+                                  api_base=api_base)
+    for _ in range(hl.TRIP_THRESHOLDS["network"]):
+        t_api.clientStatus["word"]["wake_time"] = 0
+        start = time.time()
+        assert not t_api.refresh_if_reset("word")
+        # その場で試し直し続けず，休ませて返る
+        assert time.time() - start < 5
+        assert t_api.get_wake_time("word") > time.time()
+
+    assert t_api.health.state == hl.OPEN
+    assert t_api.health.last_error == "ConnectionError"
+
+
+class HtmlErrorSession:
+    """ロードバランサのように，HTMLの本文で502を返すセッション."""
+
+    def get(self, url, params=None, timeout=None):
+        ret = requests.Response()
+        ret.status_code = 502
+        ret._content = b"<html><body>Bad Gateway</body></html>"
+        return ret
+
+
+def test_search_classifies_error_status_without_decoding():
+    t_api = twitterapi.TwitterAPI("acc", HtmlErrorSession(),
+                                  search_type="word", bootstrap=False)
+    t_api.clientStatus["word"].update(remaining_count=10, reset_time=0)
+    assert t_api.search("new", key="k1", verbose=False) is None
+    # 本文がJSONでなくても，通信エラーではなくサーバーエラーとしてバックオフする
+    assert t_api.transport.failures["server"] == 1
+    assert t_api.transport.failures["network"] == 0
+    assert t_api.health.failures["server"] == 1
+
+
+def test_search_collects_tweets_from_mock(mock_api):
+    _, api_base = mock_api
+    t_api = twitterapi.TwitterAPI("acc", requests.Session(),
+                                  search_type="word", api_base=api_base,
+                                  write_to_csv=False)
+    all_tweets = t_api.search("new", key="k1", verbose=False)
+    assert len(all_tweets) == t_api.crawled_num > 0
+    assert t_api.crawled_max >= t_api.crawled_min
+    assert t_api.clientStatus["word"]["remaining_count"] == 179
+
+
+def test_rate_limited_search_parks_instead_of_sleeping(mock_api):
+    mock, api_base = mock_api
+    reset = int(time.time()) + 60
+    # 認証ヘッダがない場合，モックサーバは接続元のアドレスでアカウントを見分ける
+    mock.budgets[("127.0.0.1", "/search/tweets")] = [0, reset]
+    t_api = twitterapi.TwitterAPI("acc", requests.Session(),
+                                  search_type="word", bootstrap=False,
+                                  api_base=api_base)
+    t_api.clientStatus["word"].update(remaining_count=10, reset_time=0)
+
+    start = time.time()
+    assert t_api.search("new", key="k1", verbose=False) is None
+    assert time.time() - start < 5
+    # レスポンスヘッダのリセット時刻まで休ませる
+    assert t_api.clientStatus["word"]["remaining_count"] == 0
+    assert t_api.get_wake_time("word") >= reset
+
+
+def test_process_content_columns_match_strip_status():
+    stream = mockserver.TweetStream("k1", 0.5, 1500000000)
+    statuses = [stream.status(i) for i in range(30, -1, -1)]
+    t_api = twitterapi.TwitterAPI("acc", None, word="k1", bootstrap=False)
+    (tw_ids, all_tweets, crawled_max, _, crawled_min, _,
+     crawled_num) = t_api.process_content({"statuses": statuses}, "k1")
+
+    assert crawled_num == len(all_tweets) == 31
+    assert (crawled_min, crawled_max) == (min(tw_ids), max(tw_ids))
+    for row, status in zip(all_tweets, statuses):
+        expected = t_api.strip_status(status)
+        assert {name: row[name] for name in expected} == expected
+        assert row["key"] == "k1"
+        assert row["time"] == t_api.get_tweet_time(status)
+    # 行を取り出しても列どうしの並びはずれない
+    taken = all_tweets.take([2, 0])
+    assert taken["id"] == [all_tweets["id"][2], all_tweets["id"][0]]
+    assert taken["text"] == [all_tweets["text"][2], all_tweets["text"][0]]
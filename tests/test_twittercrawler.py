@@ -0,0 +1,124 @@
+"""
+tests for TwitterCrawler against the mock api.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import os
+import threading
+import time
+
+import keyjournal
+
+
+def journaled(crawler):
+    crawler.journal.close()
+    return keyjournal.KeyStatusJournal(crawler.metadata_file).load()
+
+
+def test_progress_is_journaled_only_after_the_sink_is_flushed(make_crawler):
+    crawler = make_crawler(keys=["k1"])
+    crawler.sink.max_buffered_rows = 10 ** 6
+    crawler.crawl_once()
+    assert crawler.keystatuses["k1"]["max_tw_id"] is not None
+    assert "k1" not in journaled(crawler)
+
+    crawler.flushResults()
+    assert journaled(crawler)["k1"] == crawler.keystatuses["k1"]
+
+
+def test_resume_after_crash_recrawls_unflushed_pages(make_crawler):
+    crawler = make_crawler(keys=["k1"])
+    crawler.sink.max_buffered_rows = 10 ** 6
+    crawler.crawl_once()
+    crawler.flushResults()
+    flushed = dict(crawler.keystatuses["k1"])
+    crawler.crawl_once()
+    # ここで落ちたことにする（sinkのバッファは書き出されない）
+    crawler.journal.close()
+
+    resumed = make_crawler(keys=["k1"])
+    assert dict(resumed.keystatuses["k1"]) == flushed
+
+
+def test_prefilter_defers_quiet_users_until_next_pass(make_crawler):
+    crawler = make_crawler("user", keys=["quiet", "busy"], lookup_users=True)
+    for k, max_tw_id in (("quiet", 2 ** 62), ("busy", 1)):
+        crawler.keystatuses[k].update(
+            {"max_tw_id": max_tw_id, "min_tw_id": 1, "recent_min": 5,
+             "since_tw_id": 5, "last_updated_time": 1000})
+        crawler.keyscheduler.push(k)
+
+    assert crawler.prefilterUpdates() == 1
+    assert crawler.selectKey() == ("busy", "update")
+    assert crawler.selectKey() == (None, None)
+    # 後回しにしても検索状況は書き換えない
+    assert crawler.keystatuses["quiet"]["last_updated_time"] == 1000
+    assert "quiet" not in journaled(crawler)
+
+    crawler.keyscheduler.push("busy")
+    crawler.prefilterUpdates()
+    assert "quiet" in crawler.keyscheduler.deferred
+    crawler.keystatuses["quiet"]["max_tw_id"] = 1
+    crawler.prefilterUpdates()
+    assert "quiet" in crawler.keyscheduler
+
+
+def test_concurrent_run_uses_every_account_without_sharing_keys(
+        make_crawler, mock_api):
+    mock, _ = mock_api
+    crawler = make_crawler(keys=["k1", "k2", "k3", "k4"])
+    crawl_key = crawler.crawl_key
+    requeue_key = crawler.requeueKey
+    lock = threading.Lock()
+    searching = set()
+    searched = set()
+    overlaps = []
+
+    def tracked_crawl_key(account, key, mode):
+        with lock:
+            if key in searching:
+                overlaps.append(key)
+            searching.add(key)
+            searched.add(key)
+        return crawl_key(account, key, mode)
+
+    # keyは検索キューに戻した時点で他のアカウントが選べるようになる
+    def tracked_requeue_key(key):
+        with lock:
+            searching.discard(key)
+        requeue_key(key)
+    crawler.crawl_key = tracked_crawl_key
+    crawler.requeueKey = tracked_requeue_key
+
+    crawler.run(ask_runtime=False, export_lap=3600, full_runtime=2,
+                concurrent=True)
+
+    assert overlaps == []
+    for token in ("at1", "at2"):
+        assert mock.peek_budget(token, "/search/tweets")[0] < 180
+    # 2つのアカウントが別々のkeyを検索する
+    assert len(searched) >= 2
+    for k in searched:
+        assert crawler.keystatuses[k]["max_tw_id"] is not None
+    assert os.path.exists(os.path.join(crawler.results_dir,
+                                       "result_crawlNo1.pkl"))
+    # 終了時に保存した検索状況から再開できる
+    assert dict(make_crawler(keys=["k1"]).keystatuses["k1"]) == \
+        dict(crawler.keystatuses["k1"])
+
+
+def test_bootstrap_skips_accounts_that_fail_to_start(make_crawler, mock_api):
+    mock, _ = mock_api
+    mock.revoked.add("at2")
+    crawler = make_crawler(keys=["k1"])
+    deadline = time.time() + 10
+    while len(crawler.accounts) + len(crawler.failed_accounts) < 2:
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert crawler.accounts == ["acc1"]
+    assert crawler.failed_accounts == ["acc2"]
+    assert crawler.selectClient() == "acc1"
@@ -0,0 +1,149 @@
+"""
+pooled http sessions and jittered exponential backoff.
+
+# -*- coding: utf-8 -*-
+Created on Oct 17, 2026
+
+@author: g-suzuki
+"""
+
+import random
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+
+
+# エラーの種類ごとの待ち時間(秒)の(初期値, 上限)．
+# network: 通信エラー・タイムアウト, server: 5xx, rate_limit: 429,
+# client: その他の4xx(401/403など．認証の問題はすぐには直らないので長め)
+BACKOFF = {"network": (0.5, 60),
+           "server": (1.0, 120),
+           "rate_limit": (15.0, 900),
+           "client": (10.0, 900)}
+
+
+def configure_session(session, pool_maxsize=4, gzip=True):
+    """
+    セッションのコネクションプールを設定し，圧縮を要求する.
+
+    requests.Session(OAuth1Sessionを含む)はkeep-aliveで接続を使い回すが，
+    既定のプールは10接続・リトライなし．1アカウントを同時に使うのは数スレッドなので
+    プールを小さくし，リトライは自前のバックオフで行う.
+
+    Args:
+        session (requests.Session): 設定するセッション
+        pool_maxsize (int): 1ホストあたりに保持する接続数
+        gzip (bool): Accept-Encoding: gzipを付けるか否か
+
+    Return:
+        session (requests.Session): 設定したセッション
+    """
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize,
+                          max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if gzip:
+        session.headers["Accept-Encoding"] = "gzip, deflate"
+    session.headers["Connection"] = "keep-alive"
+    return session
+
+
+def classify(ret):
+    """
+    レスポンスをエラーの種類に分ける.
+
+    Args:
+        ret: レスポンス．通信エラーの場合はNone
+
+    Return:
+        error_class (str): "network"/"server"/"rate_limit"/"client"．成功ならNone
+    """
+    if ret is None:
+        return "network"
+    try:
+        status_code = int(ret.status_code)
+    except ValueError:
+        # TwitterAPI.get_virtual_resの仮想エラー（通信エラー）
+        return "network"
+    if status_code == 200:
+        return None
+    if status_code == 429:
+        return "rate_limit"
+    if status_code >= 500:
+        return "server"
+    return "client"
+
+
+class Transport:
+    """
+    1アカウントのHTTPの呼び出しを受け持つ．タイムアウトとエラーごとのバックオフを管理する.
+
+    失敗が続くたびに待ち時間を倍にし（上限あり），[0, 待ち時間]の一様乱数にする(full jitter)．
+    成功すると全ての種類の連続失敗数を0に戻す.
+
+    Attributes:
+        session (requests.Session): 使うセッション
+        timeout (tuple): (接続, 読み込み)のタイムアウト(秒)
+        backoff (dict): エラーの種類ごとの(初期値, 上限)
+        failures (dict): エラーの種類ごとの連続失敗数
+        lock (threading.Lock): failuresを守るロック
+    """
+
+    def __init__(self, session, timeout=(3.05, 30), backoff=None, seed=None):
+        """クラスコンストラクタ."""
+        self.session = session
+        self.timeout = timeout
+        if backoff is None:
+            backoff = BACKOFF
+        self.backoff = backoff
+        self.failures = {error_class: 0 for error_class in backoff}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        """
+        GETする.
+
+        Args:
+            url (str): URL
+            params (dict): クエリパラメータ
+            timeout (float or tuple): タイムアウト．Noneならself.timeout
+
+        Return:
+            ret (requests.Response): レスポンス．通信エラーは例外のまま投げる
+        """
+        if timeout is None:
+            timeout = self.timeout
+        return self.session.get(url, params=params, timeout=timeout)
+
+    def success(self):
+        """成功したので連続失敗数を戻す."""
+        with self.lock:
+            for error_class in self.failures:
+                self.failures[error_class] = 0
+
+    def failure(self, error_class, ret=None):
+        """
+        失敗を記録し，次に試すまで待つ秒数を返す.
+
+        429でx-rate-limit-resetがわかる場合は，その時刻まで待つ.
+
+        Args:
+            error_class (str): classify()の返り値
+            ret: レスポンス（あれば）
+
+        Return:
+            delay (float): 待つ秒数
+        """
+        base, cap = self.backoff[error_class]
+        with self.lock:
+            attempt = self.failures[error_class]
+            self.failures[error_class] = attempt + 1
+            delay = self.rng.uniform(0, min(cap, base * (2 ** attempt)))
+        if error_class == "rate_limit" and ret is not None:
+            headers = getattr(ret, "headers", {}) or {}
+            reset = headers.get("x-rate-limit-reset")
+            if reset is not None:
+                delay = max(delay, int(reset) + 1 - time.time())
+        return delay
@@ -10,9 +10,143 @@ Updated on Feb 2, 2019
 
 import json
 import datetime
-import time
-import csv
+import functools
 import os
+import time
+
+import health as hl
+import jsondecoder
+import keybatch
+import sinks
+import transport as tr
+
+
+# 本物のTwitter API．モックサーバ(mockserver.py)に向ける場合はapi_baseで差し替える
+API_BASE = "https://api.twitter.com/1.1/"
+
+# snowflake形式のツイートidに含まれる時刻の起点(ms)
+TWEPOCH_MS = 1288834974657
+# これより小さいidはsnowflake導入(2010年11月)以前の連番で，時刻を含まない
+SNOWFLAKE_MIN_ID = 30000000000
+# Twitter APIの時刻は標準時なので，日本時間にするため9時間進める
+JST_OFFSET = datetime.timedelta(hours=9)
+_UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+_MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+           "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+
+
+def snowflake_to_datetime(tw_id):
+    """
+    snowflake形式のツイートidから投稿時刻(日本時間)を取り出す.
+
+    created_atと同じく秒未満は切り捨てる.
+
+    Args:
+        tw_id (int or str): ツイートid
+
+    Return:
+        dt (datetime.datetime): 投稿時刻. snowflake導入以前のidの場合はNone
+    """
+    tw_id = int(tw_id)
+    if tw_id < SNOWFLAKE_MIN_ID:
+        return None
+    sec = ((tw_id >> 22) + TWEPOCH_MS) // 1000
+    return _UNIX_EPOCH + datetime.timedelta(seconds=sec) + JST_OFFSET
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_tw_time(value):
+    """
+    Twitter APIの時刻文字列('Wed Aug 27 13:08:45 +0000 2008')を日本時間のdatetimeにする.
+
+    同じユーザのuser_created_atは何度も現れるため結果をキャッシュする.
+    strptimeは遅いので文字列を切り出して変換し，形式が違う場合のみstrptimeを使う.
+
+    Args:
+        value (str): Twitter APIの時刻文字列
+
+    Return:
+        dt (datetime.datetime): 日本時間の時刻
+    """
+    try:
+        dt = datetime.datetime(int(value[26:30]), _MONTHS[value[4:7]],
+                               int(value[8:10]), int(value[11:13]),
+                               int(value[14:16]), int(value[17:19]))
+        if value[19:26] != " +0000 ":
+            raise ValueError(value)
+    except (KeyError, ValueError):
+        st = time.strptime(value, '%a %b %d %H:%M:%S +0000 %Y')
+        dt = datetime.datetime(st.tm_year,
+                               st.tm_mon,
+                               st.tm_mday,
+                               st.tm_hour,
+                               st.tm_min,
+                               st.tm_sec)
+    return dt + JST_OFFSET
+
+
+# strip_status/process_contentで残すuserの属性（列名は"user_"を付けたもの）
+USER_ATTRS = ["id", "screen_name", "name", "created_at",
+              "followers_count", "friends_count", "favourites_count",
+              "statuses_count", "description", "profile_banner_url",
+              "profile_image_url"]
+# strip_status/process_contentで残すツイートの属性
+TWEET_ATTRS = ["id", "in_reply_to_status_id_str",
+               "in_reply_to_user_id_str", "text",
+               "retweet_count", "favorite_count", "source"]
+
+
+class TweetColumns:
+    """
+    process_contentで加工したツイート群．列名ごとに値のlistを持つ.
+
+    列の並びはstrip_statusのdictと同じで，最後に"time"と"key"が続く.
+    pd.DataFrame(tweets.columns)でデータフレームにできる.
+    iterすると従来通り1ツイートずつdictを返す（遅いので内部では使わない）.
+
+    Attributes:
+        columns (dict): 列名をkeyとした値のlist
+    """
+
+    def __init__(self, columns):
+        """クラスコンストラクタ."""
+        self.columns = columns
+
+    def __len__(self):
+        """ツイート数."""
+        return len(self.columns["id"])
+
+    def __getitem__(self, name):
+        """列のlist."""
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        """列を置き換える."""
+        self.columns[name] = values
+
+    def __iter__(self):
+        """1ツイートずつdictにして返す."""
+        names = list(self.columns)
+        for values in zip(*self.columns.values()):
+            yield dict(zip(names, values))
+
+    def pop(self, idx):
+        """idx番目のツイートを全ての列から取り除く."""
+        for values in self.columns.values():
+            values.pop(idx)
+
+    def take(self, indices):
+        """
+        指定した番号のツイートだけを並べた新しいTweetColumns.
+
+        Args:
+            indices (list): ツイートの番号のlist（重複してよい）
+
+        Return:
+            tweets (TweetColumns): 選んだツイート群
+        """
+        return TweetColumns({name: [values[i] for i in indices]
+                             for name, values in self.columns.items()})
 
 
 class SampleError:
@@ -22,6 +156,7 @@ class SampleError:
     Attributes:
         status_code (str or int): virtual response code
         text (str): json object that contains response info
+        content (bytes): text encoded in utf-8
     """
 
     def __init__(self, status_code, error_message="エラーが起こってます！！"):
@@ -29,6 +164,7 @@ class SampleError:
         self.status_code = str(status_code)
         virtual_message_dic = {"errors": [{"message": error_message}]}
         self.text = json.dumps(virtual_message_dic)
+        self.content = self.text.encode("utf-8")
 
 
 class TwitterAPI:
@@ -47,6 +183,8 @@ class TwitterAPI:
         URL for searching one tweet by id.
     url4 : str
         URL for checking rate limit.
+    url5 : str
+        URL for looking up users.
     name : str
         name of the instance
     twitter : requests_oauthlib.oauth1_session.OAuth1Session
@@ -57,6 +195,16 @@ class TwitterAPI:
         "word" if word based search, "user" if user based search.
     clientStatus : dict
         dict that contains info about rate limits.
+        "wake_time" is the unix time until which the account is parked.
+        may be shared with an instance of the other search type.
+    transport : transport.Transport
+        sends requests with timeouts and decides how long to park the
+        account after a failure (jittered exponential backoff).
+    health : health.AccountHealth
+        circuit breaker. while open, get_wake_time() is pushed to its
+        retry time so the account is not selected.
+    limit_error : requests.Response or SampleError
+        the last failed response of check_api_limit() (None until then).
     word : str
         search keyword. (on word based search)
     user : str or int
@@ -85,24 +233,81 @@ class TwitterAPI:
         the name of file to export the result.
     write_to_csv : bool
         if true, export the results to a csv file.
+    sink : sinks.CsvSink or sinks.ParquetSink
+        buffered writer. may be shared among instances.
+    storage : sinks.SqliteSink
+        optional database to store crawled tweets. may be shared.
+    batch_members : list
+        (keyword, terms) pairs when the search key is an OR query of
+        several keywords. None for a normal search.
+    metrics : metrics.Metrics
+        optional recorder of requests, budgets and tweets. may be shared.
+    profilers : list
+        hooks that receive the time spent in each stage of search.
+    decoder : jsondecoder.JsonDecoder
+        decodes response bodies from bytes. may be shared.
+    broker : budgetbroker.BudgetClient
+        optional client of the budget broker shared with other processes.
+        a request token is leased from it before each search/lookup call.
     """
 
     def __init__(self, account_name, twitter, lang="ja",
                  search_type="word", word=None, user=None,
                  since_tw_id=None, saving_dir="./results/",
-                 saving_filename=None, write_to_csv=True):
-        """クラスコンストラクタ."""
-        self.url1 = "https://api.twitter.com/1.1/statuses/user_timeline.json"
-        self.url2 = "https://api.twitter.com/1.1/search/tweets.json"
-        self.url3 = "https://api.twitter.com/1.1/statuses/show.json"
-        self.url4 = ("https://api.twitter.com/1.1/application/"
-                     "rate_limit_status.json")
+                 saving_filename=None, write_to_csv=True, sink=None,
+                 storage=None, bootstrap=True, api_base=API_BASE,
+                 metrics=None, decoder=None, transport=None, health=None,
+                 broker=None, client_status=None):
+        """
+        クラスコンストラクタ.
+
+        bootstrapがFalseの場合はrate_limit APIを叩かず，残機0の状態で作る
+        （後でupdateClientStatus()を呼ぶこと）.
+        api_baseを変えると，各エンドポイントのURLがその下になる
+        （例: mockserver.pyの"http://127.0.0.1:8080/1.1/"）.
+        metricsを与えると，リクエスト・残機・取得ツイート数を記録する.
+        decoderを与えない場合は，使える中で一番速いバックエンドのJsonDecoderを使う.
+        transportを与えない場合は，twitterをそのまま使う既定のTransportを作る.
+        brokerを与えると，検索の前にブローカーから1回分を借り，残機をブローカーに報告する.
+        client_statusを与えると，そのclientStatusを共有する（同じアカウントで
+        キーワード検索とユーザ検索を行う別のインスタンスと残機を揃えるため．bootstrapは無視する）.
+        """
+        self.url1 = api_base + "statuses/user_timeline.json"
+        self.url2 = api_base + "search/tweets.json"
+        self.url3 = api_base + "statuses/show.json"
+        self.url4 = api_base + "application/rate_limit_status.json"
+        self.url5 = api_base + "users/lookup.json"
         self.name = account_name
         self.twitter = twitter
         self.search_lang = lang
         self.search_type = search_type
-        self.clientStatus = {"word": {}, "user": {}}
-        self.updateClientStatus()  # dict of reset_time and remaining
+        self.clientStatus = {"word": {"wake_time": 0},
+                             "user": {"wake_time": 0},
+                             # users/lookupの残機はレスポンスヘッダでのみ知る（最初は不明なので1）
+                             "lookup": {"wake_time": 0,
+                                        "remaining_count": 1,
+                                        "reset_time": 0}}
+        if transport is None:
+            transport = tr.Transport(twitter)
+        self.transport = transport
+        if health is None:
+            health = hl.AccountHealth(account_name)
+        self.health = health
+        self.metrics = metrics
+        self.profilers = []
+        if decoder is None:
+            decoder = jsondecoder.JsonDecoder()
+        self.decoder = decoder
+        self.broker = broker
+        self.limit_error = None
+        if client_status is not None:
+            self.clientStatus = client_status
+        elif bootstrap:
+            self.updateClientStatus()  # dict of reset_time and remaining
+        else:
+            for search_type in ["word", "user"]:
+                self.clientStatus[search_type]["remaining_count"] = 0
+                self.clientStatus[search_type]["reset_time"] = 0
         self.word = word
         self.user = user
         self.max_tw_id = None  # newest tweet id so far
@@ -117,62 +322,176 @@ class TwitterAPI:
         self.saving_dir = saving_dir
         self.saving_filename = saving_filename
         self.write_to_csv = write_to_csv
+        # 共有のsinkが与えられない場合は，検索ごとに書き出す
+        if sink is None:
+            sink = sinks.CsvSink(max_buffered_rows=0)
+        self.sink = sink
+        self.storage = storage
+        self.batch_members = None
 
     def get_virtual_res(self, status_code, error_message="エラーが起こってます！！"):
         """仮想エラーを返す."""
         virtual_res = SampleError(status_code, error_message)
         return virtual_res
 
-    def check_api_limit(self):
+    def api_get(self, endpoint, url, params, timeout=None):
+        """
+        APIを叩く．metricsがあればレイテンシとステータスを記録する.
+
+        Args:
+            endpoint (str): metricsでのエンドポイント名
+            url (str): URL
+            params (dict): クエリパラメータ
+            timeout (float): タイムアウト(秒)．Noneならtransportの既定値
+
+        Return:
+            ret: レスポンス．通信エラーの場合は例外をそのまま投げる
+        """
+        start = time.time()
+        try:
+            ret = self.transport.get(url, params, timeout)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.observe_request(self.name, endpoint,
+                                             time.time() - start, "error")
+            self.health.record_error(type(e).__name__)
+            raise
+        if self.metrics is not None:
+            self.metrics.observe_request(self.name, endpoint,
+                                         time.time() - start,
+                                         ret.status_code)
+        if str(ret.status_code) == "200":
+            self.transport.success()
+        self.health.record(ret.status_code)
+        return ret
+
+    def park_after_error(self, ret, search_type=None):
+        """
+        失敗したレスポンスの種類に応じたバックオフの間，アカウントを休ませる.
+
+        429でレスポンスヘッダがあれば，残機もそれに合わせる.
+
+        Args:
+            ret: 失敗したレスポンス（通信エラーの場合は仮想エラー）
+            search_type (str): "word"/"user"/"lookup". Noneの場合は現在のsearch_type
+
+        Return:
+            delay (float): 休ませる秒数
+        """
+        error_class = tr.classify(ret)
+        delay = self.transport.failure(error_class, ret)
+        if error_class == "rate_limit" and \
+           "x-rate-limit-reset" in getattr(ret, "headers", {}):
+            self.updateClientStatus(ret, status_type=search_type)
+        elif self.broker is not None:
+            # 残機がわからないので，借りた分をそのまま返す
+            self.broker.release(self.name, search_type or self.search_type)
+        print("park %.2f sec (%s)" % (delay, error_class))
+        self.park(time.time() + delay, search_type)
+        return delay
+
+    def add_profiler(self, profiler):
+        """
+        searchの段階ごとの所要時間を受け取るフックを登録する.
+
+        Args:
+            profiler: record(account, stage, seconds)を持つオブジェクト
+                      (profiling.StageProfilerなど)．複数のインスタンスで共有してよい
+        """
+        self.profilers.append(profiler)
+
+    def record_stage(self, stage, start):
+        """
+        段階が終わったことを登録済みのフックに伝える.
+
+        Args:
+            stage (str): 段階の名前("http"/"decode"/"process"/"sink"/"status")
+            start (float): 段階が始まったtime.perf_counter()の値
+
+        Return:
+            now (float): 次の段階の開始時刻として使うtime.perf_counter()の値
+        """
+        now = time.perf_counter()
+        for profiler in self.profilers:
+            profiler.record(self.name, stage, now - start)
+        return now
+
+    def check_api_limit(self, max_retries=None, timeout=None):
         """
         API制限を確認する.
 
+        Args:
+            max_retries (int): 失敗した場合に試し直す回数．Noneなら成功するまで続ける
+            timeout (float): 1回のリクエストのタイムアウト(秒)
+
         Return: 
-            ret_dic (dict): APIを叩いた結果
+            ret_dic (dict): APIを叩いた結果. max_retries回失敗した場合はNone
         """
         ret = self.get_virtual_res("check_api_limit(), 1st loop")
+        retries = 0
 
         while(str(ret.status_code) != "200"):
             try:
-                ret = self.twitter.get(self.url4,
-                                       params={"resources": ("account,"
-                                                             "application,"
-                                                             "blocks,"
-                                                             "direct_messages,"
-                                                             "followers,"
-                                                             "friends,"
-                                                             "friendships,"
-                                                             "geo,help,lists,"
-                                                             "saved_searches,"
-                                                             "search,statuses,"
-                                                             "trends,users")})
+                ret = self.api_get("rate_limit", self.url4,
+                                   {"resources": ("account,"
+                                                  "application,"
+                                                  "blocks,"
+                                                  "direct_messages,"
+                                                  "followers,"
+                                                  "friends,"
+                                                  "friendships,"
+                                                  "geo,help,lists,"
+                                                  "saved_searches,"
+                                                  "search,statuses,"
+                                                  "trends,users")},
+                                   timeout=timeout)
             except Exception as e:
                 print('=== エラー発生 ===')
                 print('type: ', str(type(e)))
                 print('args: ', str(e.args))
-                print('message: ', e.message)
                 print('e自身：', str(e))
                 ret = self.get_virtual_res("rate_limit api の呼び出し時のエラー")
 
             if str(ret.status_code) != "200":
                 print("Client Value Exception !!: ", str(ret.status_code))
-                print("sleep 10 sec")
-                time.sleep(10)
-
-        ret_dic = json.loads(ret.text)
+                self.limit_error = ret
+                if (max_retries is not None) and (retries >= max_retries):
+                    print("Account Name %s: gave up checking api limit"
+                          % self.name)
+                    return None
+                # 遮断された場合は試し直さない（half-openになってから再び叩かれる）
+                if self.health.get_state() == hl.OPEN:
+                    print("Account Name %s: circuit open, gave up checking "
+                          "api limit" % self.name)
+                    return None
+                retries += 1
+                delay = self.transport.failure(tr.classify(ret), ret)
+                print("sleep %.2f sec" % delay)
+                time.sleep(delay)
+                if self.metrics is not None:
+                    self.metrics.observe_sleep(self.name, delay)
+
+        ret_dic = self.decoder.loads(ret.content)
         return ret_dic
 
-    def get_search_api_rate_remaining(self):
+    def get_search_api_rate_remaining(self, max_retries=None, timeout=None):
         """
         アカウントの、残りの検索可能回数と、それがリセットされるまでの時間を取得.
 
+        Args:
+            max_retries (int): 失敗した場合に試し直す回数．Noneなら成功するまで続ける
+            timeout (float): 1回のリクエストのタイムアウト(秒)
+
         Return:
             w_remaining (int): キーワード検索の残機
             w_reset_time (int): キーワード検索の復活時刻
             u_remaining (int): ユーザ検索の残機
             u_reset_time (int): ユーザ検索の残機
+            取得できなかった場合はNone
         """
-        res_dic = self.check_api_limit()
+        res_dic = self.check_api_limit(max_retries, timeout)
+        if res_dic is None:
+            return None
 
         w_remaining = (res_dic["resources"]
                               ["search"]
@@ -192,7 +511,8 @@ class TwitterAPI:
                                ["reset"])
         return w_remaining, w_reset_time, u_remaining, u_reset_time
 
-    def updateClientStatus(self, ret=None):
+    def updateClientStatus(self, ret=None, max_retries=None, timeout=None,
+                           status_type=None):
         """
         clientStausを更新.
 
@@ -200,19 +520,154 @@ class TwitterAPI:
 
         Args:
             ret: APIを叩いたレスポンス
+            max_retries (int): rate_limit APIが失敗した場合に試し直す回数
+            timeout (float): rate_limit APIのタイムアウト(秒)
+            status_type (str): retを更新するclientStatusのkey．Noneなら現在のsearch_type
+
+        Return:
+            updated (bool): 更新できたか否か
         """
         if ret is None:
-            w_rem, w_res, u_rem, u_res = self.get_search_api_rate_remaining()
+            remainings = self.get_search_api_rate_remaining(max_retries,
+                                                            timeout)
+            if remainings is None:
+                return False
+            w_rem, w_res, u_rem, u_res = remainings
+            if self.broker is not None:
+                self.broker.report(self.name, "word", w_rem, w_res,
+                                   leased=False)
+                self.broker.report(self.name, "user", u_rem, u_res,
+                                   leased=False)
             self.clientStatus["word"]["remaining_count"] = w_rem
             self.clientStatus["word"]["reset_time"] = w_res
             self.clientStatus["user"]["remaining_count"] = u_rem
             self.clientStatus["user"]["reset_time"] = u_res
         else:
+            if status_type is None:
+                status_type = self.search_type
             rem = int(ret.headers["x-rate-limit-remaining"])
             res = int(ret.headers["x-rate-limit-reset"])
-            self.clientStatus[self.search_type]["remaining_count"] = rem
-            self.clientStatus[self.search_type]["reset_time"] = res
-        return
+            if self.broker is not None:
+                # 他のプロセスが借りている分も引いた残機にする
+                reply = self.broker.report(self.name, status_type, rem, res)
+                if (reply is not None) and \
+                   (reply.get("remaining") is not None):
+                    rem = min(rem, reply["remaining"])
+            self.clientStatus[status_type]["remaining_count"] = rem
+            self.clientStatus[status_type]["reset_time"] = res
+        if self.metrics is not None:
+            for s_type in (["word", "user"] if ret is None else [status_type]):
+                self.metrics.set_remaining(
+                    self.name, s_type,
+                    self.clientStatus[s_type]["remaining_count"])
+        return True
+
+    def lease_budget(self, search_type=None):
+        """
+        brokerがあれば，APIを叩く前に1回分を借りる.
+
+        借りられなかった場合（他のプロセスが残機を使い切った場合）は，
+        ブローカーが示す時刻までアカウントを休ませる.
+        ブローカーがエラーを返した場合は，借りられたものとして扱う（ブローカーなしの動作）.
+
+        Args:
+            search_type (str): "word"/"user"/"lookup". Noneの場合は現在のsearch_type
+
+        Return:
+            granted (bool): 叩いてよいか否か
+        """
+        if self.broker is None:
+            return True
+        if search_type is None:
+            search_type = self.search_type
+        reply = self.broker.lease(self.name, search_type)
+        # ブローカーがエラーを返した場合（終了中など）は，レスポンスヘッダだけで残機を管理する
+        if ("error" in reply) or ("granted" not in reply):
+            print("Account Name %s: budget broker replied %s, using response "
+                  "headers only" % (self.name, reply.get("error", reply)))
+            return True
+        if reply["granted"]:
+            return True
+
+        status = self.clientStatus[search_type]
+        if reply.get("remaining") == 0:
+            status["remaining_count"] = 0
+            status["reset_time"] = reply["reset"]
+        self.park(reply["retry_at"], search_type)
+        msg = ("Account Name %s: %s budget is leased by other processes,"
+               " parked for %.1f seconds"
+               % (self.name, search_type, reply["retry_at"] - time.time()))
+        print(msg)
+        return False
+
+    def park(self, until, search_type=None):
+        """
+        アカウントを指定時刻まで休ませる（スリープはせず，起床時刻を記録するだけ）.
+
+        Args:
+            until (float): 起床時刻(unix time)
+            search_type (str): "word"/"user". Noneの場合は現在のsearch_type
+        """
+        if search_type is None:
+            search_type = self.search_type
+        status = self.clientStatus[search_type]
+        status["wake_time"] = max(status["wake_time"], until)
+
+    def get_wake_time(self, search_type=None):
+        """
+        アカウントが次に検索可能になる時刻を返す.
+
+        API残機がない場合はリセット時刻の2秒後，エラーで休んでいる場合はその起床時刻，
+        サーキットブレーカーで遮断されている場合は試しに叩いてよくなる時刻.
+
+        Args:
+            search_type (str): "word"/"user". Noneの場合は現在のsearch_type
+
+        Return:
+            wake_time (float): 検索可能になる時刻(unix time)
+        """
+        if search_type is None:
+            search_type = self.search_type
+        status = self.clientStatus[search_type]
+        wake_time = status["wake_time"]
+        if status["remaining_count"] <= 0:
+            wake_time = max(wake_time, status["reset_time"] + 2)
+        # selectClientから全アカウント分呼ばれるため，ロックを取らずにretry_atだけを見る
+        # （遮断中のみ未来の時刻になり，closedに戻ると0になる）
+        retry_at = self.health.retry_at
+        if retry_at > wake_time:
+            wake_time = retry_at
+        return wake_time
+
+    def refresh_if_reset(self, search_type=None, max_retries=0):
+        """
+        残機0のままリセット時刻を過ぎていたら，rate_limit APIで残機を取り直す.
+
+        取り直せなかった場合はその場で試し直さず，バックオフの間アカウントを休ませる
+        （呼び出し側はget_wake_time()で起床を待つ）.
+
+        Args:
+            search_type (str): "word"/"user". Noneの場合は現在のsearch_type
+            max_retries (int): rate_limit APIが失敗した場合にその場で試し直す回数
+
+        Return:
+            ready (bool): 取り直す必要がないか，取り直せた場合はTrue
+        """
+        if search_type is None:
+            search_type = self.search_type
+        status = self.clientStatus[search_type]
+        if (status["remaining_count"] > 0) or \
+           (status["reset_time"] + 2 > int(time.time())):
+            return True
+        if self.updateClientStatus(max_retries=max_retries):
+            return True
+        # rate_limit APIの429のヘッダは検索の残機ではないので，park_after_errorは使わない
+        delay = self.transport.failure(tr.classify(self.limit_error),
+                                       self.limit_error)
+        print("Account Name %s: could not refresh the api limit, park %.2f "
+              "sec" % (self.name, delay))
+        self.park(time.time() + delay, search_type)
+        return False
 
     def make_params(self, mode, key, count=None):
         """
@@ -286,20 +741,16 @@ class TwitterAPI:
 
         Args:
             value: 元の入力
-            input_type: 入力のタイプ('tw_time'/'unix')
+            input_type: 入力のタイプ('tw_time'/'tw_id'/'unix')
             output_type: 出力のタイプ('dt'/'mysql'/'YMD'/'YM')
 
         Return:
             output_type次第で様々
         """
         if input_type == "tw_time":
-            st = time.strptime(value, '%a %b %d %H:%M:%S +0000 %Y')
-            dt = datetime.datetime(st.tm_year,
-                                   st.tm_mon,
-                                   st.tm_mday,
-                                   st.tm_hour,
-                                   st.tm_min,
-                                   st.tm_sec) + datetime.timedelta(hours=9)
+            dt = parse_tw_time(value)
+        elif input_type == "tw_id":
+            dt = snowflake_to_datetime(value)
         elif input_type == "unix":
             dt = datetime.datetime.fromtimestamp(int(value))
 
@@ -312,6 +763,23 @@ class TwitterAPI:
         elif output_type == "YM":
             return dt.strftime("%Y%m")
 
+    def get_tweet_time(self, status):
+        """
+        ツイートの投稿時刻(日本時間)を返す.
+
+        snowflake形式のidならidから直接取り出し，そうでなければcreated_atを解析する.
+
+        Args:
+            status (dict): 元のstatus1ツイート分
+
+        Return:
+            dt (datetime.datetime): 投稿時刻
+        """
+        dt = snowflake_to_datetime(status["id"])
+        if dt is None:
+            dt = parse_tw_time(status["created_at"])
+        return dt
+
     def get_and_set_attr(self, gdict, sdict, gkey, skey):
         """
         sdictにkeyが存在したら、gdictに入れる.
@@ -322,7 +790,7 @@ class TwitterAPI:
             gkey (str): 入力dictのkey
             skey (str): 出力dictのkey
         """
-        if gkey in list(gdict.keys()):
+        if gkey in gdict:
             sdict[skey] = gdict[gkey]
         else:
             sdict[skey] = None
@@ -338,28 +806,21 @@ class TwitterAPI:
             result (dict): 加工されたstatus1ツイート分
         """
         result = {}
-        for attr in ["id", "screen_name", "name", "created_at",
-                     "followers_count", "friends_count", "favourites_count",
-                     "statuses_count", "description", "profile_banner_url",
-                     "profile_image_url"]:
+        for attr in USER_ATTRS:
             attr_name = "user_" + attr
             self.get_and_set_attr(status["user"], result, attr, attr_name)
-        for attr in ["id", "in_reply_to_status_id_str",
-                     "in_reply_to_user_id_str", "text",
-                     "retweet_count", "favorite_count", "source"]:
+        for attr in TWEET_ATTRS:
             self.get_and_set_attr(status, result, attr, attr)
-        result["time"] = self.trans_time_obj_str(status["created_at"],
-                                                 "tw_time", "dt")
-        cr_dt = self.trans_time_obj_str(result["user_created_at"],
-                                        "tw_time",
-                                        "dt")
-        result["user_created_at"] = cr_dt
+        result["time"] = self.get_tweet_time(status)
+        result["user_created_at"] = parse_tw_time(result["user_created_at"])
 
         return result
 
     def process_content(self, content, key):
         """
-        APIで取得したJSONを使いやすいように加工し、辞書型にして返す.
+        APIで取得したJSONを使いやすいように加工し、列ごとのlistにして返す.
+
+        strip_statusと同じ値を，1ツイートずつdictを作らずに列ごとにまとめて取り出す.
 
         Args:
             content (dict or list): レスポンス.キーワード検索ではdict, ユーザ検索ではlist.
@@ -367,7 +828,7 @@ class TwitterAPI:
 
         Return:
             tw_ids (list): 取得ツイートのidリスト
-            all_tweets (list): 取得ツイート情報
+            all_tweets (TweetColumns): 取得ツイート情報
             crawled_max (int): 取得した最新ツイートのid
             crawled_max_t (str): 取得した最新ツイートの投稿時間
             crawled_min (int): 取得した最古のツイートのid
@@ -378,25 +839,29 @@ class TwitterAPI:
             statuses = content["statuses"]
         elif self.search_type == "user":
             statuses = content
-        tw_ids = []
-        all_tweets = []
 
-        for i, status in enumerate(statuses):
-            a_tw = self.strip_status(status)
-            a_tw["key"] = key
-            all_tweets.append(a_tw)
-            tw_ids.append(int(a_tw["id"]))
+        users = [status["user"] for status in statuses]
+        columns = {}
+        for attr in USER_ATTRS:
+            columns["user_" + attr] = [user.get(attr) for user in users]
+        for attr in TWEET_ATTRS:
+            columns[attr] = [status.get(attr) for status in statuses]
+        columns["user_created_at"] = [parse_tw_time(value) for value
+                                      in columns["user_created_at"]]
+        tw_ids = [int(tw_id) for tw_id in columns["id"]]
+        columns["time"] = [self.get_tweet_time(status)
+                           for status in statuses]
+        columns["key"] = [key] * len(statuses)
+        all_tweets = TweetColumns(columns)
 
         if len(tw_ids):
             crawled_min = min(tw_ids)
             crawled_max = max(tw_ids)
             crawled_num = len(tw_ids)
-            min_tw_time = statuses[tw_ids.index(crawled_min)]["created_at"]
-            max_tw_time = statuses[tw_ids.index(crawled_max)]["created_at"]
-            crawled_min_t = self.trans_time_obj_str(min_tw_time, "tw_time",
-                                                                 "mysql")
-            crawled_max_t = self.trans_time_obj_str(max_tw_time, "tw_time",
-                                                                 "mysql")
+            min_tw_time = columns["time"][tw_ids.index(crawled_min)]
+            max_tw_time = columns["time"][tw_ids.index(crawled_max)]
+            crawled_min_t = min_tw_time.strftime("%Y-%m-%d %H:%M:%S")
+            crawled_max_t = max_tw_time.strftime("%Y-%m-%d %H:%M:%S")
         else:
             crawled_min = None
             crawled_min_t = None
@@ -407,82 +872,152 @@ class TwitterAPI:
         return tw_ids, all_tweets, crawled_max, crawled_max_t, \
             crawled_min, crawled_min_t, crawled_num
 
+    def demux_batch(self, all_tweets, key):
+        """
+        ORクエリで取得したツイートを，本文に一致したキーワードに振り分ける.
+
+        複数のキーワードに一致したツイートはキーワードごとに複製し，
+        どれにも一致しなかったツイートはORクエリ自体をkeyとする.
+
+        Args:
+            all_tweets (TweetColumns): process_contentにより加工されたツイート群
+            key (str): ORクエリ
+
+        Return:
+            demuxed (TweetColumns): keyをキーワードに付け替えたツイート群
+        """
+        indices = []
+        keys = []
+        for i, text in enumerate(all_tweets["text"]):
+            matched = keybatch.match_keys(text, self.batch_members)
+            if len(matched) == 0:
+                indices.append(i)
+                keys.append(all_tweets["key"][i])
+                continue
+            for keyword in matched:
+                indices.append(i)
+                keys.append(keyword)
+        demuxed = all_tweets.take(indices)
+        demuxed["key"] = keys
+        return demuxed
+
     def write_tweet_to_csv(self, all_tweets, key, file_type="date"):
         """
         ツイートをcsvに出力する.
 
         その際本文や自己紹介文の改行文字は取り除かれる.
         特別な指定がない場合，出力ファイル名はクエリ検索の場合はYYYYMMDD.csv，ユーザ検索の場合はYYYYMM.csvとなる
+        実際の書き込みはself.sinkがファイルごとにまとめて行う.
+        all_tweetsの"time"・"user_created_at"の列は"YYYY-mm-dd HH:MM:SS"の文字列に置き換わる.
 
         Args:
-            all_tweets (dict): process_contentにより加工されたツイート群
-            key(str or int): 検索するキーワード/ユーザ
+            all_tweets (TweetColumns): process_contentにより加工されたツイート群
+            key(str or int): 検索するキーワード/ユーザ（各行のkeyはall_tweets["key"]を使う）
         """
-        if not os.path.exists(self.saving_dir):
-            os.makedirs(self.saving_dir)
+        tweets = [text.replace("\r\n", "").replace("\n", "")
+                  for text in all_tweets["text"]]
+        descriptions = [description.replace("\r\n", "").replace("\n", "")
+                        for description in all_tweets["user_description"]]
+        all_tweets["time"] = [dt.strftime("%Y-%m-%d %H:%M:%S")
+                              for dt in all_tweets["time"]]
+        all_tweets["user_created_at"] = [dt.strftime("%Y-%m-%d %H:%M:%S")
+                                         for dt in all_tweets["user_created_at"]]
+
+        if self.saving_filename is not None:
+            fnames = [self.saving_filename] * len(tweets)
+        elif file_type == "date":
+            # "YYYY-mm-dd HH:MM:SS" -> "YYYYmmdd"（ユーザ検索では"YYYYmm"）
+            if self.search_type == "word":
+                fnames = [t[0:4] + t[5:7] + t[8:10]
+                          for t in all_tweets["time"]]
+            elif self.search_type == "user":
+                fnames = [t[0:4] + t[5:7] for t in all_tweets["time"]]
+        elif file_type == "key":
+            fnames = [str(k) for k in all_tweets["key"]]
+
+        all_rows = zip(all_tweets["key"], all_tweets["id"], all_tweets["time"],
+                   all_tweets["user_id"], all_tweets["user_screen_name"],
+                   all_tweets["user_name"], all_tweets["user_created_at"],
+                   all_tweets["user_followers_count"],
+                   all_tweets["user_friends_count"],
+                   all_tweets["user_favourites_count"],
+                   all_tweets["user_statuses_count"],
+                   descriptions, all_tweets["user_profile_banner_url"],
+                   all_tweets["user_profile_image_url"],
+                   all_tweets["in_reply_to_status_id_str"],
+                   all_tweets["in_reply_to_user_id_str"],
+                   tweets, all_tweets["retweet_count"],
+                   all_tweets["favorite_count"], all_tweets["source"])
+
+        rows_by_file = {}
+        for fname, a_tw_data in zip(fnames, all_rows):
+            save_filename = os.path.join(self.saving_dir, fname + ".csv")
+            rows_by_file.setdefault(save_filename, []).append(a_tw_data)
+
+        for save_filename, rows in rows_by_file.items():
+            self.sink.append(save_filename, rows)
 
-        for a_tw in all_tweets:
-            tweet = a_tw["text"].replace("\r\n", "")
-            tweet = tweet.replace("\n", "")
-            description = a_tw["user_description"].replace("\r\n", "")
-            description = description.replace("\n", "")
+        return
 
-            if self.saving_filename is None:
+    def lookup_users(self, keys):
+        """
+        users/lookupで最大100ユーザの最新ツイートのidをまとめて取得する.
 
-                if file_type == "date":
-                    if self.search_type == "word":
-                        fname = a_tw["time"].strftime("%Y%m%d")
-                    elif self.search_type == "user":
-                        fname = a_tw["time"].strftime("%Y%m%d")[0:6]
+        user_timelineを叩く前に，前回以降に新しいツイートがあるかを安く調べるために使う.
 
-                elif file_type == "key":
-                    fname = key
+        Args:
+            keys (list): ユーザのlist. screen name(str)またはuser id(int)
 
-                save_filename = self.saving_dir + fname + ".csv"
+        Return:
+            latest (dict): keyごとの(最新ツイートのid, ツイート数)．
+                           最新ツイートが見えない（鍵アカウントなど）場合idはNone.
+                           凍結などで見つからなかったユーザは含まない.
+                           APIを叩けなかった場合はNone
+        """
+        user_ids = [str(k) for k in keys if type(k) == int]
+        screen_names = [k for k in keys if type(k) != int]
+        param_dict = {"include_entities": "false"}
+        if user_ids:
+            param_dict["user_id"] = ",".join(user_ids)
+        if screen_names:
+            param_dict["screen_name"] = ",".join(screen_names)
+
+        if not self.lease_budget("lookup"):
+            return None
 
-            else:
-                save_filename = self.saving_dir + self.saving_filename + ".csv"
-
-            a_tw["time"] = a_tw["time"].strftime("%Y-%m-%d %H:%M:%S")
-            a_tw["user_created_at"] = (a_tw["user_created_at"]
-                                       .strftime("%Y-%m-%d %H:%M:%S"))
-
-            a_tw_data = [key, a_tw["id"], a_tw["time"], a_tw["user_id"],
-                         a_tw["user_screen_name"], a_tw["user_name"],
-                         a_tw["user_created_at"], a_tw["user_followers_count"],
-                         a_tw["user_friends_count"],
-                         a_tw["user_favourites_count"],
-                         a_tw["user_statuses_count"],
-                         description, a_tw["user_profile_banner_url"],
-                         a_tw["user_profile_image_url"],
-                         a_tw["in_reply_to_status_id_str"],
-                         a_tw["in_reply_to_user_id_str"],
-                         tweet, a_tw["retweet_count"], a_tw["favorite_count"],
-                         a_tw["source"]]
-
-            write_header = False
-            if not os.path.exists(save_filename):
-                write_header = True
-                header = ["key", "id", "time", "user_id",
-                          "user_screen_name", "user_name", "user_created_at",
-                          "user_followers_count", "user_friends_count",
-                          "user_favourites_count", "user_statuses_count",
-                          "user_description", "user_profile_banner_url",
-                          "user_profile_image_url", "in_reply_to_status_id_str",
-                          "in_reply_to_user_id_str", "tweet_text",
-                          "retweet_count", "favorite_count", "source"]
-
-            with open(save_filename, "a") as f:
-                writer = csv.writer(f,
-                                    delimiter=",",
-                                    quotechar='"',
-                                    lineterminator="\n",
-                                    quoting=csv.QUOTE_ALL)
-                if write_header:
-                    writer.writerow(header)
-                writer.writerow(a_tw_data)
+        try:
+            ret = self.api_get("lookup", self.url5, param_dict)
+            content = self.decoder.loads(ret.content)
+        except Exception as e:
+            print('=== エラー発生 ===')
+            print('type: ', str(type(e)))
+            print('args: ', str(e.args))
+            ret = self.get_virtual_res("/users/lookup api の呼び出し時のエラー")
 
-        return
+        if str(ret.status_code) != "200":
+            print("Client Value Exception !!: ", str(ret.status_code))
+            self.park_after_error(ret, "lookup")
+            return None
+
+        self.updateClientStatus(ret, status_type="lookup")
+
+        by_id = {}
+        by_name = {}
+        for user in content:
+            status = user.get("status")
+            latest = (int(status["id"]) if status else None,
+                      user.get("statuses_count"))
+            by_id[int(user["id"])] = latest
+            by_name[user["screen_name"].lower()] = latest
+
+        latest = {}
+        for k in keys:
+            if type(k) == int:
+                if k in by_id:
+                    latest[k] = by_id[k]
+            elif k.lower() in by_name:
+                latest[k] = by_name[k.lower()]
+        return latest
 
     def search(self, mode, key=None, count=None, verbose=True):
         """
@@ -495,7 +1030,7 @@ class TwitterAPI:
             verbose (bool): 途中経過をprintするか否か
 
         Return:
-            all_tweets (list): 取得ツイート情報
+            all_tweets (TweetColumns): 取得ツイート情報
             APIを叩けなかった場合はNone
         """
         if self.search_type == "word":
@@ -507,6 +1042,7 @@ class TwitterAPI:
                 key = self.word
 
             url = self.url2
+            endpoint = "search"
             error_type = "/search/tweets api の呼び出し時のエラー"
 
         elif self.search_type == "user":
@@ -518,18 +1054,35 @@ class TwitterAPI:
                 key = self.user
 
             url = self.url1
+            endpoint = "user_timeline"
             error_type = "/statuses/user_timeline api の呼び出し時のエラー"
 
         param_dict = self.make_params(mode, key, count)
 
+        if not self.lease_budget():
+            return None
+
+        stage_start = time.perf_counter()
         try:
-            ret = self.twitter.get(url, params=param_dict)
-            content = json.loads(ret.text)
+            ret = self.api_get(endpoint, url, param_dict)
         except Exception as e:
             print('=== エラー発生 ===')
             print('type: ', str(type(e)))
             print('args: ', str(e.args))
             ret = self.get_virtual_res(error_type)
+        stage_start = self.record_stage("http", stage_start)
+
+        # 失敗したレスポンスはデコードせず，本当のステータスでpark_after_errorに分類させる
+        if str(ret.status_code) == "200":
+            try:
+                content = self.decoder.loads(ret.content)
+            except ValueError as e:
+                # 200でも本文が途中で切れている場合は，通信エラーと同じく扱う
+                print('=== エラー発生 ===')
+                print('type: ', str(type(e)))
+                print('args: ', str(e.args))
+                ret = self.get_virtual_res(error_type)
+            stage_start = self.record_stage("decode", stage_start)
 
         if str(ret.status_code) == "200":
 
@@ -542,9 +1095,26 @@ class TwitterAPI:
 
                 all_tweets.pop(tw_ids.index(crawled_min))
 
+            if self.batch_members:
+                all_tweets = self.demux_batch(all_tweets, key)
+            stage_start = self.record_stage("process", stage_start)
+
             if self.write_to_csv:
                 self.write_tweet_to_csv(all_tweets, key)
 
+            if self.storage is not None:
+                self.storage.append_tweets(all_tweets, key)
+            stage_start = self.record_stage("sink", stage_start)
+
+            if self.metrics is not None:
+                tweet_counts = {}
+                for tw_key in all_tweets["key"]:
+                    tweet_counts[tw_key] = tweet_counts.get(tw_key, 0) + 1
+                if not tweet_counts:
+                    tweet_counts[key] = 0
+                for tw_key, num in tweet_counts.items():
+                    self.metrics.observe_tweets(tw_key, num)
+
             self.updated_time = int(time.time())
             self.crawled_num = crawled_num
             self.crawled_max = crawled_max
@@ -553,6 +1123,7 @@ class TwitterAPI:
             self.crawled_min_t = crawled_min_t
 
             self.updateClientStatus(ret)
+            self.record_stage("status", stage_start)
 
             if self.clientStatus[self.search_type]["remaining_count"] > 0:
                 if verbose:
@@ -582,17 +1153,17 @@ class TwitterAPI:
                 reset_datetime = self.trans_time_obj_str(restart,
                                                          "unix",
                                                          "mysql")
-                expire_msg = ("Account Name %s: api limit expired, wait %s "
-                              "seconds. Start at %s"
+                # ここでは待たない．get_wake_time()で起床時刻がわかるので，
+                # 待つかどうかは呼び出し側(TwitterCrawler.selectClient)が決める
+                expire_msg = ("Account Name %s: api limit expired, parked for "
+                              "%s seconds. Available at %s"
                               % (self.name, wait_sec, reset_datetime))
                 print(expire_msg)
 
-                time.sleep(wait_sec + 2)
             return all_tweets
 
         else:
             print("Client Value Exception !!: ", str(ret.status_code))
-            print("sleep 10 sec")
-            time.sleep(10)
+            self.park_after_error(ret)
 
             return None
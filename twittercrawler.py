@@ -15,14 +15,27 @@ TODO（追加予定）
 
 
 # import datetime
+import os
 import time
+import threading
+import concurrent.futures
 import configparser as cp
 import pandas as pd
 import pickle as pkl
 import csv
-import os
 from requests_oauthlib import OAuth1Session
 
+import budgetbroker
+import coordinator
+import jsondecoder
+import keybatch
+import keyjournal
+import keyscheduler
+import keytable
+import metrics
+import profiling
+import sinks
+import transport
 import twitterapi
 
 
@@ -35,38 +48,210 @@ class TwitterCrawler:
         keys (list): 検索するキーワード/ユーザのlist
         accountFile (str): 検索アカウントのAPIキーを書いたファイルのパス
         search_lang (str): 検索する言語（キーワード検索時のみ）．"ja"など
+        api_base (str): APIのURLの起点
+        results_dir (str): ツイートのcsv・parquet，結果のpickleとプロファイルの出力先
+        request_timeout (float): 1回のリクエストの読み込みのタイムアウト(秒)
         twitterapis (dict): TwitterAPIクラスのインスタンスを格納したdict
-        accounts (list): twitterインスタンス名のlist
-        keystatuses (dict): 検索keyごとの検索状況が入ったdict
+        accounts (list): 起動が完了し検索に使えるtwitterインスタンス名のlist
+        failed_accounts (list): 起動に失敗したため使わないtwitterインスタンス名のlist
+        account_lock (threading.Lock): accountsを起動スレッドから守るロック
+        keystatuses (dict or keytable.KeyStatusTable): 検索keyごとの検索状況
+        compact_keystatus (bool): keystatusesをKeyStatusTableで持つか否か
+        key_batches (dict): ORクエリをkeyとした，まとめたキーワードのlist
+        batch_terms (dict): ORクエリをkeyとした，(キーワード, 照合する語)のlist
+        lookup_users (bool): lapごとにusers/lookupで更新のないユーザを調べ，次に調べるまで検索しないか否か
+        keystatus_lock (threading.RLock): keystatusesを並行更新から守るロック
+        keyscheduler (keyscheduler.KeyScheduler): 次に検索するkeyを選ぶキュー
+        metadata_file (str): 検索状況を記録するファイルのパス
+        journal (keyjournal.KeyStatusJournal): 検索状況の変更を追記するジャーナル
+        unflushed_keys (set): 検索状況を変えたが，取得したツイートがまだsinkに書き出されて
+                              いないためジャーナルに書いていないkey
+        sink (sinks.CsvSink or sinks.ParquetSink): 全アカウントで共有する出力
+        storage (sinks.SqliteSink): 全アカウントで共有するデータベース．使わない場合はNone
+        metrics (metrics.Metrics): 全アカウントで共有する計測値．使わない場合はNone
+        decoder (jsondecoder.JsonDecoder): 全アカウントで共有するレスポンスのデコーダ
+        stage_profiler (profiling.StageProfiler): searchの段階ごとの所要時間．使わない場合はNone
+        lap_profiler (profiling.CProfileLap or profiling.SamplingProfiler): lapごとのプロファイル
+        broker (budgetbroker.BudgetClient): 他のプロセスと残機を分け合うブローカーのクライアント．使わない場合はNone
+        lease_store (coordinator.LeaseStore): 複数プロセスでkeyを分け合う場合のリース置き場．使わない場合はNone
+        shard_keys (set): このプロセスが借りているkey
+        shard_dirty (set): 検索状況を変えたがlease_storeにまだ書き戻していないkey
+        shard_sync_time (float): 最後にlease_storeと同期した時刻
     """
     def __init__(self, search_type, keys=None,
                  account_file="./accounts.cfg",
                  search_lang="ja",
                  metadata_file="./crawl_metadata.pkl",
-                 export_csv=True):
+                 export_csv=True, export_format="csv", storage_file=None,
+                 compact_keystatus=False, batch_threshold=None,
+                 max_query_len=keybatch.MAX_QUERY_LEN, lookup_users=False,
+                 adaptive_update=False, max_staleness=3600,
+                 api_base=twitterapi.API_BASE, metrics_file=None,
+                 metrics_port=None, metrics_interval=60, profile=None,
+                 json_backend=None, request_timeout=30,
+                 coordinator_file=None, lease_sec=120, budget_socket=None,
+                 results_dir="./results/", account_source=None):
         """
         コンストラクタ. twitterアカウントを起動する.
 
         Args:
             search_type (str): "word"(キーワード検索)または"user"(ユーザ検索)
-            keys (list): 検索するキーワード/ユーザのlist
+            keys (list): 検索するキーワード/ユーザのlist．Noneならkeywords.csv/keyusers.csvから読む
             accountFile (str): 検索アカウントのAPIキーを書いたファイルのパス
             search_lang (str): 検索する言語（キーワード検索時のみ）．"ja"など
-            metadata_file (str): 検索状況を記録したファイルがあれば、そのパス
-            export_csv (bool): 結果をcsvに出力するか否か
+            metadata_file (str): 検索状況を記録するファイルのパス．
+                                 変更は出力を書き出すたびに metadata_file + ".journal" に追記される
+            export_csv (bool): 結果をcsv(またはparquet)に出力するか否か
+            export_format (str): "csv"または"parquet"(日付で分割して./results/parquet/へ)
+            storage_file (str): 指定した場合，ツイートをこのSQLiteデータベースにも保存する
+            compact_keystatus (bool): Trueの場合，keystatusesを列ごとの配列で持つ
+                                      (keytable.KeyStatusTable．keyが非常に多い場合向け)
+            batch_threshold (float): 指定した場合，1日あたりのツイート数がこれ未満のキーワードを
+                                     ORでつないだクエリにまとめて検索する（キーワード検索のみ）
+            max_query_len (int): まとめたクエリの長さの上限
+            lookup_users (bool): Trueの場合，lapごとにusers/lookupで新しいツイートのない
+                                 ユーザを調べ，次のlapで調べ直すまでupdateしない（ユーザ検索のみ）
+            adaptive_update (bool): Trueの場合，keyごとのツイートの頻度に合わせてupdateの間隔を変える
+            max_staleness (int): adaptive_updateの場合の，updateの間隔の上限(秒)
+            api_base (str): APIのURLの起点．オフラインで試す場合はmockserver.pyのURLにする
+            metrics_file (str): 指定した場合，計測値をこのJSONと，拡張子を.promにした
+                                Prometheus形式のファイルへmetrics_interval秒ごとに書き出す
+            metrics_port (int): 指定した場合，http://127.0.0.1:<port>/metrics で計測値を返す
+            metrics_interval (float): 計測値を書き出す間隔(秒)
+            profile (str): 指定した場合，lapごとにsearchの段階(http/decode/process/sink/status)
+                           ごとの所要時間を表示する．"cprofile"ならcProfileの結果を，
+                           "sampling"なら全スレッドのサンプリング結果もresults_dirのprofile_lap*に出力する
+                           （並行クロールではcProfileはメインスレッドしか計れないため"sampling"を使う）．
+                           "stages"なら段階ごとの所要時間のみ
+            json_backend (str): レスポンスのデコードに使う"orjson"または"json"．
+                                Noneならorjsonがあればorjson
+            request_timeout (float): 1回のリクエストの読み込みのタイムアウト(秒)
+            coordinator_file (str): 指定した場合，このSQLiteファイルでkeyのリースを借りた分だけ検索する．
+                                    複数のマシン・プロセスで同じファイル(共有のファイルシステム上)と
+                                    同じkeyを指定すると，keyを等分して検索し，止まったプロセスのkeyは
+                                    lease_sec秒後に他のプロセスが引き継ぐ（ORクエリへのまとめは使えない）
+            lease_sec (float): keyのリースの長さ(秒)．lease_sec/3秒ごとに延長・分け直しをする
+            budget_socket (str): 指定した場合，このUnixソケットのbudgetbroker.pyから
+                                 APIを叩く前に1回分ずつ借りる（同じアカウントを使う
+                                 他のプロセスと合わせて回数制限を超えないようにする）
+            results_dir (str): ツイートのcsv・parquet，結果のpickleとプロファイルの出力先
+            account_source (TwitterCrawler): 指定した場合，アカウントを起動し直さず，
+                                             このクローラのアカウント（セッション・残機・サーキット
+                                             ブレーカー）と計測値・デコーダ・ブローカーを共有する．
+                                             search_typeの違うクローラを同じプロセスで動かす場合に使う
+                                             （hybridcrawler.HybridCrawler）
         """
         self.search_type = search_type
-        if keys:
+        if keys is not None:
             self.keys = keys
         else:
             self.keys = self.getSearchKeys()
         self.accountFile = account_file
         self.search_lang = search_lang
-        self.twitterapis, self.accounts = self.makeClientInstance(export_csv)
-        if os.path.exists(metadata_file):
+        self.api_base = api_base
+        self.request_timeout = request_timeout
+        self.results_dir = results_dir
+        os.makedirs(results_dir, exist_ok=True)
+        self.keystatus_lock = threading.RLock()
+        self.account_lock = threading.Lock()
+        self.failed_accounts = []
+        if export_format == "parquet":
+            self.sink = sinks.ParquetSink(os.path.join(results_dir, "parquet"))
+        else:
+            self.sink = sinks.CsvSink()
+        if storage_file is not None:
+            self.storage = sinks.SqliteSink(storage_file)
+        else:
+            self.storage = None
+        if account_source is not None:
+            self.metrics = account_source.metrics
+        elif (metrics_file is not None) or (metrics_port is not None):
+            prom_file = None
+            if metrics_file is not None:
+                prom_file = os.path.splitext(metrics_file)[0] + ".prom"
+            self.metrics = metrics.Metrics(json_file=metrics_file,
+                                           prom_file=prom_file,
+                                           interval=metrics_interval,
+                                           port=metrics_port)
+        else:
+            self.metrics = None
+        if account_source is not None:
+            self.decoder = account_source.decoder
+        else:
+            self.decoder = jsondecoder.JsonDecoder(json_backend)
+        if account_source is not None:
+            self.broker = account_source.broker
+        elif budget_socket is not None:
+            self.broker = budgetbroker.BudgetClient(budget_socket)
+        else:
+            self.broker = None
+        if account_source is not None:
+            self.account_lock = account_source.account_lock
+            self.failed_accounts = account_source.failed_accounts
+            self.twitterapis, self.accounts = \
+                self.shareClientInstance(account_source, export_csv)
+        else:
+            self.twitterapis, self.accounts = \
+                self.makeClientInstance(export_csv)
+        if account_source is not None:
+            # lapごとのプロファイルは共有元のクローラが取る
+            self.stage_profiler = account_source.stage_profiler
+            if self.stage_profiler is not None:
+                for t_api in self.twitterapis.values():
+                    t_api.add_profiler(self.stage_profiler)
+        elif profile is not None:
+            self.stage_profiler = profiling.StageProfiler()
+            for t_api in self.twitterapis.values():
+                t_api.add_profiler(self.stage_profiler)
+        else:
+            self.stage_profiler = None
+        if account_source is not None:
+            self.lap_profiler = None
+        elif profile == "cprofile":
+            self.lap_profiler = profiling.CProfileLap(results_dir)
+        elif profile == "sampling":
+            self.lap_profiler = profiling.SamplingProfiler(results_dir)
+        else:
+            self.lap_profiler = None
+        self.compact_keystatus = compact_keystatus
+        self.metadata_file = metadata_file
+        self.journal = keyjournal.KeyStatusJournal(metadata_file)
+        self.unflushed_keys = set()
+        if self.journal.exists():
             self.load_keystatus()
         else:
             self.keystatuses = self.makeKeyStatus()
+        self.key_batches = {}
+        self.batch_terms = {}
+        self.lookup_users = lookup_users and (self.search_type == "user")
+        if (batch_threshold is not None) and (coordinator_file is not None):
+            # まとめ方がプロセスごとに変わるとリースのkeyが揃わないため，まとめない
+            print("batch_threshold is ignored when coordinator_file is set.")
+        elif (batch_threshold is not None) and (self.search_type == "word"):
+            self.batchKeys(batch_threshold, max_query_len)
+        if adaptive_update:
+            # 1ページ(キーワード100件，ユーザ200件)の半分が溜まった頃にupdateする
+            page_size = 100 if self.search_type == "word" else 200
+            target_yield = page_size / 2
+        else:
+            target_yield = None
+        self.shard_keys = set()
+        self.shard_dirty = set()
+        self.shard_sync_time = 0
+        if coordinator_file is not None:
+            # 検索キューには，リースを借りたkeyだけを入れる
+            self.lease_store = coordinator.LeaseStore(coordinator_file,
+                                                      lease_sec=lease_sec)
+            self.lease_store.register(self.keys)
+            scheduled_keys = []
+        else:
+            self.lease_store = None
+            scheduled_keys = self.keys
+        self.keyscheduler = keyscheduler.KeyScheduler(
+            scheduled_keys, self.keystatuses,
+            target_yield=target_yield, max_staleness=max_staleness)
+        if self.lease_store is not None:
+            self.syncShard()
 
     def getSearchKeys(self):
         """
@@ -92,16 +277,23 @@ class TwitterCrawler:
 
         return keys
 
-    def makeClientInstance(self, export_csv=True):
+    def makeClientInstance(self, export_csv=True, init_retries=2,
+                           init_timeout=10):
         """
         accountFileの情報に基づきOAuth認証でツイッターインスタンスを作成する.
 
+        各アカウントのrate_limitの確認は並行して行い，最初の1アカウントが使えるように
+        なった時点で返す．残りのアカウントは起動し次第accountsに追加される.
+        init_retries回試し直しても確認できないアカウントは，failed_accountsに入れて使わない.
+
         Args:
             export_csv (bool): 結果をcsvに出力するか否か
+            init_retries (int): rate_limitの確認に失敗した場合に試し直す回数
+            init_timeout (float): rate_limitの確認のタイムアウト(秒)
 
         Return:
             twitterapis (dict): 検索を行うTwitterAPIクラスのdict
-            accounts (list): アカウント名のlist
+            accounts (list): 起動が完了したアカウント名のlist
         """
         config = cp.ConfigParser()
         config.read(self.accountFile)
@@ -136,21 +328,120 @@ class TwitterCrawler:
             CS = accountDic[account]["consumer_secret"]
             AT = accountDic[account]["access_token"]
             AS = accountDic[account]["access_secret"]
-            twitter = OAuth1Session(CK, CS, AT, AS)
+            twitter = transport.configure_session(OAuth1Session(CK, CS, AT, AS))
+            t_transport = transport.Transport(
+                twitter, timeout=(3.05, self.request_timeout))
             twitterapis[account] = twitterapi.TwitterAPI(account, twitter,
                                                          lang=self.search_lang,
                                                          word=None,
-                                                         write_to_csv=export_csv)
+                                                         saving_dir=self.results_dir,
+                                                         write_to_csv=export_csv,
+                                                         sink=self.sink,
+                                                         storage=self.storage,
+                                                         bootstrap=False,
+                                                         api_base=self.api_base,
+                                                         metrics=self.metrics,
+                                                         decoder=self.decoder,
+                                                         transport=t_transport,
+                                                         broker=self.broker)
+
+        ready_accounts = []
+        if len(accounts) == 0:
+            return twitterapis, ready_accounts
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(16, len(accounts)),
+            thread_name_prefix="bootstrap")
+        pending = set()
+        for account in accounts:
+            pending.add(executor.submit(self.bootstrapClient,
+                                        twitterapis[account], ready_accounts,
+                                        init_retries, init_timeout))
+        # 残りのアカウントは待たずに，バックグラウンドで起動させておく
+        executor.shutdown(wait=False)
+
+        # 最初の1アカウントが使えるようになるまで待つ
+        while pending:
+            _, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            with self.account_lock:
+                if ready_accounts:
+                    break
+
+        return twitterapis, ready_accounts
+
+    def shareClientInstance(self, account_source, export_csv=True):
+        """
+        account_sourceのアカウントを共有するTwitterAPIクラスのインスタンスを作成する.
 
-        return twitterapis, accounts
+        セッション・バックオフ・サーキットブレーカー・clientStatus(残機)は共有し，
+        検索中のkeyや取得状況，出力先はこのクローラのものにする．
+        accountsもaccount_sourceと同じlistのため，後から起動したアカウントも使える.
+
+        Args:
+            account_source (TwitterCrawler): アカウントを起動済みのクローラ
+            export_csv (bool): 結果をcsvに出力するか否か
+
+        Return:
+            twitterapis (dict): 検索を行うTwitterAPIクラスのdict
+            accounts (list): 起動が完了したアカウント名のlist
+        """
+        twitterapis = {}
+        for account, source_api in account_source.twitterapis.items():
+            twitterapis[account] = twitterapi.TwitterAPI(
+                account, source_api.twitter, lang=self.search_lang,
+                search_type=self.search_type, word=None,
+                saving_dir=self.results_dir, write_to_csv=export_csv,
+                sink=self.sink, storage=self.storage, bootstrap=False,
+                api_base=self.api_base, metrics=self.metrics,
+                decoder=self.decoder, transport=source_api.transport,
+                health=source_api.health, broker=self.broker,
+                client_status=source_api.clientStatus)
+        return twitterapis, account_source.accounts
+
+    def bootstrapClient(self, t_api, ready_accounts, init_retries=2,
+                        init_timeout=10):
+        """
+        アカウントのrate_limitを確認し，使えるならready_accountsに追加する.
+
+        Args:
+            t_api : 起動するTwitterAPIインスタンス
+            ready_accounts (list): 起動したアカウント名を追加するlist
+            init_retries (int): rate_limitの確認に失敗した場合に試し直す回数
+            init_timeout (float): rate_limitの確認のタイムアウト(秒)
+
+        Return:
+            ready (bool): 起動できたか否か
+        """
+        try:
+            ready = t_api.updateClientStatus(max_retries=init_retries,
+                                             timeout=init_timeout)
+        except Exception as e:
+            print('=== エラー発生 ===')
+            print('type: ', str(type(e)))
+            print('args: ', str(e.args))
+            ready = False
+
+        with self.account_lock:
+            if ready:
+                ready_accounts.append(t_api.name)
+                print("Account Name %s: ready" % t_api.name)
+            else:
+                self.failed_accounts.append(t_api.name)
+                print("Account Name %s: failed to start, skipped"
+                      % t_api.name)
+        return ready
 
     def makeKeyStatus(self):
         """
         検索keyごとの検索状況が入ったself.keystatusesを作成.
 
         Return:
-            keystatuses (dict): 検索keyごとのツイートの取得状況が入ったdict
+            keystatuses (dict or keytable.KeyStatusTable): 検索keyごとのツイートの取得状況
         """
+        if self.compact_keystatus:
+            return keytable.KeyStatusTable(self.keys)
+
         keystatuses = {}
         for k in self.keys:
             keystatuses[k] = {}
@@ -230,157 +521,439 @@ class TwitterCrawler:
         self.keystatuses[key]["last_updated_time"] = t_api.updated_time
         self.keystatuses[key]["total_crawled_num"] += t_api.crawled_num
 
+        # 更新した状況でkeyを検索キューに戻す
+        self.requeueKey(key)
+
+        # 取得したツイートはまだsinkのバッファにあるため，書き出すまでジャーナルには書かない
+        # （まとめたクエリの状況はupdateBatchMembersでメンバーに書くので追記しない）
+        if key not in self.key_batches:
+            self.unflushed_keys.add(key)
+
         return
 
-    def save_keystatus(self, filename="./crawl_metadata.pkl"):
+    def commitKeyStatus(self):
+        """
+        書き出し済みのツイートの分の検索状況をジャーナルとlease_storeに反映する.
+
+        sinkとstorageを書き出した（または閉じた）直後に，keystatus_lockを取得した状態で呼ぶ.
+        ジャーナルがツイートの出力より先に進むと，落ちた後に再開した際に
+        書き出されなかったツイートのページを飛ばしてしまうため，ここでまとめて追記する.
+        """
+        for k in self.unflushed_keys:
+            self.journal.append(k, self.keystatuses[k])
+        if self.lease_store is not None:
+            self.shard_dirty.update(self.unflushed_keys)
+        self.unflushed_keys = set()
+        if self.journal.needs_compaction():
+            self.journal.compact(self.persistentKeyStatus())
+
+    def flushResults(self):
+        """sinkとstorageを書き出し，書き出した分の検索状況をジャーナルに追記する."""
+        # 書き出している間に他のスレッドが検索状況を進めないよう，ロックを取ったまま書き出す
+        with self.keystatus_lock:
+            self.sink.flush()
+            if self.storage is not None:
+                self.storage.flush()
+            self.commitKeyStatus()
+
+    def persistentKeyStatus(self):
+        """
+        保存するkeystatuses.
+
+        まとめたクエリの行は起動のたびにメンバーの状況から作り直し，まとめ方が変わると
+        使われなくなるため保存しない.
+
+        Return:
+            keystatuses (dict or keytable.KeyStatusTable): まとめたクエリを除いた検索状況
+        """
+        if not self.key_batches:
+            return self.keystatuses
+        keystatuses = {k: status for k, status in self.keystatuses.items()
+                       if k not in self.key_batches}
+        if isinstance(self.keystatuses, keytable.KeyStatusTable):
+            return keytable.KeyStatusTable.from_dict(keystatuses)
+        return keystatuses
+
+    def save_keystatus(self, filename=None):
         """
         self.keystatusesをpickleに保存する.
 
+        metadata_fileに保存する場合は，スナップショットを書き直してジャーナルを空にする.
+
         Args:
-            filename (str): 保存先ファイルのパス.
+            filename (str): 保存先ファイルのパス. Noneならmetadata_file
         """
+        if (filename is None) or (filename == self.metadata_file):
+            self.journal.compact(self.persistentKeyStatus())
+            self.journal.close()
+            return
+
         with open(filename, mode='wb') as f:
-            pkl.dump(self.keystatuses, f)
+            pkl.dump(self.persistentKeyStatus(), f)
 
         return
 
-    def load_keystatus(self, filename="./crawl_metadata.pkl"):
+    def load_keystatus(self, filename=None):
         """
         crawl_metadataを読み込む.
 
+        スナップショットの後に追記されたジャーナルがあれば，それも適用する.
+
         Args:
-            filename (str): 保存先ファイルのパス
+            filename (str): 保存先ファイルのパス. Noneならmetadata_file
         """
-        with open(filename, mode='rb') as f:
-            self.keystatuses = pkl.load(f)
+        if (filename is None) or (filename == self.metadata_file):
+            journal = self.journal
+        else:
+            journal = keyjournal.KeyStatusJournal(filename)
+        self.keystatuses = journal.load(table=self.compact_keystatus)
 
         for k in self.keys:
-            if k not in self.keystatuses.keys():
-                self.keystatuses[k] = {}
-                self.keystatuses[k]["max_tw_id"] = None
-                self.keystatuses[k]["max_tw_time"] = None
-                self.keystatuses[k]["min_tw_id"] = None
-                self.keystatuses[k]["min_tw_time"] = None
-                self.keystatuses[k]["recent_min"] = None
-                self.keystatuses[k]["since_tw_id"] = None
-                self.keystatuses[k]["last_updated_time"] = None
-                self.keystatuses[k]["total_crawled_num"] = 0
-
-    def selectClient(self):
+            if k not in self.keystatuses:
+                self.keystatuses[k] = {"max_tw_id": None,
+                                       "max_tw_time": None,
+                                       "min_tw_id": None,
+                                       "min_tw_time": None,
+                                       "recent_min": None,
+                                       "since_tw_id": None,
+                                       "last_updated_time": None,
+                                       "total_crawled_num": 0}
+
+    def batchKeys(self, batch_threshold, max_query_len=keybatch.MAX_QUERY_LEN):
+        """
+        ツイートの少ないキーワードをORでつないだクエリにまとめ，self.keysを置き換える.
+
+        対象は，pagingを終えて1日あたりのツイート数がbatch_threshold未満のキーワードと，
+        検索してもツイートが見つからなかったキーワード.
+        まとめたクエリの検索状況は，メンバーのうちmax_tw_idが最も古いものから始めるため，
+        どのメンバーについても取りこぼしは生じない（重複は生じうる）.
+
+        Args:
+            batch_threshold (float): 1日あたりのツイート数のしきい値
+            max_query_len (int): まとめたクエリの長さの上限
+        """
+        low_volume = []
+        for k in self.keys:
+            status = self.keystatuses[k]
+            if status["since_tw_id"] is not None:
+                rate = keybatch.tweets_per_day(status)
+                if (rate is not None) and (rate < batch_threshold):
+                    low_volume.append(k)
+            elif (status["last_updated_time"] is not None) and \
+                 (status["max_tw_id"] is None):
+                low_volume.append(k)
+
+        batched = set()
+        for members in keybatch.make_batches(low_volume, max_query_len):
+            query = keybatch.build_query(members)
+            self.key_batches[query] = members
+            self.batch_terms[query] = [(k, keybatch.key_terms(k))
+                                       for k in members]
+            batched.update(members)
+
+            # 取得済みのメンバーのうち，最も古いところから更新する
+            crawled = [self.keystatuses[k] for k in members
+                       if self.keystatuses[k]["max_tw_id"] is not None]
+            status = {"max_tw_id": None, "max_tw_time": None,
+                      "min_tw_id": None, "min_tw_time": None,
+                      "recent_min": None, "since_tw_id": None,
+                      "last_updated_time": None, "total_crawled_num": 0}
+            if crawled:
+                oldest = min(crawled, key=lambda st: st["max_tw_id"])
+                for field in ["max_tw_id", "max_tw_time",
+                              "min_tw_id", "min_tw_time",
+                              "recent_min", "since_tw_id"]:
+                    status[field] = oldest[field]
+                status["last_updated_time"] = min(
+                    st["last_updated_time"] for st in crawled)
+                status["total_crawled_num"] = sum(
+                    st["total_crawled_num"] for st in crawled)
+            self.keystatuses[query] = status
+
+        if batched:
+            self.keys = ([k for k in self.keys if k not in batched] +
+                         list(self.key_batches.keys()))
+            msg = ("Batched %s low-volume keywords into %s queries."
+                   % (len(batched), len(self.key_batches)))
+            print(msg)
+
+    def updateBatchMembers(self, query, all_tweets):
+        """
+        まとめたクエリの検索状況をメンバーのキーワードにも反映する.
+
+        次回起動時にまとめ直しても続きから検索できるよう，paging・updateの状況をコピーし，
+        振り分けられたツイート数をメンバーごとに数える.
+
+        Args:
+            query (str): ORクエリ
+            all_tweets (twitterapi.TweetColumns): 振り分け済みのツイート群
+        """
+        counts = {}
+        for k in all_tweets["key"]:
+            counts[k] = counts.get(k, 0) + 1
+
+        batch_status = self.keystatuses[query]
+        for k in self.key_batches[query]:
+            for field in ["max_tw_id", "max_tw_time", "recent_min",
+                          "since_tw_id", "last_updated_time"]:
+                self.keystatuses[k][field] = batch_status[field]
+            if self.keystatuses[k]["min_tw_id"] is None:
+                self.keystatuses[k]["min_tw_id"] = batch_status["min_tw_id"]
+                self.keystatuses[k]["min_tw_time"] = \
+                    batch_status["min_tw_time"]
+            self.keystatuses[k]["total_crawled_num"] += counts.get(k, 0)
+            self.unflushed_keys.add(k)
+
+    def selectLookupClient(self):
+        """
+        users/lookupの残機があるアカウントを選ぶ．待つことはしない.
+
+        Return:
+            selected_account (str): 使用するアカウント．使えるアカウントがない場合はNone
+        """
+        now_time = int(time.time())
+        with self.account_lock:
+            accounts = list(self.accounts)
+        for account in accounts:
+            if self.twitterapis[account].get_wake_time("lookup") <= now_time:
+                return account
+        return None
+
+    def prefilterUpdates(self, chunk_size=100):
+        """
+        update待ちのユーザをusers/lookupで100人ずつ調べ，新しいツイートのないユーザを後回しにする.
+
+        前回後回しにしたユーザを検索キューに戻してから調べ直す.
+        最新ツイートのidがmax_tw_id以下のユーザは，次にprefilterUpdatesを呼ぶまで
+        検索キューから外す（keystatusesは変えない）.
+        users/lookupの残機がなくなったら，そこで打ち切る（残りのユーザはそのまま検索する）.
+
+        Return:
+            num_quiet (int): 後回しにしたユーザの数
+        """
+        with self.keystatus_lock:
+            self.keyscheduler.release_deferred()
+            candidates = []
+            for k in self.keys:
+                status = self.keystatuses[k]
+                if (k in self.keyscheduler) and \
+                   (status["since_tw_id"] is not None) and \
+                   (status["max_tw_id"] is not None) and \
+                   (status["recent_min"] is not None) and \
+                   (status["recent_min"] <= status["since_tw_id"]):
+                    candidates.append(k)
+
+        num_quiet = 0
+        num_checked = 0
+        for start in range(0, len(candidates), chunk_size):
+            account = self.selectLookupClient()
+            if account is None:
+                break
+            chunk = candidates[start:start + chunk_size]
+            latest = self.twitterapis[account].lookup_users(chunk)
+            if latest is None:
+                continue
+            num_checked += len(chunk)
+
+            with self.keystatus_lock:
+                for k, (latest_id, _) in latest.items():
+                    # 調べている間に検索が始まったkeyや，新しいツイートのあるkeyはそのまま
+                    if k not in self.keyscheduler:
+                        continue
+                    max_tw_id = self.keystatuses[k]["max_tw_id"]
+                    if (latest_id is not None) and (latest_id > max_tw_id):
+                        continue
+                    self.keyscheduler.defer(k)
+                    num_quiet += 1
+
+        msg = ("users/lookup: checked %s users, %s without new tweets.\n"
+               % (num_checked, num_quiet))
+        print(msg)
+        return num_quiet
+
+    def selectClient(self, wait=True):
         """
         clientStatusをもとに検索に使用するアカウントを決定.
 
-        - API残機がある場合は一番残機が多いアカウント
-        - API残機がない場合は一番復活が早いアカウント
+        - 起床時刻を過ぎていてAPI残機があるアカウントのうち，一番残機が多いアカウント
+        - そのようなアカウントがない場合のみ，一番早く起床するアカウントを待つ
+        （サーキットブレーカーで遮断されたアカウントは，試しに叩く時刻まで起床しない）
+
+        Args:
+            wait (bool): Falseの場合，使えるアカウントがなければ待たずにNoneを返す
 
         Return:
             selected_account (str):使用するアカウント
         """
-        remainings = []
-        resettimes = []
+        search_type = self.search_type
+        now_time = time.time()
+        selected_account = None
+        max_remaining = 0
         for account in self.accounts:
-            remaining = self.twitterapis[account] \
-                            .clientStatus[self.search_type]["remaining_count"]
-            reset_time = self.twitterapis[account] \
-                             .clientStatus[self.search_type]["reset_time"]
-            remainings.append(remaining)
-            resettimes.append(reset_time)
-
-        max_remaining = max(remainings)
-        ## どれかしら制限がかかっていなければ、その中で最も残機が多いアカウントを使う
-        if max_remaining > 0:
-            idx = remainings.index(max_remaining)
-            selected_account = self.accounts[idx]
-        ## 全てのアカウントが制限がかかっている場合、１つアカウントが復活するまで待つ
-        else:
-            min_reset_time = min(resettimes)
-            idx = resettimes.index(min_reset_time)
+            t_api = self.twitterapis[account]
+            if t_api.get_wake_time(search_type) > now_time:
+                continue
+            remaining = t_api.clientStatus[search_type]["remaining_count"]
+            # 残機0のままリセット時刻を過ぎたアカウントは残機を取り直す
+            # （取り直せなければ休ませて飛ばす）
+            if remaining <= 0:
+                if not t_api.refresh_if_reset(search_type):
+                    continue
+                remaining = t_api.clientStatus[search_type]["remaining_count"]
+            ## 制限がかかっていないアカウントの中で最も残機が多いアカウントを使う
+            if remaining > max_remaining:
+                max_remaining = remaining
+                selected_account = account
+
+        if (selected_account is not None) or (not wait):
+            return selected_account
+
+        ## 全てのアカウントが休んでいる場合、１つアカウントが起床するまで待つ
+        ## 起床したアカウントの残機を取り直せなかった場合（また休んでいる）は待ち直す
+        while True:
+            wake_times = [self.twitterapis[account]
+                          .get_wake_time(self.search_type)
+                          for account in self.accounts]
+            min_wake_time = min(wake_times)
+            idx = wake_times.index(min_wake_time)
             selected_account = self.accounts[idx]
-            now_time = int(time.time())
-            wait_sec = min_reset_time - now_time
+            wait_sec = min_wake_time - time.time()
             if wait_sec < 0:
                 wait_sec = 0
             restart_t = self.twitterapis[selected_account] \
-                            .trans_time_obj_str(int(min_reset_time + 2),
+                            .trans_time_obj_str(int(min_wake_time),
                                                 "unix",
                                                 "mysql")
-            msg = ("All account api limit expired."
-                   " Wait for %s second. "
+            msg = ("All accounts are parked."
+                   " Wait for %.1f second. "
                    "Start at %s" % (wait_sec, restart_t))
             print(msg)
+            for account in self.accounts:
+                account_state = self.twitterapis[account].health.describe()
+                if account_state:
+                    print("Account Name %s: %s" % (account, account_state))
 
-            time.sleep(wait_sec + 2)
-
-            self.twitterapis[selected_account].updateClientStatus()
+            time.sleep(wait_sec)
+            if self.metrics is not None:
+                self.metrics.observe_sleep(selected_account, wait_sec)
 
-        return selected_account
+            if self.twitterapis[selected_account] \
+                   .refresh_if_reset(self.search_type):
+                return selected_account
 
     def selectKey(self):
         """
         keyStatusを元に検索するkeyとmodeを選択.
 
+        - "update"モード移行前のkeyがあれば，keysの順で先のもの("new"/"paging")
+        - paging中のkeyがあれば，recent_minとsince_tw_idの差が最も大きいもの("paging")
+        - それ以外は，最後に検索した時刻が最も古いもの("update")
+
+        選んだkeyはupdateKeyStatusで状況を更新するまで再び選ばれない
+        （並行クロールで同じkeyを同時に検索しないため）.
+
         Result:
-            selected_key: 選択した検索key
+            selected_key: 選択した検索key. 選択できるkeyがない場合はNone
             mode (str): 検索モード"new"/"paging"/"update"のいずれか
         """
-        recent_mins = []
-        since_tw_ids = []
-        diff_tw_ids = []
-        last_updated_times = []
-        none_idx = None
-
-        for i, k in enumerate(self.keys):
-            recent_min = self.keystatuses[k]["recent_min"]
-            since_tw_id = self.keystatuses[k]["since_tw_id"]
-            last_update_time = self.keystatuses[k]["last_updated_time"]
-
-            recent_mins.append(recent_min)
-            since_tw_ids.append(since_tw_id)
-            last_updated_times.append(last_update_time)
-
-            # "update"モード移行前のクロール(Case1 ~ Case3)が済んでいないkeyを優先的に検索
-            if (recent_min is None) or (since_tw_id is None) or \
-                                       (last_update_time is None):
-                if none_idx is None:
-                    none_idx = i
-                diff_tw_id = None
-            # 全てのkeyがupdateモードに移行している場合はsince_idと最後のクロールの最小idの差を計算
-            else:
-                diff_tw_id = recent_min - since_tw_id
-                # diff_tw_idはpagingが完了していない間は正の値を，完了したら０もしくは負になる
-                # ０になるのは、updateしてもツイートが取得できなかった時
+        return self.keyscheduler.pop()
 
-            diff_tw_ids.append(diff_tw_id)
+    def requeueKey(self, key):
+        """
+        検索し終えたkeyを検索キューに戻す.
 
-        # "update"モード移行前のクロール
-        if (None in recent_mins) or (None in since_tw_ids) or \
-                                    (None in last_updated_times):
-            selected_key = self.keys[none_idx]
+        複数プロセスで分け合っている場合，検索中にリースを失ったkeyは戻さない.
 
-            # Case1. 初回のクロール
-            if recent_mins[none_idx] is None:
-                mode = "new"
-            # Case2. 2回目以降のクロール
-            else:
-                mode = "paging"
+        Args:
+            key (str or int): 検索key
+        """
+        if (self.lease_store is None) or (key in self.shard_keys):
+            self.keyscheduler.push(key)
 
-        # "update"モード移行後のクロール
-        else:
-            max_diff = max(diff_tw_ids)
-
-            # Case3. paging中のkeyがある場合
-            if max_diff > 0:
-                idx = diff_tw_ids.index(max_diff)
-                selected_key = self.keys[idx]
-                mode = "paging"
-            # Case4. paging中のkeyがない場合
-            else:
-                min_last_updated_time = min(last_updated_times)
-                idx = last_updated_times.index(min_last_updated_time)
-                selected_key = self.keys[idx]
-                mode = "update"
+    def syncShard(self):
+        """
+        lease_storeと検索状況を同期し，keyを分け直す.
+
+        1. 変更した検索状況を書き戻す
+        2. リースを延長し，他のプロセスに取られたkeyを検索キューから外す
+        3. 生きているプロセスで等分した数になるまで，空いているkeyを借りる
+           （他のプロセスが書き戻した検索状況を引き継ぐので，続きから検索する）
+        4. 等分した数より多く借りていれば，検索中でないkeyを返す
+        """
+        with self.keystatus_lock:
+            dirty = [(k, dict(self.keystatuses[k]))
+                     for k in self.shard_dirty]
+            self.shard_dirty = set()
+        self.lease_store.sync(dirty)
+
+        owned = self.lease_store.heartbeat()
+        share = self.lease_store.fair_share()
+        claimed = self.lease_store.claim(share - len(owned))
+
+        with self.keystatus_lock:
+            lost = self.shard_keys - owned
+            for k in lost:
+                if (k in self.keyscheduler) or \
+                   (k in self.keyscheduler.deferred):
+                    self.keyscheduler.remove(k)
+            self.shard_keys = owned
+
+            for k, status in claimed:
+                if status is not None:
+                    self.keystatuses[k] = status
+                    self.journal.append(k, self.keystatuses[k])
+                elif k not in self.keystatuses:
+                    # 他のプロセスだけが知っているkey
+                    self.keystatuses[k] = {"max_tw_id": None,
+                                           "max_tw_time": None,
+                                           "min_tw_id": None,
+                                           "min_tw_time": None,
+                                           "recent_min": None,
+                                           "since_tw_id": None,
+                                           "last_updated_time": None,
+                                           "total_crawled_num": 0}
+                self.shard_keys.add(k)
+                self.keyscheduler.add(k)
+
+            excess = len(self.shard_keys) - share
+            released = []
+            if excess > 0:
+                for k in list(self.shard_keys):
+                    if len(released) >= excess:
+                        break
+                    if k in self.keyscheduler:
+                        self.keyscheduler.remove(k)
+                        self.shard_keys.discard(k)
+                        released.append(k)
+            num_keys = len(self.shard_keys)
+        self.lease_store.release(released)
+        self.shard_sync_time = time.time()
+
+        msg = ("shard: %s keys (fair share %s), claimed %s, released %s,"
+               " lost %s." % (num_keys, share, len(claimed), len(released),
+                              len(lost)))
+        print(msg)
 
-        return selected_key, mode
+    def maybeSyncShard(self):
+        """前回の同期からlease_sec/3秒以上経っていればsyncShardする."""
+        if self.lease_store is None:
+            return
+        if time.time() - self.shard_sync_time >= \
+           self.lease_store.lease_sec / 3.0:
+            self.syncShard()
+
+    def closeShard(self):
+        """検索状況を書き戻し，全てのリースを返す．sinkとstorageを閉じた後に呼ぶ."""
+        if self.lease_store is None:
+            return
+        with self.keystatus_lock:
+            self.shard_dirty.update(self.unflushed_keys)
+            dirty = [(k, dict(self.keystatuses[k]))
+                     for k in self.shard_dirty]
+            self.shard_dirty = set()
+            self.shard_keys = set()
+        self.lease_store.sync(dirty)
+        self.lease_store.close()
 
     def set_keyStatus_to_acc(self, t_api, key):
         """
@@ -394,96 +967,313 @@ class TwitterCrawler:
             t_api.word = key
         else:
             t_api.user = key
+        t_api.batch_members = self.batch_terms.get(key)
         t_api.max_tw_id = self.keystatuses[key]["max_tw_id"]
         t_api.recent_min = self.keystatuses[key]["recent_min"]
         t_api.since_tw_id = self.keystatuses[key]["since_tw_id"]
 
-    def crawl_once(self):
+    def crawl_once(self, account=None):
         """
         与えられた条件下で一回クロールする.
 
+        Args:
+            account (str): 使用するアカウント．NoneならselectClientで選ぶ
+
         Return:
             crawled_df : 取得したツイートのデータフレーム
         """
-        account = self.selectClient()  # クロールするアカウントの選択
-        twitter_account = self.twitterapis[account]
-
+        if account is None:
+            account = self.selectClient()  # クロールするアカウントの選択
         selected_key, mode = self.selectKey()  # クロールするkeyの選択
 
+        # リースを借りたkeyがない（他のプロセスが全て借りている）
+        if selected_key is None:
+            time.sleep(1)
+            return pd.DataFrame()
+
+        return self.crawl_key(account, selected_key, mode)
+
+    def crawl_key(self, account, selected_key, mode):
+        """
+        指定したアカウントで指定したkeyを一回クロールする.
+
+        keystatusesの読み書きはkeystatus_lockの中で行うため，複数スレッドから呼んでよい.
+        ただし1つのアカウントを同時に複数スレッドで使ってはならない.
+
+        Args:
+            account (str): 使用するアカウント
+            selected_key (str or int): 検索key
+            mode (str): 検索モード"new"/"paging"/"update"のいずれか
+
+        Return:
+            crawled_df : 取得したツイートのデータフレーム
+        """
+        twitter_account = self.twitterapis[account]
+
         # TwitterAPIインスタンスにkeyやwordStatusをセット
-        self.set_keyStatus_to_acc(twitter_account, selected_key)
+        with self.keystatus_lock:
+            self.set_keyStatus_to_acc(twitter_account, selected_key)
 
         msg = ("search key: '%s', twitter account: '%s', mode: %s"
                % (selected_key, account, mode))
+        account_state = twitter_account.health.describe()
+        if account_state:
+            msg += ", account state: %s" % account_state
         print(msg)
 
         # 検索する
         if self.search_type == "word":
             twitter_account.search_type = "word"
-            crawled_df = pd.DataFrame(twitter_account.search(mode,
-                                                             verbose=False))
         else:
             twitter_account.search_type = "user"
-            crawled_df = pd.DataFrame(twitter_account.search(mode,
-                                                             verbose=False))
+        all_tweets = twitter_account.search(mode, verbose=False)
 
-        self.updateKeyStatus(twitter_account, selected_key)
+        # 検索に失敗した場合(アカウントは休止中)，t_apiの取得状況は前回の検索のものなので
+        # keystatusesは更新せず，次の機会に同じkeyを検索し直す
+        if all_tweets is None:
+            with self.keystatus_lock:
+                self.requeueKey(selected_key)
+            return pd.DataFrame()
+
+        crawled_df = pd.DataFrame(all_tweets.columns)
+
+        with self.keystatus_lock:
+            self.updateKeyStatus(twitter_account, selected_key)
+            if selected_key in self.key_batches:
+                self.updateBatchMembers(selected_key, all_tweets)
+            total_crawled_num = (self.keystatuses[selected_key]
+                                                 ["total_crawled_num"])
 
         crawled_time_msg = ("Crawled %s ~ %s, %s tweets." %
                             (twitter_account.crawled_min_t,
                              twitter_account.crawled_max_t,
                              twitter_account.crawled_num))
         print(crawled_time_msg)
-        crawled_num_msg = ("Total crawled num: %s\n" %
-                           self.keystatuses[selected_key]["total_crawled_num"])
+        crawled_num_msg = ("Total crawled num: %s\n" % total_crawled_num)
         print(crawled_num_msg)
 
         return crawled_df
 
-    def run(self, ask_runtime=True, export_lap=900, full_runtime=10800):
-        """アカウントを切り替えつつクロールし続ける."""
+    def crawl_worker(self, account, stop_event, result_buffer, error_wait=10):
+        """
+        1つのアカウントを専有し，stop_eventがセットされるまでクロールし続ける（並行クロール用）.
+
+        他のアカウントが検索中のkeyはselectKeyで選ばれないため，同じkeyを同時に検索することはない.
+        検索中に例外が起きた場合は，keyを検索キューに戻し，アカウントをerror_wait秒休ませて続ける.
+
+        Args:
+            account (str): 使用するアカウント
+            stop_event (threading.Event): 終了指示
+            result_buffer (sinks.ResultBuffer): 取得したデータフレームを貯めるバッファ
+            error_wait (float): 例外が起きた場合にアカウントを休ませる秒数
+        """
+        t_api = self.twitterapis[account]
+        while not stop_event.is_set():
+            # アカウントが休んでいる間はこのスレッドだけが待つ
+            wait_start = time.time()
+            wait_sec = t_api.get_wake_time(self.search_type) - wait_start
+            if wait_sec > 0:
+                stop_event.wait(wait_sec)
+                if self.metrics is not None:
+                    self.metrics.observe_sleep(
+                        account, min(wait_sec, time.time() - wait_start))
+                continue
+            # 残機を取り直せなかった場合は，休ませた起床時刻まで待ち直す
+            if not t_api.refresh_if_reset(self.search_type):
+                continue
+
+            with self.keystatus_lock:
+                selected_key, mode = self.selectKey()
+
+            # 全てのkeyを他のアカウントが検索中
+            if selected_key is None:
+                stop_event.wait(1)
+                continue
+
+            try:
+                crawled_df = self.crawl_key(account, selected_key, mode)
+                result_buffer.append(crawled_df)
+            except Exception as e:
+                print('=== エラー発生 ===')
+                print("Account Name %s: search key '%s' failed, parked for "
+                      "%s seconds" % (account, selected_key, error_wait))
+                print('type: ', str(type(e)))
+                print('args: ', str(e.args))
+                # 検索キューから外れたままにならないよう戻す
+                with self.keystatus_lock:
+                    self.requeueKey(selected_key)
+                t_api.park(time.time() + error_wait, self.search_type)
+
+    def export_result(self, result_df, file_num):
+        """
+        クロール結果をpickleに出力する.
+
+        Args:
+            result_df : 取得したツイートのデータフレーム
+            file_num (int): 出力ファイルの通し番号
+        """
+        self.flushResults()
+        pickle_path = os.path.join(self.results_dir,
+                                   "result_crawlNo%s.pkl" % file_num)
+        with open(pickle_path, "wb") as f:
+            pkl.dump(result_df, f)
+        msg = ("\n######saved result to %s######\n" % pickle_path)
+        print(msg)
+
+    def report_profile(self, lap_num):
+        """
+        このlapのsearchの段階ごとの所要時間を表示し，プロファイルを出力する.
+
+        Args:
+            lap_num (int): lapの番号
+        """
+        if self.stage_profiler is not None:
+            print("######search stages of lap %s######" % lap_num)
+            print(self.stage_profiler.report(self.stage_profiler.reset()))
+        if self.lap_profiler is not None:
+            path = self.lap_profiler.dump(lap_num)
+            print("######saved profile to %s######" % path)
+
+    def run(self, ask_runtime=True, export_lap=900, full_runtime=10800,
+            concurrent=False):
+        """
+        アカウントを切り替えつつクロールし続ける.
+
+        Args:
+            ask_runtime (bool): 実行時間を標準入力から受け取るか否か
+            export_lap (int): 結果をpickleに出力する間隔（秒）
+            full_runtime (int): 実行時間（秒）
+            concurrent (bool): Trueの場合，全アカウントで同時にクロールする
+        """
         if ask_runtime:
             full_runtime = int(input("Enter Runtime (minutes): ")) * 60
+
+        if len(self.accounts) == 0:
+            print("No available accounts.")
+            return
+
+        if self.metrics is not None:
+            self.metrics.start()
+        if self.lap_profiler is not None:
+            self.lap_profiler.start()
+
+        if concurrent:
+            self.run_concurrent(export_lap, full_runtime)
+            return
+
         i = 0
         start_time = int(time.time())
         lap_start = int(time.time())
         file_num = 0
-        first_flag = True
+        result_buffer = sinks.ResultBuffer()
+        if self.lookup_users:
+            self.prefilterUpdates()
 
         while(True):
 
             i += 1
             print("####CRAWL NO: %s ####" % i)
 
-            if first_flag:
-                result_df = self.crawl_once()
-                first_flag = False
-            else:
-                result_df = pd.concat([result_df, self.crawl_once()])
+            self.maybeSyncShard()
+            result_buffer.append(self.crawl_once())
 
             laptime = int(time.time()) - lap_start
             runtime = int(time.time()) - start_time
 
-            if laptime > export_lap:
+            if (laptime > export_lap) or (runtime > full_runtime):
                 file_num += 1
-                pickle_path = "./results/result_crawlNo%s.pkl" % file_num
-                with open(pickle_path, "wb") as f:
-                    pkl.dump(result_df, f)
-                first_flag = True
-                msg = ("\n######saved result to ./results/result_crawlNo%s.pkl"
-                       "######\n" % file_num)
-                print(msg)
+                self.export_result(result_buffer.drain(), file_num)
+                self.report_profile(file_num)
                 lap_start = int(time.time())
+                if self.lookup_users and (runtime <= full_runtime):
+                    self.prefilterUpdates()
 
             if runtime > full_runtime:
-                file_num += 1
-                pickle_path = "./results/result_crawlNo%s.pkl" % file_num
-                with open(pickle_path, "wb") as f:
-                    pkl.dump(result_df, f)
-                msg = ("\n######saved result to ./results/result_crawlNo%s.pkl"
-                       "######\n" % file_num)
-                print(msg)
                 print("Finish Process.")
                 break
+        self.sink.close()
+        if self.storage is not None:
+            self.storage.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.lap_profiler is not None:
+            self.lap_profiler.stop()
+        if self.broker is not None:
+            self.broker.close()
+        self.closeShard()
         print(self.keystatuses)
         self.save_keystatus()
+
+    def run_concurrent(self, export_lap=900, full_runtime=10800):
+        """
+        アカウントごとにスレッドを立て，全アカウントで同時にクロールし続ける.
+
+        Args:
+            export_lap (int): 結果をpickleに出力する間隔（秒）
+            full_runtime (int): 実行時間（秒）
+        """
+        start_time = int(time.time())
+        lap_start = int(time.time())
+        file_num = 0
+        result_buffer = sinks.ResultBuffer()
+        stop_event = threading.Event()
+        if self.lookup_users:
+            self.prefilterUpdates()
+
+        workers = {}
+
+        while(True):
+
+            # 後から起動したアカウントと，止まってしまったスレッドのアカウントにもスレッドを立てる
+            with self.account_lock:
+                new_accounts = [account for account in self.accounts
+                                if (account not in workers) or
+                                (not workers[account].is_alive())]
+            for account in new_accounts:
+                if account in workers:
+                    print("Account Name %s: worker stopped, restarted"
+                          % account)
+                worker = threading.Thread(target=self.crawl_worker,
+                                          args=(account, stop_event,
+                                                result_buffer),
+                                          name="crawler-%s" % account,
+                                          daemon=True)
+                worker.start()
+                workers[account] = worker
+
+            stop_event.wait(1)
+            self.maybeSyncShard()
+
+            laptime = int(time.time()) - lap_start
+            runtime = int(time.time()) - start_time
+
+            if runtime > full_runtime:
+                stop_event.set()
+                for worker in workers.values():
+                    worker.join(timeout=30)
+
+            if (laptime > export_lap) or (runtime > full_runtime):
+                file_num += 1
+                self.export_result(result_buffer.drain(), file_num)
+                self.report_profile(file_num)
+                lap_start = int(time.time())
+                if self.lookup_users and (runtime <= full_runtime):
+                    self.prefilterUpdates()
+
+            if runtime > full_runtime:
+                print("Finish Process.")
+                break
+
+        self.sink.close()
+        if self.storage is not None:
+            self.storage.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.lap_profiler is not None:
+            self.lap_profiler.stop()
+        if self.broker is not None:
+            self.broker.close()
+        self.closeShard()
+        with self.keystatus_lock:
+            print(self.keystatuses)
+            self.save_keystatus()